@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from Benchmarks.common import asgi_request, auth_headers, percentile, print_report
+from Middleware import admission
+from Routers import orders
+from main import app
+
+
+# Sequential requests per second the app sustains for the workload, which is
+# the capacity the offered load below is scaled against
+async def measure_capacity(headers, seconds: float = 2.0) -> float:
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        await asgi_request(app, "GET", f"/orders/{done % 100 + 1}", headers)
+        done += 1
+    return done / (time.perf_counter() - started)
+
+
+# Open loop: requests arrive at `rate` per second whatever the app is doing,
+# and each latency is measured from the moment the request was due
+async def offered_load(headers, rate: float, seconds: float, slo: float):
+    loop = asyncio.get_running_loop()
+    results = []
+
+    async def one(index: int, due: float):
+        status, _, _ = await asgi_request(app, "GET", f"/orders/{index % 100 + 1}", headers)
+        results.append((status, loop.time() - due))
+
+    tasks = []
+    started = loop.time()
+    total = int(rate * seconds)
+    for index in range(total):
+        due = started + index / rate
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(index, due)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+
+    admitted = [latency for status, latency in results if status == 200]
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "offered_rps": round(rate, 1),
+        "goodput_rps": round(sum(1 for latency in admitted if latency <= slo) / seconds, 1),
+        "completed_in": round(elapsed, 2),
+        "statuses": statuses,
+        "admitted_p50_ms": round(percentile(admitted, 50) * 1000, 1),
+        "admitted_p99_ms": round(percentile(admitted, 99) * 1000, 1),
+    }
+
+
+async def run(multipliers, seconds: float, slo: float):
+    await orders.orders.create_many([{"customer_id": i, "product_id": i, "quantity": 1} for i in range(1, 101)])
+    headers = auth_headers()
+    await measure_capacity(headers, 0.5)
+    capacity = await measure_capacity(headers)
+    report = {"capacity_rps": round(capacity, 1), "slo_ms": slo * 1000,
+              "loop_lag_shed_ms": admission.LOOP_LAG_SHED_MS, "runs": {}}
+    admission.rate_limiter.rate = 0
+    for enabled in (False, True):
+        admission.ADMISSION_ENABLED = enabled
+        label = "admission_on" if enabled else "admission_off"
+        report["runs"][label] = []
+        for multiplier in multipliers:
+            # Let the previous run's backlog and lag estimate drain first
+            await asyncio.sleep(0.5)
+            result = await offered_load(headers, capacity * multiplier, seconds, slo)
+            result["load_factor"] = multiplier
+            report["runs"][label].append(result)
+    admission.loop_monitor.stop()
+
+    # A single user past their token bucket gets 429s while other users are unaffected
+    admission.rate_limiter.rate = 50
+    admission.rate_limiter.burst = 50
+    admission.rate_limiter.clear()
+    noisy, quiet = auth_headers("regular_user", "customer"), auth_headers("admin_user", "admin")
+    statuses = {"noisy_user": {}, "quiet_user": {}}
+    for index in range(400):
+        who, user_headers = ("quiet_user", quiet) if index % 10 == 0 else ("noisy_user", noisy)
+        status, _, _ = await asgi_request(app, "GET", "/orders/1", user_headers)
+        statuses[who][str(status)] = statuses[who].get(str(status), 0) + 1
+    report["user_rate_limit"] = {"rate": 50, "burst": 50, "statuses": statuses}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Goodput and admitted latency as offered load goes past capacity")
+    parser.add_argument("--load-factors", default="0.5,1,2,4", help="offered load as multiples of capacity")
+    parser.add_argument("--seconds", type=float, default=3.0, help="length of each run")
+    parser.add_argument("--slo-ms", type=float, default=250.0, help="latency a response must meet to count as goodput")
+    parser.add_argument("--lag-ms", type=float, default=admission.LOOP_LAG_SHED_MS or 50, help="loop lag that triggers shedding")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    admission.LOOP_LAG_SHED_MS = args.lag_ms
+    multipliers = [float(value) for value in args.load_factors.split(",")]
+    print_report(asyncio.run(run(multipliers, args.seconds, args.slo_ms / 1000)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import random
+import time
+
+from Benchmarks.common import print_report
+from Services import analytics
+from Services.analytics import OrderAggregates, revenue, scan, top_n
+from Storage.registry import create_repository
+
+CHUNK = 100_000
+
+
+def timed(seconds: float, calls: int = 1):
+    return {"ms": round(seconds / calls * 1000, 4)}
+
+
+# Best-sellers the way a client had to compute them before the analytics
+# endpoints: page through every order and add them up
+async def paged_totals(orders, page_size: int):
+    totals = {}
+    after_id = None
+    while True:
+        page = await orders.list_page(page_size, after_id=after_id)
+        for _, order in page:
+            entry = totals.setdefault(order["product_id"], [0, 0])
+            entry[0] += order["quantity"]
+            entry[1] += 1
+        if len(page) < page_size:
+            return totals
+        after_id = page[-1][0]
+
+
+async def measure(backend: str, count: int, products: int, customers: int, reads: int):
+    orders = create_repository("orders", backend)
+    rng = random.Random(7)
+    for first in range(0, count, CHUNK):
+        await orders.create_many([
+            {"customer_id": rng.randint(1, customers), "product_id": rng.randint(1, products),
+             "quantity": rng.randint(1, 5)}
+            for _ in range(min(CHUNK, count - first))
+        ])
+    prices = {product_id: 1 + product_id * 0.25 for product_id in range(1, products + 1)}
+
+    started = time.perf_counter()
+    by_product, _ = await scan(orders)
+    numpy_scan = time.perf_counter() - started
+
+    saved_np, analytics.np = analytics.np, None
+    started = time.perf_counter()
+    python_product, _ = await scan(orders)
+    python_scan = time.perf_counter() - started
+    analytics.np = saved_np
+    assert python_product == by_product
+
+    started = time.perf_counter()
+    client_product = await paged_totals(orders, 100)
+    client_scan = time.perf_counter() - started
+    assert client_product == by_product
+
+    aggregates = OrderAggregates()
+    started = time.perf_counter()
+    await aggregates.rebuild(orders)
+    rebuild = time.perf_counter() - started
+
+    # Live reads: one product's totals, and the top 10 by revenue
+    ids = [rng.randint(1, products) for _ in range(reads)]
+    started = time.perf_counter()
+    for product_id in ids:
+        aggregates.by_product.get(product_id)
+    lookup = time.perf_counter() - started
+    started = time.perf_counter()
+    top = top_n(revenue(aggregates.by_product, prices), 10)
+    top_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    assert top_n(revenue(by_product, prices), 10) == top
+    top_scan = time.perf_counter() - started + numpy_scan
+
+    # Cost the write path pays to keep the aggregates current
+    new_orders = [{"customer_id": rng.randint(1, customers), "product_id": rng.randint(1, products),
+                   "quantity": rng.randint(1, 5)} for _ in range(reads)]
+    started = time.perf_counter()
+    for order in new_orders:
+        aggregates.order_added(order)
+    for order in new_orders:
+        aggregates.order_removed(order)
+    maintenance = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "orders": count,
+        "totals_by_product": {
+            "client_side_paging": timed(client_scan),
+            "python_scan": timed(python_scan),
+            "numpy_scan": timed(numpy_scan),
+            "incremental_lookup": timed(lookup, reads),
+        },
+        "top_10_by_revenue": {
+            "numpy_scan": timed(top_scan),
+            "incremental": timed(top_seconds),
+        },
+        "rebuild": timed(rebuild),
+        "write_overhead_us": round(maintenance / (2 * reads) * 1e6, 3),
+    }
+
+
+async def run(count: int, backends, products: int, customers: int, reads: int):
+    results = []
+    for backend in backends:
+        results.append(await measure(backend, count, products, customers, reads))
+    return {"numpy": analytics.np is not None, "products": products, "customers": customers, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order analytics: full scans vs incrementally maintained aggregates")
+    parser.add_argument("--orders", type=int, default=3_000_000)
+    parser.add_argument("--backends", default="memory,compact")
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--reads", type=int, default=100_000)
+    args = parser.parse_args()
+    print_report(asyncio.run(run(args.orders, args.backends.split(","), args.products, args.customers, args.reads)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+
+from Benchmarks.common import auth_headers, print_report
+from Middleware import authentication
+from main import app
+
+
+# Cost of the auth dependency alone, per call
+async def dependency_cost(token: str, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await authentication.get_current_user(token)
+    return (time.perf_counter() - started) / calls
+
+
+# Cost of a whole authenticated request through main:app
+async def request_cost(headers, calls: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        started = time.perf_counter()
+        for _ in range(calls):
+            response = await client.get("/admin-only")
+            assert response.status_code == 200, response.text
+        return (time.perf_counter() - started) / calls
+
+
+async def run(calls: int):
+    headers = auth_headers("admin_user", "admin")
+    token = headers["Authorization"].split(" ", 1)[1]
+    report = {}
+    for label, size in (("cache_off", 0), ("cache_on", authentication.AUTH_TOKEN_CACHE_SIZE or 10000)):
+        authentication.token_cache.clear()
+        authentication.token_cache.max_entries = size
+        report[label] = {
+            "dependency_us": round(await dependency_cost(token, calls) * 1e6, 2),
+            "request_us": round(await request_cost(headers, calls) * 1e6, 2),
+        }
+    report["dependency_speedup"] = round(report["cache_off"]["dependency_us"] / report["cache_on"]["dependency_us"], 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request auth overhead with the token cache on and off")
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    print_report(asyncio.run(run(args.calls)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+
+from Middleware import admission, upstream
+from Services.multiget import MultiGetRequest
+
+# Benchmarks measure what the app itself costs, so admission control is off:
+# closed-loop in-process clients keep the event loop busy by design (which
+# lag-based shedding, when turned on, would answer with 503s), and one or two
+# users sending thousands of requests a second would mostly get 429s.
+# Benchmarks.admission and `Benchmarks.suite --admission` turn it back on.
+admission.ADMISSION_ENABLED = False
+admission.rate_limiter.rate = 0
+
+
+# Nearest-rank percentile of a list of samples
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+# Latency summary in milliseconds plus throughput for a run
+def summarize(samples: List[float], elapsed: float) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def print_report(report: Dict):
+    print(json.dumps(report, indent=2))
+
+
+# Latency and failure injection for the stubs. Fields can be changed while a
+# stub is serving, e.g. to take a service down mid-run.
+class StubFaults:
+    def __init__(self, delay: float = 0.0, slow_ratio: float = 0.0, slow_delay: float = 0.0,
+                 error_ratio: float = 0.0, seed: Optional[int] = None):
+        self.delay = delay
+        self.slow_ratio = slow_ratio
+        self.slow_delay = slow_delay
+        self.error_ratio = error_ratio
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    async def inject(self):
+        self.requests += 1
+        delay = self.delay
+        if self.slow_ratio and self.random.random() < self.slow_ratio:
+            delay += self.slow_delay
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_ratio and self.random.random() < self.error_ratio:
+            raise HTTPException(status_code=503, detail="Injected failure")
+
+
+# Minimal stand-in for the customer or product service
+def build_stub_app(resource: str, ids: Iterable[int], delay: float = 0.0,
+                   faults: Optional[StubFaults] = None) -> FastAPI:
+    app = FastAPI()
+    known = set(ids)
+    faults = faults or StubFaults(delay)
+
+    @app.get(f"/{resource}/{{resource_id}}")
+    async def get_resource(resource_id: int):
+        await faults.inject()
+        if resource_id not in known:
+            raise HTTPException(status_code=404, detail="Not found")
+        return {"id": resource_id}
+
+    @app.post(f"/{resource}/lookup")
+    async def lookup_resources(request: MultiGetRequest):
+        await faults.inject()
+        id_field = f"{resource[:-1]}_id"
+        return {
+            "items": [{id_field: resource_id} for resource_id in request.ids if resource_id in known],
+            "missing": [resource_id for resource_id in request.ids if resource_id not in known],
+        }
+
+    return app
+
+
+# Run an ASGI app with uvicorn on a background thread
+class StubServer:
+    def __init__(self, app: FastAPI, port: int):
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+# Start the customer (3005) and product (3004) stubs used by the order
+# benchmarks. They stand in for separately deployed services, so order
+# validation is switched to distributed mode (HTTP) while they run.
+def start_upstream_stubs(ids: Iterable[int], delay: float = 0.0,
+                         faults: Optional[Dict[str, StubFaults]] = None) -> List[StubServer]:
+    upstream.DEPLOYMENT_MODE = "distributed"
+    ids = list(ids)
+    faults = faults or {}
+    return [
+        StubServer(build_stub_app("customers", ids, delay, faults.get("customers")), 3005).start(),
+        StubServer(build_stub_app("products", ids, delay, faults.get("products")), 3004).start(),
+    ]
+
+
+def stop_servers(servers: List[StubServer]):
+    for server in servers:
+        server.stop()
+
+
+# Bearer headers for benchmark clients, signed like tokens issued by /token
+def auth_headers(username: str = "regular_user", role: str = "user") -> Dict[str, str]:
+    from Middleware.authentication import create_access_token
+    token = create_access_token(data={"sub": username, "role": role})
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Call an ASGI app directly, without an HTTP client, so timings contain only
+# server-side work. Returns the status, the response headers and the body.
+# `body` may be an iterable of chunks, sent as a streamed request body. With
+# `on_body`, response chunks go to the callback instead of being collected.
+async def asgi_request(app, method: str, path: str, headers: Optional[Dict[str, str]] = None,
+                       body: Union[bytes, Iterable[bytes]] = b"",
+                       on_body: Optional[Callable[[bytes], None]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+    }
+    response = {"body": []}
+    chunks = iter([body] if isinstance(body, bytes) else body)
+    pending = next(chunks, b"")
+
+    async def receive():
+        nonlocal pending
+        if pending is None:
+            # Body sent: like an open connection, wait for a disconnect that never comes
+            await asyncio.Event().wait()
+        chunk, pending = pending, next(chunks, None)
+        return {"type": "http.request", "body": chunk, "more_body": pending is not None}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {key.decode(): value.decode() for key, value in message["headers"]}
+        elif message["type"] == "http.response.body":
+            if on_body is not None:
+                on_body(message.get("body", b""))
+            else:
+                response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], b"".join(response["body"])
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import FastAPI
+
+from Benchmarks.common import StubServer, asgi_request, auth_headers, print_report, stop_servers, summarize
+from Middleware import upstream
+from Middleware.validation_cache import validation_cache
+from Services import read_model as read_model_module
+from Services.read_model import read_model
+from Routers import customers, products
+from main import app
+
+
+# The product (3004) and customer (3005) services as a distributed deployment
+# runs them, on loopback. They share this process's stores with main:app.
+def start_services():
+    servers = []
+    for router, port in ((products.router, 3004), (customers.router, 3005)):
+        service = FastAPI()
+        service.include_router(router)
+        servers.append(StubServer(service, port).start())
+    return servers
+
+
+async def measure(requests: int, concurrency: int, ids: int, headers):
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        body = json.dumps({"customer_id": i % ids + 1, "product_id": (i * 7) % ids + 1, "quantity": 1}).encode()
+        async with semaphore:
+            started = time.perf_counter()
+            status, _, _ = await asgi_request(app, "POST", "/orders",
+                                              {**headers, "content-type": "application/json"}, body)
+            samples.append(time.perf_counter() - started)
+            assert status == 201, status
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+# Order creation in each mode: read model off so validation goes through the
+# service clients; cache_size=0 makes every distributed validation a round trip
+async def run_mode(mode: str, requests: int, concurrency: int, ids: int, headers, cache_size: int):
+    upstream.DEPLOYMENT_MODE = mode
+    validation_cache.max_entries = cache_size
+    validation_cache.clear()
+    await upstream.start_clients()
+    try:
+        # Warm up over every ID, so the cached run measures cache hits
+        await measure(ids, concurrency, ids, headers)
+        return await measure(requests, concurrency, ids, headers)
+    finally:
+        await upstream.close_clients()
+
+
+async def run(requests: int, concurrency: int, ids: int):
+    await products.products.create_many([
+        {"name": f"Product {i}", "price": 1 + i * 0.25, "description": "x"} for i in range(ids)
+    ])
+    await customers.customers.create_many([
+        {"name": f"Customer {i}", "email": f"customer{i}@example.com"} for i in range(ids)
+    ])
+    headers = auth_headers(role="customer")
+    cache_size = validation_cache.max_entries
+    servers = start_services()
+    try:
+        read_model_module.READ_MODEL_ENABLED = False
+        report = {
+            "concurrency": concurrency,
+            "combined_store_lookup": await run_mode("combined", requests, concurrency, ids, headers, cache_size),
+            "distributed_loopback_uncached": await run_mode("distributed", requests, concurrency, ids, headers, 0),
+            "distributed_loopback_cached": await run_mode("distributed", requests, concurrency, ids, headers,
+                                                          cache_size),
+        }
+        # For reference: the event-fed replica, which behaves the same in both modes
+        read_model_module.READ_MODEL_ENABLED = True
+        upstream.DEPLOYMENT_MODE = "combined"
+        for replica in read_model.replicas.values():
+            await replica.resync(upstream.fetch_snapshot)
+        report["read_model"] = await run_mode("combined", requests, concurrency, ids, headers, cache_size)
+    finally:
+        stop_servers(servers)
+    combined = report["combined_store_lookup"]["p50_ms"]
+    report["saved_p50_ms"] = {
+        "vs_uncached": round(report["distributed_loopback_uncached"]["p50_ms"] - combined, 3),
+        "vs_cached": round(report["distributed_loopback_cached"]["p50_ms"] - combined, 3),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order creation: combined mode store lookups vs loopback HTTP validation")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--ids", type=int, default=1000, help="products and customers to create")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    print_report(asyncio.run(run(args.requests, args.concurrency, args.ids)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import tempfile
+import time
+
+import httpx
+
+from Benchmarks.common import auth_headers, print_report
+from Middleware import log
+from Routers import orders
+from main import app
+
+
+async def throughput(requests: int, concurrency: int) -> float:
+    headers = auth_headers()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                response = await client.get("/orders/1")
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return requests / (time.perf_counter() - started)
+
+
+async def run(requests: int, concurrency: int, rate: float):
+    await orders.orders.create({"customer_id": 1, "product_id": 1, "quantity": 1})
+    # Write to a real file, as a redirected stdout would be
+    scenarios = [
+        ("inline_every_event", False, 1.0),
+        ("queued_every_event", True, 1.0),
+        (f"queued_sampled_{rate}", True, rate),
+    ]
+    report = {}
+    with tempfile.TemporaryFile("w") as sink:
+        for label, use_queue, sample_rate in scenarios:
+            log.setup_logging(stream=sink, use_queue=use_queue)
+            log.sample_rate = sample_rate
+            await throughput(200, concurrency)
+            report[label] = {"requests_per_s": round(await throughput(requests, concurrency), 1)}
+        log.shutdown_logging()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request throughput with inline vs queued, sampled logging")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=log.LOG_SAMPLE_RATE, help="sample rate for INFO events")
+    args = parser.parse_args()
+    print_report(asyncio.run(run(args.requests, args.concurrency, args.rate)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import logging
+
+import httpx
+
+from Benchmarks.common import auth_headers, print_report, summarize
+from Middleware import authentication, passwords
+from Routers import orders
+from main import app
+
+
+# The old behaviour: bcrypt verified inline on the event loop
+async def inline_verify(plain_password: str, hashed_password: str) -> bool:
+    return passwords.get_pwd_context().verify(plain_password, hashed_password)
+
+
+# Open-loop reads: one request every `interval` seconds, each timed from when it
+# was due, so time the event loop spends blocked is counted in the latency
+async def measure_reads(client: httpx.AsyncClient, headers, requests: int, interval: float = 0.005):
+    samples = []
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for i in range(requests):
+        due = started + i * interval
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        response = await client.get("/orders/1", headers=headers)
+        assert response.status_code == 200, response.text
+        samples.append(loop.time() - due)
+    return summarize(samples, loop.time() - started)
+
+
+async def login_storm(client: httpx.AsyncClient, stop: asyncio.Event, counts):
+    form = {"username": "admin_user", "password": "admin_password"}
+    while not stop.is_set():
+        response = await client.post("/token", data=form)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def scenario(client, headers, requests: int, logins: int):
+    stop = asyncio.Event()
+    counts = {}
+    storm = [asyncio.create_task(login_storm(client, stop, counts)) for _ in range(logins)]
+    try:
+        return {"get_order": await measure_reads(client, headers, requests),
+                "login_statuses": counts}
+    finally:
+        stop.set()
+        await asyncio.gather(*storm)
+
+
+async def run(requests: int, logins: int):
+    await orders.orders.create({"customer_id": 1, "product_id": 1, "quantity": 1})
+    headers = auth_headers()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await measure_reads(client, headers, 50)
+        report = {"idle": await scenario(client, headers, requests, 0),
+                  "parallel_logins_pool": await scenario(client, headers, requests, logins)}
+        authentication.verify_password = inline_verify
+        report["parallel_logins_inline_bcrypt"] = await scenario(client, headers, requests, logins)
+    passwords.shutdown_pool()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GET /orders/{id} latency while logins run in parallel")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login loops")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    print_report(asyncio.run(run(args.requests, args.logins)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from Benchmarks.common import print_report
+from Storage.registry import create_repository
+
+CHUNK = 100_000
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as handle:
+        return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def available_bytes() -> int:
+    with open("/proc/meminfo") as handle:
+        for line in handle:
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+# Load `orders` orders into one backend and report what they cost. Runs in its
+# own process so each measurement starts from a clean heap.
+async def measure(backend: str, orders: int, use_tracemalloc: bool):
+    repository = create_repository("orders", backend)
+    if use_tracemalloc:
+        tracemalloc.start()
+    before = rss_bytes()
+    started = time.perf_counter()
+    for first in range(0, orders, CHUNK):
+        await repository.create_many([
+            {"customer_id": i % 100_000 + 1, "product_id": i % 5_000 + 1, "quantity": i % 5 + 1}
+            for i in range(first, min(first + CHUNK, orders))
+        ])
+    load_seconds = time.perf_counter() - started
+    used = tracemalloc.get_traced_memory()[0] if use_tracemalloc else rss_bytes() - before
+    if use_tracemalloc:
+        tracemalloc.stop()
+
+    ids = [random.randint(1, orders) for _ in range(100_000)]
+    started = time.perf_counter()
+    for record_id in ids:
+        await repository.get(record_id)
+    get_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for customer_id in range(1, 1001):
+        await repository.list_page(50, field="customer_id", value=customer_id)
+    page_seconds = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "orders": orders,
+        "measured_with": "tracemalloc" if use_tracemalloc else "rss",
+        "memory_mb": round(used / 2**20, 1),
+        "bytes_per_order": round(used / orders, 1),
+        "load_seconds": round(load_seconds, 2),
+        "get_us": round(get_seconds / len(ids) * 1e6, 3),
+        "list_by_customer_us": round(page_seconds / 1000 * 1e6, 1),
+    }
+
+
+def run_child(backend: str, orders: int, use_tracemalloc: bool, limit_bytes: int):
+    command = [sys.executable, "-m", "Benchmarks.memory", "--child", backend, str(orders),
+               "--limit-bytes", str(limit_bytes)]
+    if use_tracemalloc:
+        command.append("--tracemalloc")
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        reason = "out of memory" if "MemoryError" in result.stderr or result.returncode < 0 else result.stderr[-500:]
+        return {"backend": backend, "orders": orders, "failed": reason,
+                "limit_mb": round(limit_bytes / 2**20)}
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory used by N orders: dict store vs compact column store")
+    parser.add_argument("--orders", default="1000000,10000000", help="comma separated order counts")
+    parser.add_argument("--backends", default="memory,compact")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="count Python allocations instead of RSS growth (slower, more exact)")
+    parser.add_argument("--limit-bytes", type=int, default=0,
+                        help="address space cap per run (default: 80%% of available memory)")
+    parser.add_argument("--child", nargs=2, metavar=("BACKEND", "ORDERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Fail with MemoryError instead of waking the OOM killer
+        if args.limit_bytes:
+            resource.setrlimit(resource.RLIMIT_AS, (args.limit_bytes, args.limit_bytes))
+        report = asyncio.run(measure(args.child[0], int(args.child[1]), args.tracemalloc))
+        print(json.dumps(report))
+        return
+
+    limit_bytes = args.limit_bytes or int(available_bytes() * 0.8)
+    results = []
+    for orders in [int(count) for count in args.orders.split(",")]:
+        for backend in args.backends.split(","):
+            results.append(run_child(backend, orders, args.tracemalloc, limit_bytes))
+    # Raw payload: three 8-byte integers per order
+    print_report({"payload_bytes_per_order": 24, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from Benchmarks.common import auth_headers, print_report
+from Middleware import authentication, metrics
+from Routers import customers, orders, products
+
+
+def build_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+    if with_metrics:
+        app.add_middleware(metrics.MetricsMiddleware)
+    for router in (authentication.router, products.router, orders.router, customers.router):
+        app.include_router(router)
+    return app
+
+
+async def throughput(app: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=auth_headers()) as client:
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get("/orders/1")
+            assert response.status_code == 200, response.text
+        return requests / (time.perf_counter() - started)
+
+
+# Cost of one observe() call on an existing series
+def observe_cost(calls: int) -> float:
+    labels = (("method", "GET"), ("route", "/orders/{order_id}"), ("status", "200"))
+    started = time.perf_counter()
+    for _ in range(calls):
+        metrics.observe("bench_duration_seconds", labels, 0.003)
+    return (time.perf_counter() - started) / calls
+
+
+# Cost the in-flight route wrapper adds around a handler that does nothing
+async def route_wrapper_cost(calls: int) -> float:
+    async def handler(request):
+        return request
+
+    wrapped = metrics.track_in_flight(handler, (("route", "/bench"),))
+    costs = []
+    for candidate in (handler, wrapped):
+        started = time.perf_counter()
+        for _ in range(calls):
+            await candidate(None)
+        costs.append((time.perf_counter() - started) / calls)
+    return costs[1] - costs[0]
+
+
+async def run(requests: int, rounds: int):
+    await orders.orders.create({"customer_id": 1, "product_id": 1, "quantity": 1})
+    # The routers always carry the in-flight wrapper; this A/B isolates the middleware
+    apps = {"without_metrics": build_app(False), "with_metrics": build_app(True)}
+    samples = {label: [] for label in apps}
+    # Alternate which app goes first each round and compare medians to damp noise
+    for round_number in range(rounds):
+        order = list(apps) if round_number % 2 else list(reversed(list(apps)))
+        for label in order:
+            samples[label].append(await throughput(apps[label], requests))
+    median = {label: statistics.median(values) for label, values in samples.items()}
+    overhead = (1 / median["with_metrics"] - 1 / median["without_metrics"]) * 1e6
+    return {
+        "requests_per_round": requests,
+        "rounds": rounds,
+        "without_metrics_rps_median": round(median["without_metrics"], 1),
+        "with_metrics_rps_median": round(median["with_metrics"], 1),
+        "overhead_us_per_request": round(overhead, 2),
+        "observe_us": round(observe_cost(200000) * 1e6, 3),
+        "in_flight_wrapper_us": round(await route_wrapper_cost(200000) * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead of the metrics middleware on GET /orders/{id}")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    print_report(asyncio.run(run(args.requests, args.rounds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from Benchmarks.common import asgi_request, auth_headers, print_report
+from Benchmarks.memory import rss_bytes
+
+# Request body chunk size, about what a server hands the app per receive
+BODY_CHUNK = 64 * 1024
+
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def product_line(i: int) -> bytes:
+    return json.dumps({"name": f"Product {i}", "price": 1 + i % 1000 * 0.25,
+                       "description": f"Description of product {i}"}).encode() + b"\n"
+
+
+# The import body, generated as it is sent
+def body_chunks(products: int):
+    buffer = bytearray()
+    for i in range(products):
+        buffer += product_line(i)
+        if len(buffer) >= BODY_CHUNK:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def preload(repository, products: int):
+    for first in range(0, products, 100_000):
+        await repository.create_many([json.loads(product_line(i))
+                                      for i in range(first, min(first + 100_000, products))])
+
+
+# One phase in a fresh process, so the peak RSS belongs to that phase alone.
+# "stored" is the RSS the products still hold afterwards; "peak_overhead" is
+# what the phase needed on top of that.
+async def measure(phase: str, products: int):
+    from main import app
+    from Routers.products import Product, products as repository
+    headers = auth_headers("admin_user", "admin")
+    if phase.startswith("export"):
+        await preload(repository, products)
+    before = rss_bytes()
+    baseline_peak = peak_rss_bytes()
+    received = 0
+
+    def sink(chunk: bytes):
+        nonlocal received
+        received += len(chunk)
+
+    started = time.perf_counter()
+    if phase == "import_stream":
+        status, _, body = await asgi_request(app, "POST", "/products/import", headers, body_chunks(products))
+        assert status == 200 and json.loads(body)["created"] == products, body[:200]
+    elif phase == "import_buffered":
+        # What a plain JSON-array endpoint does: read the whole body, parse and
+        # validate everything, then store it
+        body = b"".join(body_chunks(products))
+        records = [Product(**item).dict() for item in json.loads(b"[" + body.replace(b"\n", b",")[:-1] + b"]")]
+        await repository.create_many(records)
+        del body, records
+    elif phase == "import_per_item":
+        for i in range(products):
+            status, _, _ = await asgi_request(app, "POST", "/products",
+                                              {**headers, "content-type": "application/json"}, product_line(i))
+            assert status == 201, status
+    elif phase == "export_stream":
+        status, _, _ = await asgi_request(app, "GET", "/products/export", headers, on_body=sink)
+        assert status == 200, status
+    elif phase == "export_buffered":
+        # A JSON list of every product, built in memory and encoded at once
+        items = []
+        after_id = None
+        while True:
+            page = await repository.list_page(1000, after_id=after_id)
+            items.extend({"product_id": product_id, **product} for product_id, product in page)
+            if len(page) < 1000:
+                break
+            after_id = page[-1][0]
+        sink(json.dumps(items).encode())
+        del items
+    seconds = time.perf_counter() - started
+    after = rss_bytes()
+    peak = max(peak_rss_bytes(), after) - max(baseline_peak, before)
+    report = {
+        "phase": phase,
+        "products": products,
+        "seconds": round(seconds, 2),
+        "products_per_second": round(products / seconds),
+        "peak_rss_growth_mb": round(max(peak, 0) / 2**20, 1),
+    }
+    if phase.startswith("import"):
+        report["stored_mb"] = round((after - before) / 2**20, 1)
+        report["peak_overhead_mb"] = round(max(peak - (after - before), 0) / 2**20, 1)
+    else:
+        report["exported_mb"] = round(received / 2**20, 1)
+    return report
+
+
+def run_child(phase: str, products: int, backend: str):
+    env = {**os.environ, "STORAGE_BACKEND": backend}
+    command = [sys.executable, "-m", "Benchmarks.ndjson", "--child", phase, str(products)]
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        return {"phase": phase, "products": products, "failed": result.stderr[-500:]}
+    return {"backend": backend, **json.loads(result.stdout)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NDJSON bulk import and export vs per-item and buffered transfers")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--per-item", type=int, default=20_000, help="products created one POST at a time")
+    parser.add_argument("--backends", default="memory,compact")
+    parser.add_argument("--child", nargs=2, metavar=("PHASE", "PRODUCTS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(asyncio.run(measure(args.child[0], int(args.child[1])))))
+        return
+
+    results = []
+    for backend in args.backends.split(","):
+        for phase in ("import_stream", "import_buffered", "export_stream", "export_buffered"):
+            results.append(run_child(phase, args.products, backend))
+        results.append(run_child("import_per_item", args.per_item, backend))
+    print_report({"results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from Benchmarks.common import auth_headers, print_report, start_upstream_stubs, stop_servers
+from Middleware.validation_cache import validation_cache
+from main import app
+
+
+def sample_orders(count: int, distinct: int):
+    return [
+        {"customer_id": i % distinct + 1, "product_id": (i * 7) % distinct + 1, "quantity": 1 + i % 3}
+        for i in range(count)
+    ]
+
+
+async def run(count: int, distinct: int, concurrency: int):
+    headers = auth_headers(role="customer")
+    payload = sample_orders(count, distinct)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        # N individual POST /orders
+        validation_cache.clear()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def post_one(order):
+            async with semaphore:
+                response = await client.post("/orders", json=order)
+                assert response.status_code == 201, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post_one(order) for order in payload))
+        single_elapsed = time.perf_counter() - started
+
+        # One POST /orders/batch with the same N orders
+        validation_cache.clear()
+        started = time.perf_counter()
+        response = await client.post("/orders/batch", json=payload)
+        batch_elapsed = time.perf_counter() - started
+        assert response.status_code == 200 and response.json()["created"] == count, response.text
+
+    return {
+        "orders": count,
+        "distinct_ids": distinct,
+        "single_posts_s": round(single_elapsed, 4),
+        "single_posts_orders_per_s": round(count / single_elapsed, 1),
+        "batch_s": round(batch_elapsed, 4),
+        "batch_orders_per_s": round(count / batch_elapsed, 1),
+        "speedup": round(single_elapsed / batch_elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="N single order posts vs one batch of N")
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--distinct", type=int, default=50, help="distinct customer/product IDs")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.002, help="artificial stub latency in seconds")
+    args = parser.parse_args()
+
+    servers = start_upstream_stubs(range(1, args.distinct + 1), delay=args.delay)
+    try:
+        print_report(asyncio.run(run(args.orders, args.distinct, args.concurrency)))
+    finally:
+        stop_servers(servers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from Benchmarks.common import print_report, start_upstream_stubs, stop_servers, summarize
+from Middleware import upstream
+from Middleware.validation_cache import validation_cache
+
+
+# The original validation path: a fresh client and two sequential round trips
+async def legacy_validate(customer_id: int, product_id: int):
+    async with httpx.AsyncClient() as client:
+        customer_response = await client.get(f"http://127.0.0.1:3005/customers/{customer_id}")
+        product_response = await client.get(f"http://127.0.0.1:3004/products/{product_id}")
+    return customer_response.status_code == 200, product_response.status_code == 200
+
+
+async def pooled_validate(customer_id: int, product_id: int):
+    return await upstream.validate_order_refs(customer_id, product_id)
+
+
+async def measure(validate, requests: int, concurrency: int):
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await validate(i % 100 + 1, i % 100 + 1)
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+async def run(requests: int, concurrency: int):
+    await upstream.start_clients()
+    try:
+        # Warm up both paths before measuring, with the validation cache off
+        cache_size = validation_cache.max_entries
+        validation_cache.max_entries = 0
+        await measure(legacy_validate, 20, 1)
+        await measure(pooled_validate, 20, 1)
+        report = {
+            "legacy_sequential_new_client": await measure(legacy_validate, requests, concurrency),
+            "pooled_concurrent": await measure(pooled_validate, requests, concurrency),
+        }
+        validation_cache.max_entries = cache_size
+        report["pooled_concurrent_cached"] = await measure(pooled_validate, requests, concurrency)
+        report["validation_cache"] = validation_cache.stats()
+        return report
+    finally:
+        await upstream.close_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order validation latency: per-call client vs pooled client")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.005, help="artificial stub latency in seconds")
+    args = parser.parse_args()
+
+    servers = start_upstream_stubs(range(1, 101), delay=args.delay)
+    try:
+        report = asyncio.run(run(args.requests, args.concurrency))
+    finally:
+        stop_servers(servers)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from Benchmarks.common import auth_headers, print_report
+from Middleware import authentication, profiling
+from Middleware.profiling import LoopStallWatchdog, ProfileStore, ProfilingMiddleware
+from Routers import customers, orders, products
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    for router in (authentication.router, products.router, orders.router, customers.router):
+        app.include_router(router)
+    return app
+
+
+async def throughput(app, requests: int, headers) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get("/orders/1")
+            assert response.status_code == 200, response.text
+            # In-process requests never block on I/O; yield so the watchdog's heartbeat runs
+            await asyncio.sleep(0)
+        return requests / (time.perf_counter() - started)
+
+
+async def run(requests: int, rounds: int, stall_ms: float):
+    await orders.orders.create({"customer_id": 1, "product_id": 1, "quantity": 1})
+    app = build_app()
+    store = ProfileStore(keep=10, sample_rate=0)
+    admin = auth_headers("admin_user", "admin")
+    watchdog = LoopStallWatchdog(stall_ms / 1000, profiling.LOOP_STALL_INTERVAL_MS / 1000, 10)
+    # (app, headers, watchdog running) per variant. PROFILING_ENABLED=0 is the
+    # bare app, since main:app then installs nothing.
+    variants = {
+        "disabled": (app, admin, False),
+        "middleware_idle": (ProfilingMiddleware(app, store), admin, False),
+        "watchdog_running": (app, admin, True),
+        "every_request_profiled": (ProfilingMiddleware(app, store), {**admin, "X-Profile": "1"}, False),
+    }
+    samples = {label: [] for label in variants}
+    # Alternate the order each round and compare medians to damp noise
+    for round_number in range(rounds):
+        order = list(variants) if round_number % 2 else list(reversed(list(variants)))
+        for label in order:
+            target, headers, with_watchdog = variants[label]
+            if with_watchdog:
+                watchdog.start()
+            try:
+                samples[label].append(await throughput(target, requests, headers))
+            finally:
+                watchdog.stop()
+    median = {label: statistics.median(values) for label, values in samples.items()}
+    report = {"requests_per_round": requests, "rounds": rounds, "loop_stalls_seen": watchdog.count}
+    for label, rps in median.items():
+        report[f"{label}_rps_median"] = round(rps, 1)
+        if label != "disabled":
+            report[f"{label}_overhead_us"] = round((1 / rps - 1 / median["disabled"]) * 1e6, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of request profiling and the loop stall watchdog")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--stall-ms", type=float, default=100, help="watchdog threshold")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    print_report(asyncio.run(run(args.requests, args.rounds, args.stall_ms)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+from Benchmarks.common import print_report, start_upstream_stubs, stop_servers, summarize
+from Middleware import upstream
+from Middleware.validation_cache import validation_cache
+from Services import read_model as read_model_module
+from Services.events import FileBus, InProcessBus
+from Services.read_model import IdReplica, read_model
+
+
+# Validate `requests` orders at `concurrency`; failures are orders whose
+# references could not be confirmed, including upstream errors
+async def measure(requests: int, concurrency: int, ids: int):
+    samples = []
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal failed
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = all(await upstream.validate_order_refs(i % ids + 1, (i * 7) % ids + 1))
+            except Exception:
+                ok = False
+            samples.append(time.perf_counter() - started)
+            failed += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    report = summarize(samples, time.perf_counter() - started)
+    report["failed"] = failed
+    return report
+
+
+async def load_replicas(ids: int):
+    async def snapshot(topic: str):
+        return {"topic": topic, "seq": 0, "ids": list(range(1, ids + 1))}
+    for replica in read_model.replicas.values():
+        await replica.resync(snapshot)
+
+
+# Publish `count` events and time until the last one is applied to a replica
+async def propagation(bus, count: int):
+    replica = IdReplica("products")
+    async def empty(topic: str):
+        return {"topic": topic, "seq": bus.sequence(topic), "ids": []}
+    bus.subscribe("products", replica.handle)
+    await bus.start()
+    await replica.resync(empty)
+    first = replica.seq + 1
+    started = time.perf_counter()
+    for i in range(count):
+        bus.publish("products", "created", first + i)
+    published = time.perf_counter() - started
+    while replica.seq < first + count - 1:
+        await asyncio.sleep(0.001)
+    applied = time.perf_counter() - started
+    await bus.close()
+    return {
+        "events": count,
+        "publish_us": round(published / count * 1e6, 3),
+        "all_applied_ms": round(applied * 1000, 3),
+        "last_delivery_lag_ms": round(replica.delivery_lag * 1000, 3),
+    }
+
+
+async def run(requests: int, concurrency: int, delay: float, events: int):
+    ids = 1000
+    servers = start_upstream_stubs(range(1, ids + 1), delay=delay)
+    validation_cache.max_entries = 0
+    await upstream.start_clients()
+    report = {"stub_delay_ms": delay * 1000, "concurrency": concurrency}
+    try:
+        await load_replicas(ids)
+        read_model_module.READ_MODEL_ENABLED = False
+        await measure(200, concurrency, ids)
+        report["upstream_calls"] = await measure(requests, concurrency, ids)
+        read_model_module.READ_MODEL_ENABLED = True
+        report["read_model"] = await measure(requests, concurrency, ids)
+        stop_servers(servers)
+        servers = []
+        read_model_module.READ_MODEL_ENABLED = False
+        report["upstream_calls_services_down"] = await measure(requests // 10, concurrency, ids)
+        read_model_module.READ_MODEL_ENABLED = True
+        report["read_model_services_down"] = await measure(requests, concurrency, ids)
+    finally:
+        await upstream.close_clients()
+        stop_servers(servers)
+    report["event_propagation"] = {
+        "inprocess": await propagation(InProcessBus(), events),
+        "file": await propagation(FileBus(tempfile.mkdtemp(), 0.01), events),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order validation: upstream calls vs the event-fed read model")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.002, help="stub latency in seconds")
+    parser.add_argument("--events", type=int, default=20000, help="events for the propagation test")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    print_report(asyncio.run(run(args.requests, args.concurrency, args.delay, args.events)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from Benchmarks.common import StubFaults, print_report, start_upstream_stubs, stop_servers, summarize
+from Middleware import resilience, upstream
+from Middleware.validation_cache import validation_cache
+
+# off: one plain attempt per lookup, as before the resilience layer
+# retries: deadline, retries and breaker; hedged: the same plus hedging
+MODES = {
+    "off": {"RESILIENCE_ENABLED": False, "UPSTREAM_HEDGE": False},
+    "retries": {"RESILIENCE_ENABLED": True, "UPSTREAM_HEDGE": False},
+    "hedged": {"RESILIENCE_ENABLED": True, "UPSTREAM_HEDGE": True},
+}
+
+
+def configure(mode: str):
+    for name, value in MODES[mode].items():
+        setattr(resilience, name, value)
+    resilience.reset()
+
+
+# Validate `requests` orders at `concurrency`; an order counts as failed when
+# validation raised or could not confirm both references
+async def measure(requests: int, concurrency: int, ids: int):
+    samples = []
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal failed
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = all(await upstream.validate_order_refs(i % ids + 1, i % ids + 1))
+            except Exception:
+                ok = False
+            samples.append(time.perf_counter() - started)
+            failed += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    report = summarize(samples, time.perf_counter() - started)
+    report["failed"] = failed
+    return report
+
+
+# Run every mode against the stubs with `faulty` settings applied to the
+# `targets` services (all of them by default)
+async def scenario(faults, healthy: dict, faulty: dict, requests: int, concurrency: int, ids: int, modes,
+                   targets=("customers", "products")):
+    results = {}
+    for mode in modes:
+        configure(mode)
+        for stub_faults in faults.values():
+            stub_faults.__dict__.update(healthy)
+        # Warm the pool and the latency windows on healthy stubs first
+        await measure(300, concurrency, ids)
+        for service in targets:
+            faults[service].__dict__.update(faulty)
+        results[mode] = await measure(requests, concurrency, ids)
+        results[mode]["upstream"] = resilience.stats()
+    return results
+
+
+async def run(requests: int, concurrency: int, delay: float, modes):
+    ids = 100
+    faults = {"customers": StubFaults(seed=1), "products": StubFaults(seed=2)}
+    servers = start_upstream_stubs(range(1, ids + 1), faults=faults)
+    healthy = {"delay": delay, "slow_ratio": 0.0, "slow_delay": 0.0, "error_ratio": 0.0}
+    # Every lookup goes upstream
+    validation_cache.max_entries = 0
+    await upstream.start_clients()
+    try:
+        return {
+            "stub_delay_ms": delay * 1000,
+            "concurrency": concurrency,
+            # 5% of upstream calls take an extra 500 ms
+            "slow_tail": await scenario(faults, healthy, {**healthy, "slow_ratio": 0.05, "slow_delay": 0.5},
+                                        requests, concurrency, ids, modes),
+            # 10% of upstream calls answer 503
+            "flaky": await scenario(faults, healthy, {**healthy, "error_ratio": 0.1},
+                                    requests, concurrency, ids, modes),
+            # The customer service hangs on every call
+            "hung_customer_service": await scenario(faults, healthy, {**healthy, "slow_ratio": 1.0, "slow_delay": 5.0},
+                                                    max(requests // 20, concurrency), concurrency, ids, modes,
+                                                    targets=("customers",)),
+        }
+    finally:
+        await upstream.close_clients()
+        stop_servers(servers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order validation under slow, flaky and hung upstream services")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.002, help="base stub latency in seconds")
+    parser.add_argument("--modes", default="off,retries,hedged")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    print_report(asyncio.run(run(args.requests, args.concurrency, args.delay, args.modes.split(","))))
+
+
+if __name__ == "__main__":
+    main()
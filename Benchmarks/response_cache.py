@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from fastapi import Depends, FastAPI, HTTPException
+
+from Benchmarks.common import asgi_request, auth_headers, print_report, summarize
+from Middleware.authentication import get_current_user
+from Middleware.response_cache import response_cache
+from Routers import customers, products
+
+
+# The read handlers as they were before the response cache: the stored dict
+# is returned and FastAPI encodes it on every request
+def build_legacy_app() -> FastAPI:
+    legacy = FastAPI()
+
+    @legacy.get("/products/{product_id}")
+    async def get_product(product_id: int):
+        product = await products.products.get(product_id)
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return product
+
+    @legacy.get("/customers/{customer_id}")
+    async def get_customer(customer_id: int, current_user: dict = Depends(get_current_user)):
+        if not await customers.can_access_customer(customer_id, current_user):
+            raise HTTPException(status_code=403, detail="Not enough privileges")
+        customer = await customers.customers.get(customer_id)
+        if customer is None:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        return customer
+
+    return legacy
+
+
+# The current handlers on an equally bare app, so both sides pay the same
+# routing and middleware cost
+def build_cached_app() -> FastAPI:
+    cached = FastAPI()
+    cached.add_api_route("/products/{product_id}", products.get_product, methods=["GET"])
+    cached.add_api_route("/customers/{customer_id}", customers.get_customer, methods=["GET"])
+    return cached
+
+
+async def measure(target: FastAPI, path: str, ids, requests: int, headers=None, etags=None,
+                  expected: int = 200):
+    samples = []
+    started = time.perf_counter()
+    for i in range(requests):
+        record_id = ids[i % len(ids)]
+        request_headers = dict(headers or {})
+        if etags is not None:
+            request_headers["If-None-Match"] = etags[record_id]
+        sent = time.perf_counter()
+        status, _, _ = await asgi_request(target, "GET", f"{path}/{record_id}", request_headers)
+        samples.append(time.perf_counter() - sent)
+        assert status == expected, status
+    return summarize(samples, time.perf_counter() - started)
+
+
+async def collect_etags(target: FastAPI, path: str, ids, headers=None):
+    etags = {}
+    for record_id in ids:
+        _, response_headers, _ = await asgi_request(target, "GET", f"{path}/{record_id}", headers)
+        etags[record_id] = response_headers["etag"]
+    return etags
+
+
+async def run(records: int, requests: int, description_bytes: int):
+    description = "x" * description_bytes
+    product_ids = await products.products.create_many([
+        {"name": f"Product {i}", "price": 1 + i * 0.25, "description": description} for i in range(records)
+    ])
+    customer_ids = await customers.customers.create_many([
+        {"name": f"Customer {i}", "email": f"customer{i}@example.com"} for i in range(records)
+    ])
+    admin = auth_headers("admin_user", "admin")
+    legacy = build_legacy_app()
+    cached = build_cached_app()
+
+    # Warm every path (and the response cache) before measuring
+    await measure(legacy, "/products", product_ids, records)
+    await measure(cached, "/products", product_ids, records)
+    await measure(legacy, "/customers", customer_ids, records, admin)
+    await measure(cached, "/customers", customer_ids, records, admin)
+    product_etags = await collect_etags(cached, "/products", product_ids)
+    customer_etags = await collect_etags(cached, "/customers", customer_ids, admin)
+
+    report = {
+        "records": records,
+        "requests": requests,
+        "products": {
+            "legacy_encode_per_request": await measure(legacy, "/products", product_ids, requests),
+            "cached_bytes": await measure(cached, "/products", product_ids, requests),
+            "if_none_match_304": await measure(cached, "/products", product_ids, requests,
+                                               etags=product_etags, expected=304),
+        },
+        "customers": {
+            "legacy_encode_per_request": await measure(legacy, "/customers", customer_ids, requests, admin),
+            "cached_bytes": await measure(cached, "/customers", customer_ids, requests, admin),
+            "if_none_match_304": await measure(cached, "/customers", customer_ids, requests, admin,
+                                               etags=customer_etags, expected=304),
+        },
+    }
+    report["response_cache"] = response_cache.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot single-record reads: per-request encoding vs cached bytes and 304s")
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--description-bytes", type=int, default=200, help="size of each product's description")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    print_report(asyncio.run(run(args.records, args.requests, args.description_bytes)))
+
+
+if __name__ == "__main__":
+    main()
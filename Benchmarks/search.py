@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import gc
+import logging
+import random
+import time
+from itertools import accumulate
+
+from Benchmarks.common import asgi_request, percentile, print_report
+from Benchmarks.memory import rss_bytes
+from Services import search
+from Services.search import ProductSearchIndex, tokenize
+from Storage.registry import create_repository
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "pe", "da", "ri", "so", "ba", "ge", "tu", "fa"]
+
+
+# Made-up words drawn with a Zipf-like skew, so a few terms are very common
+# and most are rare, as in real catalogs
+def vocabulary(words: int, rng: random.Random):
+    seen = set()
+    while len(seen) < words:
+        seen.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    terms = sorted(seen)
+    rng.shuffle(terms)
+    weights = list(accumulate(1 / (rank + 1) for rank in range(len(terms))))
+    return terms, weights
+
+
+def catalog(products: int, words: int, seed: int = 7):
+    rng = random.Random(seed)
+    terms, weights = vocabulary(words, rng)
+    for i in range(products):
+        name = rng.choices(terms, cum_weights=weights, k=rng.randint(2, 4))
+        description = rng.choices(terms, cum_weights=weights, k=rng.randint(8, 16))
+        yield {"name": " ".join(name).capitalize(), "price": round(rng.uniform(1, 500), 2),
+               "description": " ".join(description)}
+
+
+def timed(samples, count: int, query):
+    for _ in range(count):
+        started = time.perf_counter()
+        query()
+        samples.append(time.perf_counter() - started)
+
+
+def latency(samples):
+    return {"p50_ms": round(percentile(samples, 50) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3)}
+
+
+# The alternative to an index: scan every product for the words
+async def linear_scan(repository, words, limit: int):
+    matches = []
+    after_id = None
+    while True:
+        page = await repository.list_page(10_000, after_id=after_id)
+        for product_id, product in page:
+            text = f"{product['name']} {product['description']}".lower()
+            if any(word in text for word in words):
+                matches.append(product_id)
+        if len(page) < 10_000:
+            return matches[:limit]
+        after_id = page[-1][0]
+
+
+async def run(products: int, words: int, queries: int, backend: str):
+    repository = create_repository("products", backend)
+    batch = []
+    for product in catalog(products, words):
+        batch.append(product)
+        if len(batch) == 100_000:
+            await repository.create_many(batch)
+            batch = []
+    if batch:
+        await repository.create_many(batch)
+
+    index = ProductSearchIndex()
+    gc.collect()
+    before = rss_bytes()
+    started = time.perf_counter()
+    await index.rebuild(repository)
+    build_seconds = time.perf_counter() - started
+    gc.collect()
+    index_bytes = rss_bytes() - before
+
+    # Query terms picked by rank: the most common word, a mid-frequency one and a rare one
+    ranked = sorted(index.postings, key=lambda term: -len(index.postings[term]))
+    common, middle, rare = ranked[0], ranked[len(ranked) // 100], ranked[len(ranked) // 2]
+    rng = random.Random(1)
+    report = {
+        "backend": backend,
+        "products": products,
+        "vocabulary": words,
+        "numpy": search.np is not None,
+        "build_seconds": round(build_seconds, 2),
+        "index_mb": round(index_bytes / 2**20, 1),
+        "index": index.stats(),
+        "document_frequency": {"common": len(index.postings[common]), "middle": len(index.postings[middle]),
+                               "rare": len(index.postings[rare])},
+    }
+    cases = {
+        "rare_term": lambda: index.search(rare, 20),
+        "middle_term": lambda: index.search(middle, 20),
+        "common_term": lambda: index.search(common, 20),
+        "two_terms": lambda: index.search(f"{middle} {rng.choice(ranked[:2000])}", 20),
+        "two_terms_price_range": lambda: index.search(f"{middle} {rng.choice(ranked[:2000])}", 20,
+                                                      min_price=100, max_price=150),
+        "prefix_query": lambda: index.search(f"{middle} {rng.choice(ranked[:2000])[:2]}", 20, prefix=True),
+        "suggest_2_chars": lambda: index.suggest(rng.choice(ranked[:2000])[:2], 10),
+        "suggest_4_chars": lambda: index.suggest(rng.choice(ranked[:2000])[:4], 10),
+    }
+    results = {}
+    for name, query in cases.items():
+        samples = []
+        timed(samples, queries, query)
+        results[name] = latency(samples)
+    report["queries"] = results
+
+    # Incremental maintenance: update a product's text, as PUT /products/{id} does
+    samples = []
+    for _ in range(queries):
+        product_id = rng.randint(1, products)
+        before_record = await repository.get(product_id)
+        after_record = {**before_record, "description": before_record["description"] + " " + rare}
+        started = time.perf_counter()
+        index.product_changed(product_id, before_record, after_record)
+        samples.append(time.perf_counter() - started)
+        await repository.update(product_id, after_record)
+    report["update"] = latency(samples)
+
+    started = time.perf_counter()
+    await linear_scan(repository, tokenize(middle), 20)
+    report["linear_scan_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+# End to end through the app, including the record lookups and JSON encoding
+async def run_endpoint(products: int, words: int, queries: int):
+    from Routers.products import products as repository
+    from Services.search import search_index
+    from main import app
+    await repository.create_many(list(catalog(products, words)))
+    await search_index.ensure_ready(repository)
+    ranked = sorted(search_index.postings, key=lambda term: -len(search_index.postings[term]))
+    middle = ranked[len(ranked) // 100]
+    rng = random.Random(2)
+    samples = []
+    for _ in range(queries):
+        path = f"/products/search?q={middle}+{rng.choice(ranked[:2000])[:3]}&prefix=true&limit=20"
+        started = time.perf_counter()
+        status, _, _ = await asgi_request(app, "GET", path)
+        samples.append(time.perf_counter() - started)
+        assert status == 200, status
+    return {"products": products, "search_endpoint": latency(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product search: index build, memory and query latency")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=50_000, help="vocabulary size")
+    parser.add_argument("--queries", type=int, default=200, help="queries per case")
+    parser.add_argument("--backend", default="memory")
+    parser.add_argument("--endpoint-products", type=int, default=100_000,
+                        help="products for the end-to-end endpoint test (0 skips it)")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    report = asyncio.run(run(args.products, args.words, args.queries, args.backend))
+    if args.endpoint_products:
+        report["endpoint"] = asyncio.run(run_endpoint(args.endpoint_products, args.words, args.queries))
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from Benchmarks.common import auth_headers, print_report
+from Benchmarks.suite import build_scenarios, drive
+
+# The same app, started the way the README used to (uvicorn's defaults: access
+# log on, 5 s keep-alive, one worker) and through serve.py
+CONFIGS = {
+    "uvicorn_default": lambda port: [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+    "serve_tuned": lambda port: [sys.executable, "serve.py", "--port", str(port)],
+    "serve_tuned_tls": lambda port: [sys.executable, "serve.py", "--port", str(port), "--tls"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url, verify=False) as client:
+        while True:
+            try:
+                if (await client.get("/products", params={"limit": 1})).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"server at {url} did not start")
+            await asyncio.sleep(0.2)
+
+
+# Product IDs are all the load needs; orders would be validated per worker
+async def seed_products(client: httpx.AsyncClient, count: int):
+    admin = auth_headers("admin_user", "admin")
+    ids = []
+    for i in range(count):
+        response = await client.post("/products", headers=admin, json={
+            "name": f"Product {i}", "price": round(1 + i * 0.5, 2), "description": "Benchmark product"})
+        response.raise_for_status()
+        ids.append(response.json()["product_id"])
+    return {"products": ids, "customers": [], "orders": []}
+
+
+# Load through pooled keep-alive connections, then with a new connection per
+# request (what idle clients behind a short keep-alive timeout end up doing)
+async def measure(url: str, requests: int, concurrency: int, seed_count: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, verify=False, limits=limits, timeout=60) as client:
+        get_product = build_scenarios(await seed_products(client, seed_count))["product_read"][1]
+        results = {}
+        for name, make_operation in (("product_read", get_product), ("product_list", list_products)):
+            await drive(client, make_operation, min(100, requests), concurrency)
+            results[name] = trim(await drive(client, make_operation, requests, concurrency))
+    async with httpx.AsyncClient(base_url=url, verify=False, timeout=60,
+                                 limits=httpx.Limits(max_keepalive_connections=0)) as client:
+        make_operation = get_product
+        await drive(client, make_operation, min(50, requests), concurrency)
+        results["product_read_new_connection"] = trim(await drive(client, make_operation, requests // 4,
+                                                                  concurrency))
+    return results
+
+
+# The first page of the price index, as the suite's mixed scenario reads it
+def list_products():
+    return "list_products", lambda client: client.get("/products", params={"sort": "price", "limit": 20})
+
+
+def trim(result):
+    return {key: result[key] for key in ("throughput_rps", "p50_ms", "p99_ms", "errors")}
+
+
+async def run_config(name: str, requests: int, concurrency: int, seed_count: int):
+    port = free_port()
+    scheme = "https" if name.endswith("tls") else "http"
+    url = f"{scheme}://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, "ADMISSION_ENABLED": "0", "STORAGE_BACKEND": "sqlite",
+               "SQLITE_PATH": os.path.join(directory, "bench.db")}
+        server = subprocess.Popen(CONFIGS[name](port), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            await wait_ready(url)
+            return {"config": name, **await measure(url, requests, concurrency, seed_count)}
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of uvicorn's defaults vs serve.py's tuned config")
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=200, help="products to create")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    results = [asyncio.run(run_config(name, args.requests, args.concurrency, args.seed))
+               for name in args.configs.split(",")]
+    print_report({"cpus": os.cpu_count(), "concurrency": args.concurrency, "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from Benchmarks.common import print_report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: time the import of main:app, then the first request
+PROBE = r"""
+import asyncio, json, time
+started = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+
+import httpx
+from Benchmarks.common import auth_headers
+
+async def first_request():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+        request_started = time.perf_counter()
+        response = await client.get("/orders?limit=1", headers=auth_headers())
+        return time.perf_counter() - request_started, response.status_code
+
+first, status = asyncio.run(first_request())
+print(json.dumps({"import_s": imported - started, "first_request_s": first, "status": status}))
+"""
+
+
+def probe() -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Slowest modules by cumulative import time, from python -X importtime
+def slowest_imports(count: int):
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), module.strip()))
+    rows.sort(reverse=True)
+    return [{"module": module, "cumulative_ms": round(us / 1000, 1)} for us, module in rows[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import and first-request cost of main:app in a fresh process")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [probe() for _ in range(args.runs)]
+    print_report({
+        "runs": args.runs,
+        "import_ms_median": round(statistics.median(r["import_s"] for r in runs) * 1000, 1),
+        "first_request_ms_median": round(statistics.median(r["first_request_s"] for r in runs) * 1000, 1),
+        "first_request_status": runs[-1]["status"],
+        "slowest_imports": slowest_imports(args.top),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from Benchmarks.common import print_report
+from Storage.registry import create_repository
+from Storage import registry
+
+
+def sample_order(i: int):
+    return {"customer_id": i % 1000 + 1, "product_id": i % 500 + 1, "quantity": i % 5 + 1}
+
+
+async def timed(label: str, operations: int, concurrency: int, op):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await op(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(operations)))
+    elapsed = time.perf_counter() - started
+    return label, {"ops": operations, "seconds": round(elapsed, 3), "ops_per_s": round(operations / elapsed, 1)}
+
+
+async def run_backend(backend: str, operations: int, concurrency: int):
+    repository = create_repository("orders", backend)
+    await repository.clear()
+    results = {}
+
+    label, stats = await timed("concurrent_writes", operations, concurrency,
+                               lambda i: repository.create(sample_order(i)))
+    results[label] = stats
+
+    label, stats = await timed("concurrent_reads", operations, concurrency,
+                               lambda i: repository.get(random.randint(1, operations)))
+    results[label] = stats
+
+    async def mixed(i: int):
+        if i % 5 == 0:
+            await repository.update(random.randint(1, operations), sample_order(i))
+        else:
+            await repository.get(random.randint(1, operations))
+
+    label, stats = await timed("mixed_80_read_20_write", operations, concurrency, mixed)
+    results[label] = stats
+
+    label, stats = await timed("get_many_100", operations // 100, concurrency,
+                               lambda i: repository.get_many(random.sample(range(1, operations + 1), 100)))
+    results[label] = stats
+    return results
+
+
+async def run(operations: int, concurrency: int):
+    report = {"operations": operations, "concurrency": concurrency}
+    report["memory"] = await run_backend("memory", operations, concurrency)
+    report["sqlite"] = await run_backend("sqlite", operations, concurrency)
+    await registry.close_repositories()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the memory and SQLite storage backends")
+    parser.add_argument("--operations", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        registry.SQLITE_PATH = os.path.join(directory, "bench.db")
+        print_report(asyncio.run(run(args.operations, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
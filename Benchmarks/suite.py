@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from Benchmarks.common import auth_headers, print_report, start_upstream_stubs, stop_servers, summarize
+from Middleware import admission
+
+# One benchmark operation: (name, coroutine factory). The factory sends one
+# request and returns the response so the driver can check its status.
+Operation = Tuple[str, Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]]
+
+# Throughput may drop, and latency percentiles may grow, by this share before --compare fails
+DEFAULT_THRESHOLD = 0.10
+COMPARED_METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+# Seed data shared by the scenarios: products, customers and orders owned by admin
+async def seed(client: httpx.AsyncClient, admin, count: int) -> Dict[str, List[int]]:
+    ids: Dict[str, List[int]] = {"products": [], "customers": [], "orders": []}
+    for i in range(count):
+        response = await client.post("/products", headers=admin, json={
+            "name": f"Product {i}", "price": round(1 + i * 0.5, 2), "description": "Benchmark product"})
+        response.raise_for_status()
+        ids["products"].append(response.json()["product_id"])
+        response = await client.post("/customers", headers=admin, json={
+            "name": f"Customer {i}", "email": f"customer{i}@example.com"})
+        response.raise_for_status()
+        ids["customers"].append(response.json()["customer_id"])
+    response = await client.post("/orders/batch", headers=auth_headers(role="customer"), json=[
+        {"customer_id": customer_id, "product_id": product_id, "quantity": 1}
+        for customer_id, product_id in zip(ids["customers"], ids["products"])
+    ])
+    response.raise_for_status()
+    ids["orders"] = [result["order_id"] for result in response.json()["results"] if "order_id" in result]
+    return ids
+
+
+def build_scenarios(ids: Dict[str, List[int]]) -> Dict[str, Tuple[str, Callable[[], Operation]]]:
+    admin = auth_headers("admin_user", "admin")
+    customer = auth_headers(role="customer")
+    products, customers, orders = ids["products"], ids["customers"], ids["orders"]
+
+    def get_product():
+        product_id = random.choice(products)
+        return "get_product", lambda client: client.get("/products", params={"ids": str(product_id)})
+
+    def list_products():
+        return "list_products", lambda client: client.get("/products", params={"sort": "price", "limit": 20})
+
+    def create_product():
+        body = {"name": "Bench", "price": round(random.uniform(1, 500), 2), "description": "Created by the suite"}
+        return "create_product", lambda client: client.post("/products", headers=admin, json=body)
+
+    def get_customer():
+        customer_id = random.choice(customers)
+        return "get_customer", lambda client: client.get(f"/customers/{customer_id}", headers=admin)
+
+    def update_customer():
+        customer_id = random.choice(customers)
+        body = {"name": f"Customer {customer_id}", "email": f"customer{customer_id}@example.com"}
+        return "update_customer", lambda client: client.put(f"/customers/{customer_id}", headers=admin, json=body)
+
+    def get_order():
+        order_id = random.choice(orders)
+        return "get_order", lambda client: client.get(f"/orders/{order_id}", headers=admin)
+
+    def list_orders():
+        customer_id = random.choice(customers)
+        return "list_orders", lambda client: client.get("/orders", headers=admin, params={"customer_id": customer_id})
+
+    def update_order():
+        order_id = random.choice(orders)
+        body = {"customer_id": random.choice(customers), "product_id": random.choice(products), "quantity": 2}
+        return "update_order", lambda client: client.put(f"/orders/{order_id}", headers=admin, json=body)
+
+    def create_order():
+        body = {"customer_id": random.choice(customers), "product_id": random.choice(products), "quantity": 1}
+        return "create_order", lambda client: client.post("/orders", headers=customer, json=body)
+
+    def login():
+        form = {"username": "admin_user", "password": "admin_password"}
+        return "login", lambda client: client.post("/token", data=form)
+
+    def weighted(*choices: Tuple[float, Callable[[], Operation]]) -> Callable[[], Operation]:
+        weights = [weight for weight, _ in choices]
+        factories = [factory for _, factory in choices]
+        return lambda: random.choices(factories, weights)[0]()
+
+    return {
+        "product_read": ("GET /products?ids= for one product", get_product),
+        "product_create": ("POST /products as admin", create_product),
+        "customer_read": ("GET /customers/{id} as admin", get_customer),
+        "customer_update": ("PUT /customers/{id} as admin", update_customer),
+        "order_read": ("GET /orders/{id}", get_order),
+        "order_update": ("PUT /orders/{id} as admin", update_order),
+        "mixed": ("80% reads / 20% writes across all routers", weighted(
+            (20, get_product), (15, list_products), (15, get_customer), (20, get_order), (10, list_orders),
+            (5, create_product), (5, update_customer), (5, update_order), (5, create_order))),
+        "login_storm": ("POST /token with the admin password", login),
+        "order_create": ("POST /orders validated against the stub services", create_order),
+    }
+
+
+# Closed loop: `concurrency` workers send `requests` requests between them
+async def drive(client: httpx.AsyncClient, make_operation: Callable[[], Operation],
+                requests: int, concurrency: int) -> Dict:
+    samples: List[float] = []
+    per_operation: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    errors = 0
+    remaining = [requests]
+
+    async def worker():
+        nonlocal errors
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            name, send = make_operation()
+            started = time.perf_counter()
+            try:
+                response = await send(client)
+                status = str(response.status_code)
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            elapsed = time.perf_counter() - started
+            samples.append(elapsed)
+            per_operation.setdefault(name, []).append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not status.startswith("2"):
+                errors += 1
+            # In-process requests never block on I/O; yield like a server's socket
+            # reads would so other tasks (e.g. the loop lag monitor) get to run
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    report = summarize(samples, time.perf_counter() - started)
+    report["errors"] = errors
+    report["statuses"] = statuses
+    if len(per_operation) > 1:
+        report["operations"] = {}
+        for name, values in sorted(per_operation.items()):
+            summary = summarize(values, 0)
+            report["operations"][name] = {key: summary[key] for key in ("count", "p50_ms", "p95_ms", "p99_ms")}
+    return report
+
+
+async def run(selected: List[str], url: Optional[str], requests: int, login_requests: int,
+              concurrency: int, seed_count: int) -> Dict:
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=60)
+        target = url
+    else:
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        target = "in-process"
+    async with client:
+        ids = await seed(client, auth_headers("admin_user", "admin"), seed_count)
+        scenarios = build_scenarios(ids)
+        report = {"target": target, "concurrency": concurrency, "scenarios": {}}
+        for name in selected:
+            description, make_operation = scenarios[name]
+            count = login_requests if name == "login_storm" else requests
+            # Short warm-up so one-off costs (first token check, pooled connections) are not measured
+            await drive(client, make_operation, min(50, count), concurrency)
+            result = await drive(client, make_operation, count, concurrency)
+            result["description"] = description
+            report["scenarios"][name] = result
+    if not url:
+        from Middleware import upstream
+        await upstream.close_clients()
+    return report
+
+
+# Diff a report against a baseline. Lower throughput or higher latency than the
+# baseline by more than `threshold` (a fraction) counts as a regression.
+def compare(current: Dict, baseline: Dict, threshold: float) -> Dict:
+    regressions = []
+    deltas = {}
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        deltas[name] = {}
+        for metric in COMPARED_METRICS:
+            before, after = previous.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            deltas[name][metric] = round(change, 4)
+            worse = change < -threshold if metric == "throughput_rps" else change > threshold
+            if worse:
+                regressions.append(f"{name}.{metric}: {before} -> {after} ({change:+.1%})")
+    return {"threshold": threshold, "deltas": deltas, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and latency suite for the products, customers, orders and auth routers")
+    parser.add_argument("--url", help="benchmark a running server instead of main:app in-process")
+    parser.add_argument("--scenarios", default="all", help="comma separated scenario names, or 'all'")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=100, help="requests for login_storm (bcrypt bound)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=200, help="products/customers/orders created before measuring")
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="artificial latency of the stub services")
+    parser.add_argument("--no-stubs", action="store_true", help="do not start stub customer/product services")
+    parser.add_argument("--admission", action="store_true",
+                        help="keep admission control on for in-process runs (load shedding, rate limits)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", help="baseline report to diff against; exits 1 on regression")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    names = list(build_scenarios({"products": [1], "customers": [1], "orders": [1]}))
+    selected = names if args.scenarios == "all" else args.scenarios.split(",")
+    unknown = [name for name in selected if name not in names]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}; choose from {names}")
+
+    if args.admission:
+        admission.ADMISSION_ENABLED = True
+        admission.rate_limiter.rate = admission.USER_RATE_LIMIT
+    # Keep sampled request logs from interleaving with the report
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+    servers = [] if args.no_stubs else start_upstream_stubs(range(1, args.seed + 1), delay=args.stub_delay)
+    try:
+        report = asyncio.run(run(selected, args.url, args.requests, args.login_requests,
+                                 args.concurrency, args.seed))
+    finally:
+        stop_servers(servers)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+    if args.compare:
+        with open(args.compare) as handle:
+            report["comparison"] = compare(report, json.load(handle), args.threshold)
+    print_report(report)
+    if args.compare and report["comparison"]["regressions"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
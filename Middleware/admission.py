@@ -0,0 +1,193 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from Middleware import metrics
+from Middleware.metrics import InstrumentedRoute, LabelKey
+
+# ADMISSION_ENABLED=0 turns every check below off
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+
+# Requests a route may have in flight before new ones get a 503. Overrides use
+# the route template, e.g. "POST /orders=64,POST /orders/batch=4"; 0 means unlimited.
+ROUTE_CONCURRENCY_DEFAULT = int(os.getenv("ROUTE_CONCURRENCY_DEFAULT", "256"))
+ROUTE_CONCURRENCY_LIMITS = os.getenv("ROUTE_CONCURRENCY_LIMITS", "POST /orders=64,POST /orders/batch=8,POST /token=32")
+
+# Per-user token bucket: sustained requests per second and burst size (0 turns it off)
+USER_RATE_LIMIT = float(os.getenv("USER_RATE_LIMIT", "100"))
+USER_RATE_BURST = float(os.getenv("USER_RATE_BURST", "200"))
+
+# New requests are shed while the event loop runs this far behind schedule.
+# Off (0) unless set: CPU-heavy but healthy traffic also delays the loop.
+LOOP_LAG_SHED_MS = float(os.getenv("LOOP_LAG_SHED_MS", "0"))
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "20"))
+
+# Never shed scrapes, so overload stays visible
+SHED_EXEMPT_PATHS = ("/metrics",)
+
+metrics.help_texts["admission_rejected"] = "Requests turned away by admission control, by reason."
+metrics.help_texts["event_loop_lag_seconds"] = "Smoothed delay of the event loop behind its schedule."
+
+
+def parse_route_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, limit = item.rpartition("=")
+        limits[route.strip()] = int(limit)
+    return limits
+
+
+route_limits = parse_route_limits(ROUTE_CONCURRENCY_LIMITS)
+
+
+def _reject(reason: str, route: str):
+    metrics.counter_add("admission_rejected", (("reason", reason), ("route", route)))
+
+
+# Measures event-loop lag: a task asks to wake every `interval` seconds and
+# records how late it actually woke. The value is an exponential moving
+# average, so a single slow tick (e.g. a GC pause) does not trigger shedding
+# but sustained overload crosses the threshold within a few ticks.
+class LoopLagMonitor:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            late = max(0.0, loop.time() - expected)
+            self.lag = self.lag * 0.5 + late * 0.5
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.lag = 0.0
+
+
+loop_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL_MS / 1000)
+
+metrics.collectors.append(lambda: {"event_loop_lag_seconds": {(): round(loop_monitor.lag, 6)}})
+
+
+# Token bucket per user, refilled continuously at `rate` tokens per second.
+# Buckets are kept in last-seen order and capped at `max_users`: when a new
+# user would go over the cap, the least recently seen bucket is dropped. That
+# is the one most likely to have refilled already, and each eviction is O(1),
+# so a flood of distinct users costs memory and time bounded by the cap.
+class UserRateLimiter:
+    def __init__(self, rate: float, burst: float, max_users: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    # Take one token; returns 0 when admitted, else seconds until a token is available
+    def acquire(self, user: str) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            while len(self._buckets) >= self.max_users:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[user] = [self.burst, now]
+        else:
+            self._buckets.move_to_end(user)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+rate_limiter = UserRateLimiter(USER_RATE_LIMIT, USER_RATE_BURST)
+
+
+# Called by get_current_user once the token is verified, so the bucket is
+# keyed on the JWT sub and unauthenticated requests never reach it
+def check_user_rate(username: str):
+    if not ADMISSION_ENABLED or rate_limiter.rate <= 0:
+        return
+    wait = rate_limiter.acquire(username)
+    if wait:
+        _reject("user_rate", "")
+        raise HTTPException(status_code=429, detail="Rate limit exceeded",
+                            headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+
+def _overloaded_response(detail: str, retry_after: int = 1):
+    return JSONResponse({"detail": detail}, status_code=503, headers={"Retry-After": str(retry_after)})
+
+
+# Route class for the routers: InstrumentedRoute plus a concurrency cap per
+# route template. A request over the cap is answered with 503 right away,
+# before its body is read or its dependencies run, instead of queueing.
+class AdmissionRoute(InstrumentedRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        methods = ",".join(sorted(self.methods or ()))
+        limit = route_limits.get(f"{methods} {self.path}", ROUTE_CONCURRENCY_DEFAULT)
+        if limit <= 0:
+            return handler
+        labels: LabelKey = (("method", methods), ("route", self.path))
+        in_flight = metrics.gauges["http_requests_in_flight"]
+        route = f"{methods} {self.path}"
+
+        async def admitted_handler(request):
+            if in_flight[labels] >= limit and ADMISSION_ENABLED:
+                _reject("route_concurrency", route)
+                return _overloaded_response("Too many concurrent requests for this route")
+            return await handler(request)
+
+        return admitted_handler
+
+
+_SHED_BODY = json.dumps({"detail": "Server overloaded, try again shortly"}).encode()
+_SHED_START = {"type": "http.response.start", "status": 503, "headers": [
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(_SHED_BODY)).encode()),
+    (b"retry-after", b"1"),
+]}
+
+
+# Pure ASGI middleware that sheds new requests while the event loop is lagging
+# (only when LOOP_LAG_SHED_MS is set; the lag is measured either way).
+# A rejection is a prebuilt response, far cheaper than serving the request,
+# so admitted requests keep their latency.
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        loop_monitor.ensure_started()
+        if 0 < LOOP_LAG_SHED_MS < loop_monitor.lag * 1000 and scope["path"] not in SHED_EXEMPT_PATHS:
+            _reject("loop_lag", "")
+            await send(_SHED_START)
+            await send({"type": "http.response.body", "body": _SHED_BODY})
+            return
+        await self.app(scope, receive, send)
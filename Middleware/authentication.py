@@ -2,21 +2,26 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
+from Middleware.passwords import PasswordPoolSaturated, verify_password
+from Middleware.log import log_event
+from Middleware import metrics
+from Middleware.admission import AdmissionRoute, check_user_rate
+from collections import OrderedDict
+import hashlib
+import json
 import logging
+import os
+import time
 
-fake_users_db = {
-    "admin_user": {
-        "username": "admin_user",
-        "hashed_password": CryptContext(schemes=["bcrypt"], deprecated="auto").hash("admin_password"),
-        "role": "admin"
-    },
-    "regular_user": {
-        "username": "regular_user",
-        "hashed_password": CryptContext(schemes=["bcrypt"], deprecated="auto").hash("user_password"),
-        "role": "user"
-    }
-}
+# Users are loaded from a seed file of precomputed bcrypt hashes, so importing
+# this module does not pay for any hashing
+USERS_SEED_FILE = os.getenv("USERS_SEED_FILE", os.path.join(os.path.dirname(__file__), "users.json"))
+
+def load_users(path: str) -> dict:
+    with open(path) as seed:
+        return json.load(seed)
+
+fake_users_db = load_users(USERS_SEED_FILE)
 
 # Security scheme for OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -38,24 +43,143 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 # Function to authenticate user
-def authenticate_user(username: str, password: str):
+# bcrypt runs on the password worker pool so a login never blocks the event loop
+async def authenticate_user(username: str, password: str):
     user = fake_users_db.get(username)
-    if not user or not CryptContext(schemes=["bcrypt"], deprecated="auto").verify(password, user['hashed_password']):
+    if not user or not await verify_password(password, user['hashed_password']):
         return False
     return user 
 
 # Dependency to get the current user
-import logging
+logger = logging.getLogger("auth")
+
+# Verified-token cache settings (AUTH_TOKEN_CACHE_SIZE=0 turns the cache off)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+
+# Bounded LRU cache of tokens that already passed signature and user checks,
+# keyed by a digest of the token so raw tokens are never kept in memory.
+# An entry never outlives the token's own exp claim.
+class TokenCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._revoked = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            self._evict(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return user
+
+    def put(self, key: bytes, user: dict, exp: float):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (user, min(exp, time.time() + self.ttl))
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(user["username"], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
 
-logger = logging.getLogger("my_logger")
-logging.basicConfig(level=logging.INFO)
+    def _evict(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[0]["username"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[0]["username"]]
 
+    # Reject a token until it expires and drop it from the cache
+    def revoke(self, token: str, exp: float):
+        now = time.time()
+        self._revoked = {key: until for key, until in self._revoked.items() if until > now}
+        key = self.digest(token)
+        self._revoked[key] = exp
+        self._evict(key)
+
+    def is_revoked(self, key: bytes) -> bool:
+        until = self._revoked.get(key)
+        return until is not None and until > time.time()
+
+    # Drop every cached token of a user
+    def evict_user(self, username: str):
+        for key in list(self._by_user.get(username, ())):
+            self._evict(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "revoked": len(self._revoked)}
+
+
+token_cache = TokenCache(AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TTL)
+
+# Revocation hook: the token is rejected from now on, even if it is still cached
+def revoke_token(token: str):
+    try:
+        claims = jwt.get_unverified_claims(token)
+        exp = float(claims.get("exp", 0))
+    except JWTError:
+        return
+    token_cache.revoke(token, exp or time.time() + AUTH_TOKEN_CACHE_TTL)
+
+# Remove a user and every cached token that still authenticates them
+def remove_user(username: str):
+    fake_users_db.pop(username, None)
+    token_cache.evict_user(username)
+
+def _collect_token_cache():
+    return {f"auth_token_cache_{key}": {(): value} for key, value in token_cache.stats().items()}
+
+metrics.collectors.append(_collect_token_cache)
+metrics.counter_names.update(("auth_token_cache_hits", "auth_token_cache_misses"))
+
+# Time spent authenticating, by outcome (cache_hit / verified / rejected).
+# The verified user then draws from their rate-limit bucket (429 when empty).
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    started = time.perf_counter()
+    outcome = "rejected"
+    try:
+        user, outcome = await _authenticate_token(token)
+    finally:
+        metrics.observe("auth_duration_seconds", (("outcome", outcome),), time.perf_counter() - started)
+    check_user_rate(user["username"])
+    return user
+
+async def _authenticate_token(token: str):
+    key = TokenCache.digest(token)
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached, "cache_hit"
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if token_cache.is_revoked(key):
+        log_event(logger, logging.WARNING, "token_revoked")
+        raise credentials_exception
     
     try:
         # Decode the JWT
@@ -63,33 +187,49 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         username: str = payload.get("sub")
         role: str = payload.get("role")  
         
-        # Log the payload for debugging
-        logger.info(f"Decoded payload: {payload}")
-        
         # Check if username or role is None
         if username is None or role is None:
-            logger.warning("Username or role is None.")
+            log_event(logger, logging.WARNING, "token_missing_claims")
             raise credentials_exception
             
     except JWTError:
-        logger.error("JWT Error: Could not decode token.")
+        log_event(logger, logging.ERROR, "token_invalid")
         raise credentials_exception
 
     # Check if the user exists in the fake_users_db
     user = fake_users_db.get(username)
     if user is None:
-        logger.error(f"User not found: {username}")
+        log_event(logger, logging.ERROR, "user_not_found", username=username)
         raise credentials_exception
 
-    logger.info(f"User authenticated: {username} with role {role}")
-    return {"username": username, "role": role}
+    log_event(logger, logging.INFO, "user_authenticated", username=username, role=role)
+    current_user = {"username": username, "role": role}
+    token_cache.put(key, current_user, float(payload.get("exp", time.time() + AUTH_TOKEN_CACHE_TTL)))
+    return current_user, "verified"
+
+# The user a bearer token belongs to, or None when it does not verify. Unlike
+# get_current_user it neither raises nor draws from the rate limit.
+async def user_from_token(token: str):
+    try:
+        user, _ = await _authenticate_token(token)
+    except HTTPException:
+        return None
+    return user
 
 # Initialize the router
-router = APIRouter()
+router = APIRouter(route_class=AdmissionRoute)
 
 @router.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except PasswordPoolSaturated:
+        log_event(logger, logging.WARNING, "password_pool_saturated")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again shortly",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
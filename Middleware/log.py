@@ -0,0 +1,124 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Optional, TextIO
+
+from Middleware import metrics
+
+# LOG_LEVEL: lowest level that is emitted at all
+# LOG_SAMPLE_RATE: fraction of DEBUG/INFO events kept; WARNING and above are never sampled
+# LOG_ASYNC: write through a queue to a background thread (1) or inline (0)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["DeferredQueueHandler"] = None
+sample_rate = LOG_SAMPLE_RATE
+
+metrics.help_texts["log_records_dropped"] = "DEBUG/INFO log records dropped because the log queue was full."
+metrics.counter_names.add("log_records_dropped")
+
+
+def _quote(value) -> str:
+    text = str(value)
+    if not text or " " in text or '"' in text or "=" in text:
+        text = '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+# Renders "ts=... level=INFO logger=orders event=order_created order_id=7".
+# Runs on the writer thread, so request handlers never pay for formatting.
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        created = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        parts = [f"ts={created}.{int(record.msecs):03d}Z", f"level={record.levelname}",
+                 f"logger={record.name}", f"event={_quote(record.getMessage())}"]
+        for key, value in getattr(record, "fields", {}).items():
+            parts.append(f"{key}={_quote(value)}")
+        if record.exc_info:
+            parts.append("exc=" + repr(self.formatException(record.exc_info)))
+        return " ".join(parts)
+
+
+# QueueHandler that enqueues the record untouched (the stock one formats it first).
+# When the writer falls behind and the queue is full, DEBUG/INFO records are
+# dropped rather than blocking; warnings and errors are written inline through
+# `fallback` (the writer's own handler, which locks around each write), or
+# wait for room in the queue when there is no fallback.
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue, fallback: Optional[logging.Handler] = None):
+        super().__init__(log_queue)
+        self.fallback = fallback
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+            elif self.fallback is not None:
+                self.fallback.handle(record)
+            else:
+                self.queue.put(record)
+
+
+# Install the app's log handling on the root logger. Safe to call more than once.
+def setup_logging(stream: Optional[TextIO] = None, use_queue: bool = LOG_ASYNC, level: str = LOG_LEVEL):
+    global _listener, _queue_handler
+    shutdown_logging()
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(KeyValueFormatter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if use_queue:
+        log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+        _queue_handler = DeferredQueueHandler(log_queue, fallback=writer)
+        root.addHandler(_queue_handler)
+        _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+        _listener.start()
+    else:
+        _queue_handler = None
+        root.addHandler(writer)
+    root.setLevel(level)
+    # httpx logs every request at INFO, including the order service's upstream calls
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+# Flush the queue and stop the writer thread
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+# Expose the records the queue had to drop on /metrics
+def _collect_stats():
+    return {"log_records_dropped": {(): _queue_handler.dropped if _queue_handler is not None else 0}}
+
+metrics.collectors.append(_collect_stats)
+
+
+# Log a structured event. Nothing is built unless the level is enabled, and
+# events below WARNING are kept only for a sample_rate share of calls.
+def log_event(logger: logging.Logger, level: int, event: str, **fields):
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING and sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    logger.log(level, event, extra={"fields": fields})
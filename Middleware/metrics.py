@@ -0,0 +1,205 @@
+import time
+from bisect import bisect_left
+from typing import Dict, Set, Tuple
+
+from fastapi import APIRouter
+from fastapi.routing import APIRoute
+from fastapi.responses import PlainTextResponse
+
+# Fixed latency buckets in seconds (Prometheus "le" bounds, +Inf is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# A histogram over fixed buckets. All recording happens on the event loop
+# thread, so observe() is a bisect and three plain increments with no locks.
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# metric name -> label values -> Histogram / gauge value / counter value
+histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+gauges: Dict[str, Dict[LabelKey, float]] = {}
+counters: Dict[str, Dict[LabelKey, float]] = {}
+# Families reported by collectors that only ever go up (hits, rejections, ...).
+# They are exported as counters, named <name>_total, like those in `counters`.
+counter_names: Set[str] = set()
+help_texts: Dict[str, str] = {
+    "http_request_duration_seconds": "Request latency by method, route template and status.",
+    "http_requests_in_flight": "Requests currently being handled, by method and route template.",
+    "upstream_request_duration_seconds": "Latency of calls to the customer and product services.",
+    "auth_duration_seconds": "Time spent in the get_current_user dependency, by outcome.",
+}
+
+
+def observe(name: str, labels: LabelKey, value: float):
+    family = histograms.get(name)
+    if family is None:
+        family = histograms[name] = {}
+    histogram = family.get(labels)
+    if histogram is None:
+        histogram = family[labels] = Histogram()
+    histogram.observe(value)
+
+
+def gauge_add(name: str, labels: LabelKey, delta: float):
+    family = gauges.get(name)
+    if family is None:
+        family = gauges[name] = {}
+    family[labels] = family.get(labels, 0) + delta
+
+
+def counter_add(name: str, labels: LabelKey, delta: float = 1):
+    family = counters.get(name)
+    if family is None:
+        family = counters[name] = {}
+    family[labels] = family.get(labels, 0) + delta
+
+
+# Times a block and records it under `name`, e.g. around an upstream call
+class timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str, **labels: str):
+        self.name = name
+        self.labels = tuple(labels.items())
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, self.labels, time.perf_counter() - self.started)
+
+
+# Drop the recorded latencies and counts. Gauges are current levels (the
+# requests in flight right now), so they are left as they are.
+def reset():
+    histograms.clear()
+    counters.clear()
+
+
+# Wrap a route handler so the in-flight gauge for `labels` counts its calls
+def track_in_flight(handler, labels: LabelKey):
+    in_flight = gauges.setdefault("http_requests_in_flight", {})
+    in_flight.setdefault(labels, 0)
+
+    async def instrumented_handler(request):
+        in_flight[labels] += 1
+        try:
+            return await handler(request)
+        finally:
+            in_flight[labels] -= 1
+
+    return instrumented_handler
+
+
+# Route class for the routers: tracks in-flight requests per route template.
+# Wrapping the route handler is cheaper than an app-wide dependency, which
+# FastAPI would have to solve on every request.
+class InstrumentedRoute(APIRoute):
+    def get_route_handler(self):
+        labels = (("method", ",".join(sorted(self.methods or ()))), ("route", self.path))
+        return track_in_flight(super().get_route_handler(), labels)
+
+
+# Pure ASGI middleware recording per-route, per-status latency
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            labels = (
+                ("method", scope["method"]),
+                ("route", getattr(route, "path", "unmatched")),
+                ("status", str(status_holder[0])),
+            )
+            observe("http_request_duration_seconds", labels, elapsed)
+
+
+def _label_text(labels: LabelKey, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# Extra values computed at scrape time (e.g. cache sizes), callables returning
+# {name: {labels: value}}. Names in counter_names are exported as counters.
+collectors = []
+
+
+def _family_lines(lines, name: str, kind: str, family: Dict[LabelKey, float]):
+    help_text = help_texts.get(name)
+    if kind == "counter":
+        name = f"{name}_total"
+    if help_text is not None:
+        lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in family.items():
+        lines.append(f"{name}{_label_text(labels)} {value}")
+
+
+# Prometheus text exposition format (version 0.0.4)
+def render() -> str:
+    lines = []
+    for name, family in histograms.items():
+        if name in help_texts:
+            lines.append(f"# HELP {name} {help_texts[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in list(family.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_label_text(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_label_text(labels, le)} {histogram.count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+    snapshot = {name: dict(family) for name, family in gauges.items()}
+    snapshot.update((name, dict(family)) for name, family in counters.items())
+    for collect in collectors:
+        for name, family in collect().items():
+            snapshot.setdefault(name, {}).update(family)
+    for name, family in snapshot.items():
+        kind = "counter" if name in counters or name in counter_names else "gauge"
+        _family_lines(lines, name, kind, family)
+    return "\n".join(lines) + "\n"
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
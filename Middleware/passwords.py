@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+# Worker pool for bcrypt: "thread" (bcrypt releases the GIL) or "process"
+PASSWORD_POOL_KIND = os.getenv("PASSWORD_POOL_KIND", "thread")
+PASSWORD_POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+# How many hash/verify jobs may wait for a worker before new ones are refused
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "32"))
+
+_pwd_context = None
+
+
+# Password hashing context, created once per process on first use so that
+# importing this module stays cheap
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+# Raised when every worker is busy and the queue is full
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+_executor: Optional[Executor] = None
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if PASSWORD_POOL_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_POOL_SIZE)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_POOL_SIZE, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+
+# Called from the pool when a job finishes or a queued job is cancelled
+def _job_done(future):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+# Run a bcrypt job on the pool, refusing it straight away when the pool is
+# saturated. A job counts until the pool is done with it: a login whose client
+# went away cancels the job only if it has not started yet, and a running
+# job keeps its worker busy until it finishes.
+async def _submit(fn, *args):
+    global _pending
+    with _pending_lock:
+        if _pending >= PASSWORD_POOL_SIZE + PASSWORD_QUEUE_LIMIT:
+            raise PasswordPoolSaturated()
+        _pending += 1
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _job_done(None)
+        raise
+    future.add_done_callback(_job_done)
+    return await asyncio.wrap_future(future)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _submit(_verify, plain_password, hashed_password)
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(_hash, password)
+
+
+# Stop the worker pool (called from the app lifespan)
+def shutdown_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,303 @@
+import asyncio
+import cProfile
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse, Response
+from pydantic import BaseModel
+
+from Middleware import metrics
+from Middleware.admission import AdmissionRoute
+from Middleware.authentication import get_current_user, user_from_token
+from Middleware.log import log_event
+
+logger = logging.getLogger("profiling")
+
+# PROFILING_ENABLED=1 installs the profiling middleware and the /debug routes
+# in main:app. At 0 (the default) none of it is installed, so requests pay
+# nothing for it.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Share of requests profiled without being asked (0: only requests sending X-Profile)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+# Captured profiles kept for /debug/profiles; older ones are dropped
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", "50"))
+
+# Event loop watchdog: a stall longer than LOOP_STALL_MS logs the stack of the
+# code blocking the loop (0, the default, leaves the watchdog off)
+LOOP_STALL_MS = float(os.getenv("LOOP_STALL_MS", "0"))
+LOOP_STALL_INTERVAL_MS = float(os.getenv("LOOP_STALL_INTERVAL_MS", "20"))
+LOOP_STALL_KEEP = int(os.getenv("LOOP_STALL_KEEP", "20"))
+
+# An admin sends "X-Profile: 1" with their bearer token; the response names the profile in X-Profile-Id
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+SORT_KEYS = set(pstats.Stats.sort_arg_dict_default)
+
+metrics.help_texts["profiles_captured"] = "Requests profiled with cProfile, by trigger."
+metrics.help_texts["event_loop_stalls"] = "Event loop stalls longer than LOOP_STALL_MS seen by the watchdog."
+metrics.counter_names.add("event_loop_stalls")
+
+
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    return None
+
+
+def _wants_profile(scope) -> bool:
+    return any(name == PROFILE_HEADER and value not in (b"", b"0") for name, value in scope["headers"])
+
+
+# Profiles of recent requests, as pstats dicts. cProfile hooks the whole
+# thread, so a profile also holds whatever other requests ran on the event
+# loop meanwhile. Only one request is profiled at a time; the rest run as usual.
+class ProfileStore:
+    def __init__(self, keep: int, sample_rate: float):
+        self.sample_rate = sample_rate
+        self.profiles: Deque[Dict] = deque(maxlen=keep)
+        self.busy = False
+        self._ids = itertools.count(1)
+
+    def reserve_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, profile_id: int, profile: cProfile.Profile, scope, status: int, seconds: float, trigger: str):
+        profile.create_stats()
+        self.profiles.append({
+            "profile_id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "duration_ms": round(seconds * 1000, 3),
+            "trigger": trigger,
+            "captured_at": round(time.time(), 3),
+            "stats": profile.stats,
+        })
+        metrics.counter_add("profiles_captured", (("trigger", trigger),))
+
+    def get(self, profile_id: int) -> Optional[Dict]:
+        for entry in self.profiles:
+            if entry["profile_id"] == profile_id:
+                return entry
+        return None
+
+    def summaries(self):
+        return [{key: value for key, value in entry.items() if key != "stats"} for entry in reversed(self.profiles)]
+
+    def clear(self):
+        self.profiles.clear()
+
+
+profile_store = ProfileStore(PROFILING_KEEP, PROFILING_SAMPLE_RATE)
+
+
+# pstats text report of a stored profile, sorted by e.g. "cumulative" or "tottime"
+def render_stats(entry: Dict, sort: str, limit: int) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(stream=stream)
+    stats.stats = entry["stats"]
+    stats.get_top_level_stats()
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+# Pure ASGI middleware that runs a request under cProfile when an admin asks
+# for it with X-Profile, or for a sample_rate share of requests. The token is
+# only checked on requests that send the header.
+class ProfilingMiddleware:
+    def __init__(self, app, store: ProfileStore = profile_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.store.busy:
+            await self.app(scope, receive, send)
+            return
+        trigger = None
+        if _wants_profile(scope):
+            token = _bearer_token(scope)
+            user = await user_from_token(token) if token else None
+            if user is not None and user["role"] == "admin":
+                trigger = "header"
+        elif self.store.sample_rate > 0 and random.random() < self.store.sample_rate:
+            trigger = "sampled"
+        # Checked again: another request may have started profiling while the token was verified
+        if trigger is None or self.store.busy:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = self.store.reserve_id()
+        status_holder = [500]
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                if trigger == "header":
+                    message = {**message, "headers": [*message.get("headers", ()),
+                                                      (PROFILE_ID_HEADER, str(profile_id).encode())]}
+            await send(message)
+
+        profile = cProfile.Profile()
+        self.store.busy = True
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - started
+            self.store.busy = False
+            self.store.add(profile_id, profile, scope, status_holder[0], seconds, trigger)
+            log_event(logger, logging.INFO, "request_profiled", profile_id=profile_id, path=scope["path"],
+                      trigger=trigger, duration_ms=round(seconds * 1000, 3))
+
+
+# Detects event loop stalls from outside the loop. A task on the loop records
+# a heartbeat every `interval`; a daemon thread checks it, and when the loop
+# has been blocked longer than `threshold` it captures the loop thread's
+# current stack, which is the code doing the blocking. Each stall is reported
+# once, while it is still happening.
+class LoopStallWatchdog:
+    def __init__(self, threshold: float, interval: float, keep: int):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls: Deque[Dict] = deque(maxlen=keep)
+        self.count = 0
+        self.last_beat = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._task = self._loop.create_task(self._beat())
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-stall-watchdog", daemon=True)
+        self._thread.start()
+
+    async def _beat(self):
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        reported = 0.0
+        while not self._stopped.wait(self.interval):
+            beat = self.last_beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked > self.threshold and beat != reported:
+                reported = beat
+                self._report(blocked)
+
+    def _report(self, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        task = asyncio.current_task(self._loop)
+        stall = {
+            "detected_at": round(time.time(), 3),
+            "blocked_ms": round(blocked * 1000, 1),
+            "task": task.get_name() if task is not None else None,
+            "coroutine": getattr(task.get_coro(), "__qualname__", None) if task is not None else None,
+            "stack": "".join(stack.format()),
+        }
+        self.stalls.append(stall)
+        self.count += 1
+        innermost = " <- ".join(f"{os.path.basename(item.filename)}:{item.lineno}:{item.name}"
+                                for item in reversed(stack[-5:]))
+        log_event(logger, logging.WARNING, "event_loop_stall", blocked_ms=stall["blocked_ms"], task=stall["task"],
+                  coroutine=stall["coroutine"], at=innermost)
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+watchdog = LoopStallWatchdog(LOOP_STALL_MS / 1000, LOOP_STALL_INTERVAL_MS / 1000, LOOP_STALL_KEEP)
+
+metrics.collectors.append(lambda: {"event_loop_stalls": {(): watchdog.count}})
+
+
+class ProfilingSettings(BaseModel):
+    sample_rate: float
+
+
+def require_admin(current_user: dict):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+
+
+def find_profile(profile_id: int) -> Dict:
+    entry = profile_store.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return entry
+
+
+router = APIRouter(route_class=AdmissionRoute)
+
+# Recent profiles, newest first (Admin only)
+@router.get("/debug/profiles")
+async def list_profiles(current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    return {"sample_rate": profile_store.sample_rate, "profiles": profile_store.summaries()}
+
+# One profile as a pstats report (Admin only)
+@router.get("/debug/profiles/{profile_id}")
+async def read_profile(profile_id: int, sort: str = "cumulative", limit: int = 40,
+                       current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(SORT_KEYS)}")
+    return PlainTextResponse(render_stats(find_profile(profile_id), sort, limit))
+
+# One profile in the format cProfile's dump_stats writes, for pstats or snakeviz (Admin only)
+@router.get("/debug/profiles/{profile_id}/raw")
+async def download_profile(profile_id: int, current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    return Response(marshal.dumps(find_profile(profile_id)["stats"]), media_type="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'})
+
+# Change the share of requests profiled unasked, e.g. 0.01 while chasing a slow route (Admin only)
+@router.put("/debug/profiling")
+async def update_profiling(settings: ProfilingSettings, current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    if not 0 <= settings.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    profile_store.sample_rate = settings.sample_rate
+    log_event(logger, logging.WARNING, "profiling_sample_rate", sample_rate=settings.sample_rate,
+              admin=current_user['username'])
+    return {"sample_rate": profile_store.sample_rate}
+
+# Recent event loop stalls with the blocking stack, newest first (Admin only)
+@router.get("/debug/stalls")
+async def list_stalls(current_user: dict = Depends(get_current_user)):
+    require_admin(current_user)
+    return {"threshold_ms": LOOP_STALL_MS, "stalls": list(reversed(watchdog.stalls))}
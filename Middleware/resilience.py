@@ -0,0 +1,338 @@
+import asyncio
+import os
+import random
+import time
+from array import array
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from Middleware import metrics
+
+# RESILIENCE_ENABLED=0 makes every upstream call a single plain attempt again
+RESILIENCE_ENABLED = os.getenv("RESILIENCE_ENABLED", "1") == "1"
+
+# Total time one upstream call may take, retries and hedges included
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "1.5"))
+
+# Retries after a failed attempt (connect error, timeout or 5xx), with full
+# jitter backoff. The budget lets retries add at most this fraction of extra
+# load, plus a small per-second allowance so quiet services can still retry.
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF_MS = float(os.getenv("UPSTREAM_RETRY_BACKOFF_MS", "25"))
+UPSTREAM_RETRY_BUDGET = float(os.getenv("UPSTREAM_RETRY_BUDGET", "0.2"))
+UPSTREAM_RETRY_MIN_PER_SECOND = float(os.getenv("UPSTREAM_RETRY_MIN_PER_SECOND", "5"))
+
+# Consecutive failures that open a service's breaker, and how long it stays
+# open before one probe call is let through
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "5"))
+
+# Hedging: when an attempt is still running after the service's observed p95,
+# send a second one and take whichever answers first. Off by default; the
+# hedge budget caps hedges at this fraction of calls.
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "0") == "1"
+UPSTREAM_HEDGE_QUANTILE = float(os.getenv("UPSTREAM_HEDGE_QUANTILE", "0.95"))
+UPSTREAM_HEDGE_BUDGET = float(os.getenv("UPSTREAM_HEDGE_BUDGET", "0.1"))
+UPSTREAM_HEDGE_MIN_SAMPLES = int(os.getenv("UPSTREAM_HEDGE_MIN_SAMPLES", "100"))
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+metrics.help_texts["upstream_breaker_state"] = "Circuit breaker per upstream service: 0 closed, 1 half-open, 2 open."
+metrics.help_texts["upstream_calls_rejected"] = "Upstream calls failed fast by an open breaker."
+metrics.help_texts["upstream_retries"] = "Retry attempts sent to upstream services."
+metrics.help_texts["upstream_retries_denied"] = "Retries skipped because the retry budget was spent."
+metrics.help_texts["upstream_hedges"] = "Hedged second attempts sent to upstream services."
+metrics.help_texts["upstream_hedge_wins"] = "Hedged attempts that answered before the original."
+metrics.help_texts["upstream_hedge_delay_seconds"] = "Current hedge delay (observed latency quantile) per upstream service."
+metrics.counter_names.update(("upstream_calls_rejected", "upstream_retries", "upstream_retries_denied",
+                              "upstream_hedges", "upstream_hedge_wins"))
+
+
+# Raised when an upstream call gives no usable answer: breaker open, deadline
+# passed, or every attempt failed. The order routes turn it into a 503.
+class UpstreamUnavailable(Exception):
+    def __init__(self, service: str, reason: str):
+        super().__init__(f"{service} unavailable: {reason}")
+        self.service = service
+        self.reason = reason
+
+
+# Token bucket fed by traffic: each call deposits `ratio` tokens, a retry (or
+# hedge) spends one, and `min_per_second` tokens trickle in regardless
+class RetryBudget:
+    def __init__(self, ratio: float, min_per_second: float, cap: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.cap = cap
+        self.tokens = cap
+        self._refilled = time.monotonic()
+
+    def deposit(self):
+        now = time.monotonic()
+        self.tokens = min(self.cap, self.tokens + self.ratio + (now - self._refilled) * self.min_per_second)
+        self._refilled = now
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+# Consecutive-failure breaker. While open, calls fail without touching the
+# network; after `reset_after` seconds one probe is allowed (half-open) and
+# its outcome closes or re-opens the breaker. A probe that ends without an
+# outcome (cancelled, or an unexpected error) hands its slot back through
+# release_probe so the next call can probe instead.
+class CircuitBreaker:
+    def __init__(self, failures: int, reset_after: float):
+        self.failure_threshold = failures
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == CLOSED or self.failure_threshold <= 0:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold > 0:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def reset(self):
+        self.record_success()
+
+
+# Recent attempt latencies in a ring buffer; the quantile is recomputed every
+# `refresh` samples rather than sorted on every call
+class LatencyWindow:
+    def __init__(self, size: int = 1024, refresh: int = 64):
+        self.size = size
+        self.refresh = refresh
+        self.samples = array("d")
+        self._next = 0
+        self._since_refresh = 0
+        self.quantile_value: Optional[float] = None
+
+    def add(self, seconds: float, quantile: float):
+        if len(self.samples) < self.size:
+            self.samples.append(seconds)
+        else:
+            self.samples[self._next] = seconds
+            self._next = (self._next + 1) % self.size
+        self._since_refresh += 1
+        if self._since_refresh >= self.refresh:
+            self._since_refresh = 0
+            ordered = sorted(self.samples)
+            self.quantile_value = ordered[min(len(ordered) - 1, int(len(ordered) * quantile))]
+
+    def clear(self):
+        del self.samples[:]
+        self._next = 0
+        self._since_refresh = 0
+        self.quantile_value = None
+
+
+# Breaker, budgets, latency window and counters of one upstream service
+class UpstreamPolicy:
+    def __init__(self, service: str):
+        self.service = service
+        self.breaker = CircuitBreaker(UPSTREAM_BREAKER_FAILURES, UPSTREAM_BREAKER_RESET)
+        self.retry_budget = RetryBudget(UPSTREAM_RETRY_BUDGET, UPSTREAM_RETRY_MIN_PER_SECOND)
+        self.hedge_budget = RetryBudget(UPSTREAM_HEDGE_BUDGET, 0.0, cap=10.0)
+        self.latency = LatencyWindow()
+        self.rejected = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if not UPSTREAM_HEDGE or len(self.latency.samples) < UPSTREAM_HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency.quantile_value
+
+    def reset(self):
+        self.__init__(self.service)
+
+
+policies: Dict[str, UpstreamPolicy] = {}
+
+
+def get_policy(service: str) -> UpstreamPolicy:
+    policy = policies.get(service)
+    if policy is None:
+        policy = policies[service] = UpstreamPolicy(service)
+    return policy
+
+
+def _failed(response: httpx.Response) -> bool:
+    return response.status_code >= 500
+
+
+# One attempt, timed into the latency window. Transport errors and timeouts
+# come back as exceptions, 5xx answers as responses for the caller to judge.
+async def _attempt(policy: UpstreamPolicy, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+    started = time.monotonic()
+    response = await send()
+    if not _failed(response):
+        policy.latency.add(time.monotonic() - started, UPSTREAM_HEDGE_QUANTILE)
+    return response
+
+
+# Run an attempt and, if it is still going after `delay`, a hedge beside it.
+# The first usable answer wins and the other attempt is cancelled.
+async def _hedged(policy: UpstreamPolicy, send, delay: float, timeout: float) -> httpx.Response:
+    first = asyncio.ensure_future(_attempt(policy, send))
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=min(delay, timeout))
+        if not done and policy.hedge_budget.withdraw():
+            policy.hedges += 1
+            tasks.append(asyncio.ensure_future(_attempt(policy, send)))
+        deadline = time.monotonic() + timeout
+        pending = set(tasks)
+        failure: Optional[BaseException] = None
+        response = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, remaining),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is not None:
+                    failure = task.exception()
+                elif _failed(task.result()):
+                    response = task.result()
+                else:
+                    if task is not first:
+                        policy.hedge_wins += 1
+                    return task.result()
+        if response is not None:
+            return response
+        raise failure
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+# Call an upstream service through its breaker, deadline, retries and hedging.
+# `send` performs one HTTP request and is called once per attempt. Returns
+# the first response below 500; raises UpstreamUnavailable otherwise.
+async def call(service: str, send: Callable[[], Awaitable[httpx.Response]],
+               deadline: Optional[float] = None) -> httpx.Response:
+    if not RESILIENCE_ENABLED:
+        return await send()
+    policy = get_policy(service)
+    breaker = policy.breaker
+    if not breaker.allow():
+        policy.rejected += 1
+        raise UpstreamUnavailable(service, "circuit open")
+    # Let through a half-open breaker, this call is its probe until it records an outcome
+    probing = breaker.state == HALF_OPEN
+    policy.retry_budget.deposit()
+    policy.hedge_budget.deposit()
+    give_up_at = time.monotonic() + (deadline if deadline is not None else UPSTREAM_DEADLINE)
+    reason = "deadline exceeded"
+    try:
+        for attempt in range(UPSTREAM_RETRIES + 1):
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                if not breaker.allow():
+                    reason = "circuit open"
+                    break
+                probing = breaker.state == HALF_OPEN
+                if not policy.retry_budget.withdraw():
+                    policy.retries_denied += 1
+                    break
+                policy.retries += 1
+            try:
+                delay = policy.hedge_delay()
+                if delay is not None:
+                    response = await _hedged(policy, send, delay, remaining)
+                else:
+                    response = await asyncio.wait_for(_attempt(policy, send), remaining)
+            except (httpx.TransportError, asyncio.TimeoutError) as exc:
+                reason = type(exc).__name__
+            else:
+                if not _failed(response):
+                    probing = False
+                    breaker.record_success()
+                    return response
+                reason = f"status {response.status_code}"
+            probing = False
+            breaker.record_failure()
+            # Full jitter: sleep a random time up to the exponential backoff step
+            backoff = random.uniform(0, UPSTREAM_RETRY_BACKOFF_MS / 1000 * 2 ** attempt)
+            if attempt < UPSTREAM_RETRIES and backoff < give_up_at - time.monotonic():
+                await asyncio.sleep(backoff)
+    finally:
+        if probing:
+            breaker.release_probe()
+    raise UpstreamUnavailable(service, reason)
+
+
+def reset():
+    for policy in policies.values():
+        policy.reset()
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return {
+        service: {
+            "breaker_state": policy.breaker.state,
+            "consecutive_failures": policy.breaker.failures,
+            "rejected": policy.rejected,
+            "retries": policy.retries,
+            "retries_denied": policy.retries_denied,
+            "hedges": policy.hedges,
+            "hedge_wins": policy.hedge_wins,
+            "hedge_delay_ms": round(policy.latency.quantile_value * 1000, 3)
+            if policy.latency.quantile_value is not None else None,
+        }
+        for service, policy in policies.items()
+    }
+
+
+# Expose breaker state and counters on /metrics
+def _collect_stats():
+    families = {name: {} for name in ("upstream_breaker_state", "upstream_calls_rejected", "upstream_retries",
+                                      "upstream_retries_denied", "upstream_hedges", "upstream_hedge_wins",
+                                      "upstream_hedge_delay_seconds")}
+    for service, policy in policies.items():
+        labels = (("service", service),)
+        families["upstream_breaker_state"][labels] = policy.breaker.state
+        families["upstream_calls_rejected"][labels] = policy.rejected
+        families["upstream_retries"][labels] = policy.retries
+        families["upstream_retries_denied"][labels] = policy.retries_denied
+        families["upstream_hedges"][labels] = policy.hedges
+        families["upstream_hedge_wins"][labels] = policy.hedge_wins
+        families["upstream_hedge_delay_seconds"][labels] = policy.latency.quantile_value or 0.0
+    return families
+
+metrics.collectors.append(_collect_stats)
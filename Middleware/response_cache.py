@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from Middleware import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Number of encoded records kept across all stores
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "50000"))
+
+
+# Same bytes FastAPI's JSON response would send for a plain dict of str/number
+# fields, without the jsonable_encoder walk. orjson is used when installed.
+def encode_json(record: Dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record)
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+# True when an If-None-Match header matches `etag`. Comparison is weak, as
+# RFC 9110 requires for If-None-Match, so W/"x" matches "x".
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+# Encoded JSON body and ETag of each record, keyed by (store, id) and valid
+# for exactly one record version. An update bumps the version, so the stale
+# entry is simply replaced on the next read; deletes drop it explicitly.
+class ResponseCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[int, bytes, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def encoded(self, store: str, record_id: int, version: int, record: Dict) -> Tuple[bytes, str]:
+        key = (store, record_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+        self.misses += 1
+        body = encode_json(record)
+        etag = make_etag(body)
+        if self.max_entries > 0:
+            self._entries[key] = (version, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, etag
+
+    def discard(self, store: str, record_id: int):
+        self._entries.pop((store, record_id), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+
+def _collect_stats():
+    return {f"response_cache_{key}": {(): value} for key, value in response_cache.stats().items()}
+
+metrics.collectors.append(_collect_stats)
+metrics.counter_names.update(f"response_cache_{key}" for key in ("hits", "misses", "not_modified"))
+
+
+# Response for a single-record read: the cached bytes with a strong ETag,
+# or an empty 304 when the client already holds this version
+def record_response(request: Request, store: str, record_id: int, version: int, record: Dict,
+                    cache_control: str = "no-cache") -> Response:
+    body, etag = response_cache.encoded(store, record_id, version, record)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
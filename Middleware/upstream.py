@@ -0,0 +1,305 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+
+from Middleware import metrics, resilience
+from Middleware.authentication import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, fake_users_db
+from Middleware.validation_cache import validation_cache
+from Services.events import take_snapshot
+from Services.read_model import READ_MODEL_CONFIRM_MISSES, read_model
+from Services.multiget import MULTI_GET_MAX
+from Storage.registry import STORAGE_BACKEND, get_repository
+
+# "combined": the customer and product services run in this process and the
+# order service reads their stores directly. "distributed": they are separate
+# processes reached over HTTP at the base URLs below.
+DEPLOYMENT_MODE = os.getenv("DEPLOYMENT_MODE", "combined")
+
+# Base URLs of the services the order service talks to
+CUSTOMER_SERVICE_URL = os.getenv("CUSTOMER_SERVICE_URL", "http://127.0.0.1:3005")
+PRODUCT_SERVICE_URL = os.getenv("PRODUCT_SERVICE_URL", "http://127.0.0.1:3004")
+
+# Connection pool and timeout settings shared by every upstream client
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "1.0"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "2.0"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "1.0"))
+
+# The customer service only answers authenticated calls, so upstream requests
+# carry a token the order service signs for this user
+UPSTREAM_SERVICE_USER = os.getenv("UPSTREAM_SERVICE_USER", "admin_user")
+
+# Snapshots carry every ID of a service, so they get a longer deadline
+READ_MODEL_SNAPSHOT_TIMEOUT = float(os.getenv("READ_MODEL_SNAPSHOT_TIMEOUT", "10"))
+
+# One long-lived client per upstream service, keyed by service name
+clients: Dict[str, httpx.AsyncClient] = {}
+
+service_urls = {
+    "customers": CUSTOMER_SERVICE_URL,
+    "products": PRODUCT_SERVICE_URL,
+}
+
+
+def _build_client(base_url: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        UPSTREAM_READ_TIMEOUT,
+        connect=UPSTREAM_CONNECT_TIMEOUT,
+        pool=UPSTREAM_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout)
+
+
+_service_token = ("", 0.0)
+
+
+# Authorization header for upstream calls, re-signed a minute before the token expires
+def service_headers() -> Dict[str, str]:
+    global _service_token
+    token, renew_at = _service_token
+    if time.monotonic() >= renew_at:
+        user = fake_users_db[UPSTREAM_SERVICE_USER]
+        token = create_access_token(data={"sub": user["username"], "role": user["role"]})
+        _service_token = token, time.monotonic() + ACCESS_TOKEN_EXPIRE_MINUTES * 60 - 60
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Get the shared client for a service, creating it on first use
+def get_client(service: str) -> httpx.AsyncClient:
+    client = clients.get(service)
+    if client is None or client.is_closed:
+        client = _build_client(service_urls[service])
+        clients[service] = client
+    return client
+
+
+# Open the pooled clients (called from the app lifespan); combined mode has no use for them
+async def start_clients():
+    if DEPLOYMENT_MODE == "combined":
+        return
+    for service in service_urls:
+        get_client(service)
+
+
+# Close the pooled clients and release their connections
+async def close_clients():
+    for client in list(clients.values()):
+        await client.aclose()
+    clients.clear()
+
+
+# Ask an upstream service whether a resource exists.
+# Returns True on 200 and False on 404; any other status (e.g. a 401/403/429,
+# or a 5xx with resilience off) means the service cannot answer.
+# Goes through the service's deadline, retries and breaker (see resilience.py).
+async def fetch_exists(service: str, resource_id: int, timeout: Optional[float] = None) -> bool:
+    client = get_client(service)
+    kwargs = {"timeout": timeout} if timeout is not None else {}
+
+    async def send():
+        with metrics.timer("upstream_request_duration_seconds", service=service, call="get"):
+            return await client.get(f"/{service}/{resource_id}", headers=service_headers(), **kwargs)
+
+    response = await resilience.call(service, send)
+    if response.status_code == 200:
+        return True
+    if response.status_code == 404:
+        return False
+    raise resilience.UpstreamUnavailable(service, f"status {response.status_code}")
+
+
+# Check that a single resource exists, going through the validation cache
+async def lookup_exists(service: str, resource_id: int) -> bool:
+    exists = await validation_cache.get_or_load(
+        service, resource_id, lambda: fetch_exists(service, resource_id)
+    )
+    return bool(exists)
+
+
+# The replica's answer for an ID, or None when the service should be asked.
+# In combined mode over SQLite the store is shared by every worker and always
+# current, while a worker's replica hears of other workers' deletes only
+# through the bus, a poll later at best. The store is local there, so it
+# answers and the replica is not consulted.
+def replica_lookup(service: str, resource_id: int) -> Optional[bool]:
+    if DEPLOYMENT_MODE == "combined" and STORAGE_BACKEND == "sqlite":
+        return None
+    return read_model.lookup(service, resource_id)
+
+
+# Check that a single resource exists. The event-fed replica answers when it
+# is loaded; IDs it does not hold are confirmed upstream unless the upstream
+# is unavailable, in which case the replica's answer stands.
+async def resource_exists(service: str, resource_id: int) -> bool:
+    known = replica_lookup(service, resource_id)
+    if known or (known is False and not READ_MODEL_CONFIRM_MISSES):
+        return known
+    try:
+        return await service_client(service).exists(resource_id)
+    except resilience.UpstreamUnavailable:
+        if known is None:
+            raise
+        return False
+
+
+# Verify the customer and the product of an order concurrently
+async def validate_order_refs(customer_id: int, product_id: int):
+    return await asyncio.gather(
+        resource_exists("customers", customer_id),
+        resource_exists("products", product_id),
+    )
+
+
+# Ask an upstream service about many resources with one multi-get call.
+# Falls back to single lookups when the service has no multi-get endpoint;
+# any other unexpected status means the service cannot answer.
+async def fetch_chunk_exists(service: str, resource_ids: List[int]) -> Dict[int, Optional[bool]]:
+    client = get_client(service)
+
+    async def send():
+        with metrics.timer("upstream_request_duration_seconds", service=service, call="lookup"):
+            return await client.post(f"/{service}/lookup", json={"ids": resource_ids}, headers=service_headers())
+
+    response = await resilience.call(service, send)
+    if response.status_code in (404, 405):
+        found = await asyncio.gather(*(fetch_exists(service, resource_id) for resource_id in resource_ids))
+        return dict(zip(resource_ids, found))
+    if response.status_code != 200:
+        raise resilience.UpstreamUnavailable(service, f"lookup status {response.status_code}")
+    body = response.json()
+    id_field = f"{service[:-1]}_id"
+    results: Dict[int, Optional[bool]] = {item[id_field]: True for item in body.get("items", [])}
+    results.update({resource_id: False for resource_id in body.get("missing", [])})
+    return results
+
+
+# Split large ID sets so each multi-get stays within MULTI_GET_MAX
+async def fetch_many_exists(service: str, resource_ids: List[int]) -> Dict[int, Optional[bool]]:
+    chunks = [resource_ids[i:i + MULTI_GET_MAX] for i in range(0, len(resource_ids), MULTI_GET_MAX)]
+    results: Dict[int, Optional[bool]] = {}
+    for found in await asyncio.gather(*(fetch_chunk_exists(service, chunk) for chunk in chunks)):
+        results.update(found)
+    return results
+
+
+# Check a set of resources of one service, each distinct ID once, with the
+# same replica-first rules as resource_exists
+async def validate_many(service: str, resource_ids: Iterable[int]) -> Dict[int, bool]:
+    results: Dict[int, bool] = {}
+    unknown = set()
+    replica_missing = set()
+    for resource_id in set(resource_ids):
+        known = replica_lookup(service, resource_id)
+        if known or (known is False and not READ_MODEL_CONFIRM_MISSES):
+            results[resource_id] = known
+        else:
+            unknown.add(resource_id)
+            if known is False:
+                replica_missing.add(resource_id)
+    if not unknown:
+        return results
+    try:
+        found = await service_client(service).exists_many(unknown)
+    except resilience.UpstreamUnavailable:
+        if len(replica_missing) < len(unknown):
+            raise
+        found = {}
+    results.update({resource_id: bool(found.get(resource_id)) for resource_id in unknown})
+    return results
+
+
+# Snapshot of a service's IDs from its /snapshot endpoint
+async def fetch_service_snapshot(service: str) -> Dict:
+    client = get_client(service)
+
+    async def send():
+        with metrics.timer("upstream_request_duration_seconds", service=service, call="snapshot"):
+            return await client.get(f"/{service}/snapshot", headers=service_headers(),
+                                    timeout=READ_MODEL_SNAPSHOT_TIMEOUT)
+
+    response = await resilience.call(service, send, deadline=READ_MODEL_SNAPSHOT_TIMEOUT)
+    if response.status_code != 200:
+        raise resilience.UpstreamUnavailable(service, f"snapshot status {response.status_code}")
+    return response.json()
+
+
+
+# How the order service asks another service about its resources
+class ServiceClient(ABC):
+    def __init__(self, service: str):
+        self.service = service
+
+    @abstractmethod
+    async def exists(self, resource_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def exists_many(self, resource_ids: Set[int]) -> Dict[int, Optional[bool]]:
+        ...
+
+    # Every ID with the event sequence number it is current to (see events.take_snapshot)
+    @abstractmethod
+    async def snapshot(self) -> Dict:
+        ...
+
+
+# Combined mode: a read of the service's store, with no network hop and
+# nothing to cache
+class LocalServiceClient(ServiceClient):
+    def __init__(self, service: str):
+        super().__init__(service)
+        self.repository = get_repository(service)
+
+    async def exists(self, resource_id: int) -> bool:
+        return await self.repository.get(resource_id) is not None
+
+    async def exists_many(self, resource_ids: Set[int]) -> Dict[int, Optional[bool]]:
+        found = await self.repository.get_many(resource_ids)
+        return {resource_id: resource_id in found for resource_id in resource_ids}
+
+    async def snapshot(self) -> Dict:
+        return await take_snapshot(self.service, self.repository)
+
+
+# Distributed mode: HTTP through the pooled client, the validation cache and
+# the resilience layer
+class HttpServiceClient(ServiceClient):
+    async def exists(self, resource_id: int) -> bool:
+        return await lookup_exists(self.service, resource_id)
+
+    async def exists_many(self, resource_ids: Set[int]) -> Dict[int, Optional[bool]]:
+        return await validation_cache.get_or_load_many(
+            self.service, resource_ids, lambda missing: fetch_many_exists(self.service, missing)
+        )
+
+    async def snapshot(self) -> Dict:
+        return await fetch_service_snapshot(self.service)
+
+
+service_clients: Dict[tuple, ServiceClient] = {}
+
+
+# The client for a service in the current DEPLOYMENT_MODE, created on first use
+def service_client(service: str) -> ServiceClient:
+    key = (DEPLOYMENT_MODE, service)
+    client = service_clients.get(key)
+    if client is None:
+        kind = LocalServiceClient if DEPLOYMENT_MODE == "combined" else HttpServiceClient
+        client = service_clients[key] = kind(service)
+    return client
+
+
+# Snapshot loader for the read model
+async def fetch_snapshot(service: str) -> Dict:
+    return await service_client(service).snapshot()
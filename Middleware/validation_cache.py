@@ -0,0 +1,202 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from Middleware import metrics
+from Services.events import Event, EventBus
+
+# Cache sizing and freshness, overridable from the environment
+VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", "10000"))
+VALIDATION_CACHE_POSITIVE_TTL = float(os.getenv("VALIDATION_CACHE_POSITIVE_TTL", "30"))
+VALIDATION_CACHE_NEGATIVE_TTL = float(os.getenv("VALIDATION_CACHE_NEGATIVE_TTL", "2"))
+
+Key = Tuple[str, int]
+
+
+# Bounded LRU cache of "does this customer/product exist" answers.
+# Found and not-found results expire on separate TTLs, and concurrent
+# misses for the same key share a single upstream lookup. The lookup runs in
+# its own task, so cancelling the request that started it does not cancel it
+# for the others waiting on it.
+class ValidationCache:
+    def __init__(self, max_entries: int, positive_ttl: float, negative_ttl: float):
+        self.max_entries = max_entries
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Key, Tuple[bool, float]]" = OrderedDict()
+        self._inflight: Dict[Key, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def _lookup(self, key: Key) -> Optional[bool]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        exists, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return exists
+
+    def _store(self, key: Key, exists: bool):
+        if self.max_entries <= 0:
+            return
+        ttl = self.positive_ttl if exists else self.negative_ttl
+        self._entries[key] = (exists, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # Return the cached answer or run the loader once for all concurrent callers.
+    # A loader result of None means "unknown" (e.g. upstream error) and is not cached.
+    async def get_or_load(self, service: str, resource_id: int,
+                          loader: Callable[[], Awaitable[Optional[bool]]]) -> Optional[bool]:
+        key = (service, resource_id)
+        exists = self._lookup(key)
+        if exists is not None:
+            self.hits += 1
+            return exists
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        task.add_done_callback(_retrieve_exception)
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Key, loader: Callable[[], Awaitable[Optional[bool]]]) -> Optional[bool]:
+        try:
+            exists = await loader()
+            if exists is not None:
+                self._store(key, exists)
+            return exists
+        finally:
+            self._inflight.pop(key, None)
+
+    # Bulk variant of get_or_load: cached and in-flight IDs are reused and all
+    # remaining misses are resolved with a single call to loader(missing_ids).
+    async def get_or_load_many(self, service: str, resource_ids: Iterable[int],
+                               loader: Callable[[List[int]], Awaitable[Dict[int, Optional[bool]]]]
+                               ) -> Dict[int, Optional[bool]]:
+        results: Dict[int, Optional[bool]] = {}
+        waiting: Dict[int, asyncio.Future] = {}
+        owned: Dict[int, asyncio.Future] = {}
+        for resource_id in resource_ids:
+            key = (service, resource_id)
+            exists = self._lookup(key)
+            if exists is not None:
+                self.hits += 1
+                results[resource_id] = exists
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[resource_id] = self._inflight[key]
+            else:
+                self.misses += 1
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[key] = future
+                owned[resource_id] = future
+
+        if owned:
+            task = asyncio.ensure_future(self._load_many(service, owned, loader))
+            task.add_done_callback(_retrieve_exception)
+            results.update(await asyncio.shield(task))
+
+        for resource_id, future in waiting.items():
+            results[resource_id] = await asyncio.shield(future)
+        return results
+
+    # Load the IDs this caller owns and settle their futures, for this caller
+    # and for any concurrent caller waiting on one of them
+    async def _load_many(self, service: str, owned: Dict[int, asyncio.Future],
+                         loader: Callable[[List[int]], Awaitable[Dict[int, Optional[bool]]]]
+                         ) -> Dict[int, Optional[bool]]:
+        try:
+            loaded = await loader(list(owned))
+        except BaseException as exc:
+            for future in owned.values():
+                if isinstance(exc, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(exc)
+                    future.exception()
+            raise
+        else:
+            results = {}
+            for resource_id, future in owned.items():
+                exists = loaded.get(resource_id)
+                if exists is not None:
+                    self._store((service, resource_id), exists)
+                future.set_result(exists)
+                results[resource_id] = exists
+            return results
+        finally:
+            for resource_id in owned:
+                self._inflight.pop((service, resource_id), None)
+
+    # Drop what we know about a resource after it is created, changed or removed
+    def invalidate(self, service: str, resource_id: int):
+        if self._entries.pop((service, resource_id), None) is not None:
+            self.invalidations += 1
+
+    # Customer and product events name the service as topic, so a create,
+    # product update or delete drops the cached answer in every process on the bus
+    def handle_event(self, event: Event):
+        self.invalidate(event["topic"], event["id"])
+
+    def subscribe(self, bus: EventBus, topics: Iterable[str] = ("customers", "products")):
+        for topic in topics:
+            bus.subscribe(topic, self.handle_event)
+
+    def unsubscribe(self, bus: EventBus, topics: Iterable[str] = ("customers", "products")):
+        for topic in topics:
+            bus.unsubscribe(topic, self.handle_event)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Mark a background lookup's exception as retrieved when its caller is gone
+def _retrieve_exception(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+
+validation_cache = ValidationCache(
+    VALIDATION_CACHE_SIZE,
+    VALIDATION_CACHE_POSITIVE_TTL,
+    VALIDATION_CACHE_NEGATIVE_TTL,
+)
+
+
+# Expose the counters on /metrics
+def _collect_stats():
+    return {f"validation_cache_{key}": {(): value} for key, value in validation_cache.stats().items()}
+
+metrics.collectors.append(_collect_stats)
+metrics.counter_names.update(f"validation_cache_{key}"
+                              for key in ("hits", "misses", "coalesced", "evictions", "invalidations"))
+
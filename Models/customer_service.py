@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, List
+from Services.multiget import MultiGetRequest, check_ids, parse_ids
 
 app = FastAPI()
 
@@ -20,6 +21,25 @@ def create_customer(customer: Customer):
     next_customer_id += 1
     return {"customer_id": customer_id}
 
+# Collect the requested customers and report the IDs that do not exist
+def lookup_customers(ids: List[int]):
+    items = []
+    missing = []
+    for customer_id in ids:
+        if customer_id in customers:
+            items.append({"customer_id": customer_id, **customers[customer_id]})
+        else:
+            missing.append(customer_id)
+    return {"items": items, "missing": missing}
+
+@app.get("/customers")
+def get_customers(ids: str):
+    return lookup_customers(parse_ids(ids))
+
+@app.post("/customers/lookup")
+def lookup_customers_post(request: MultiGetRequest):
+    return lookup_customers(check_ids(request.ids))
+
 @app.get("/customers/{customer_id}")
 def get_customer(customer_id: int):
     if customer_id in customers:
@@ -1,9 +1,21 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Dict
-import httpx
+from contextlib import asynccontextmanager
+from Middleware import upstream
 
-app = FastAPI()
+# This app serves orders only: customers and products always live in other
+# processes, so they are checked over HTTP whatever DEPLOYMENT_MODE says
+upstream.DEPLOYMENT_MODE = "distributed"
+
+# Open the pooled upstream clients on startup and close them on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream.start_clients()
+    yield
+    await upstream.close_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 # In-memory store for orders
 orders: Dict[int, Dict] = {}
@@ -16,16 +28,12 @@ class Order(BaseModel):
 
 @app.post("/orders", status_code=201)
 async def create_order(order: Order):
-    async with httpx.AsyncClient() as client:
-        # Verify customer
-        customer_response = await client.get(f'http://127.0.0.1:3005/customers/{order.customer_id}')
-        if customer_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Customer not found")
-        
-        # Verify product
-        product_response = await client.get(f'http://127.0.0.1:3004/products/{order.product_id}')
-        if product_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Product not found")
+    # Verify customer and product concurrently over the shared upstream clients
+    customer_ok, product_ok = await upstream.validate_order_refs(order.customer_id, order.product_id)
+    if not customer_ok:
+        raise HTTPException(status_code=400, detail="Customer not found")
+    if not product_ok:
+        raise HTTPException(status_code=400, detail="Product not found")
     
     global next_order_id
     order_id = next_order_id
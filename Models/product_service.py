@@ -3,11 +3,12 @@ from pydantic import BaseModel
 from typing import Dict
 from fastapi import FastAPI, Depends, HTTPException, status
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
+from Services.multiget import MultiGetRequest, check_ids, parse_ids
 
 app = FastAPI()
 
@@ -33,6 +34,25 @@ def create_product(product: Product):
     next_product_id += 1
     return {"product_id": product_id}
 
+# Collect the requested products and report the IDs that do not exist
+def lookup_products(ids: List[int]):
+    items = []
+    missing = []
+    for product_id in ids:
+        if product_id in products:
+            items.append({"product_id": product_id, **products[product_id]})
+        else:
+            missing.append(product_id)
+    return {"items": items, "missing": missing}
+
+@app.get("/products")
+def get_products(ids: str):
+    return lookup_products(parse_ids(ids))
+
+@app.post("/products/lookup")
+def lookup_products_post(request: MultiGetRequest):
+    return lookup_products(check_ids(request.ids))
+
 @app.get("/products/{product_id}")
 def get_product(product_id: int):
     if product_id in products:
@@ -1,5 +1,7 @@
+import json
+import os
 from pydantic import BaseModel
-from passlib.context import CryptContext
+from Middleware.passwords import get_pwd_context
 
 # User model for registration
 class User(BaseModel):
@@ -7,32 +9,17 @@ class User(BaseModel):
     password: str
     role: str  
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Function to verify passwords
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 # Function to get hashed password
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
-# In-memory user database with hashed passwords
-fake_users_db = {
-    "admin": {
-        "username": "admin",
-        "full_name": "Administrator",
-        "hashed_password": get_password_hash("puffdaddy"),  # Store hashed password
-        "role": "admin",
-    },
-    "customer": {
-        "username": "customer",
-        "full_name": "Lemar Odom",
-        "hashed_password": get_password_hash("Lakers"),  # Store hashed password
-        "role": "customer",
-    },
-}
+# In-memory user database, seeded with precomputed password hashes
+with open(os.path.join(os.path.dirname(__file__), "users.json")) as seed:
+    fake_users_db = json.load(seed)
 
 # function to register a new user 
 def register_user(username: str, password: str, role: str):
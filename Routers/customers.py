@@ -1,69 +1,146 @@
-from fastapi import FastAPI, HTTPException, Depends, APIRouter
+from fastapi import HTTPException, Depends, APIRouter, Request
 from pydantic import BaseModel, EmailStr
-from typing import Dict
-from fastapi.security import OAuth2PasswordBearer
+from typing import List, Optional
+from Middleware.admission import AdmissionRoute
 from Middleware.authentication import get_current_user  
+from Middleware.response_cache import record_response, response_cache
+from Services.ndjson import Chunk, ImportReport, export_ndjson, import_ndjson
+from Services.events import publish, take_snapshot
+from Services.pagination import decode_id_cursor, page_limit, page_response
+from Services.multiget import MultiGetRequest, check_ids, parse_ids
+from Storage.registry import get_repository
 
-app = FastAPI()
-router = APIRouter()
+router = APIRouter(route_class=AdmissionRoute)
 
-# In-memory store for customers
-customers: Dict[int, Dict] = {}
-next_customer_id = 1
+# Customer store (in-memory or SQLite, see Storage/registry.py)
+customers = get_repository("customers")
 
 class Customer(BaseModel):
     name: str
     email: EmailStr  
 
-# OAuth2 scheme for getting the token
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-# Get current user and check role
-async def get_current_user_and_role(token: str = Depends(oauth2_scheme)):
-    user = await get_current_user(token)
-    return user  
-
 # Customer Management Endpoints
 @router.post("/customers", status_code=201) 
-async def create_customer(customer: Customer, current_user: dict = Depends(get_current_user_and_role)):
+async def create_customer(customer: Customer, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Not enough privileges")
 
-    global next_customer_id
-    customer_id = next_customer_id
-    customers[customer_id] = customer.dict()
-    next_customer_id += 1
+    customer_id = await customers.create(customer.dict())
+    publish("customers", "created", customer_id)
     return {"customer_id": customer_id}
 
+# Collect the requested customers, applying the same per-record rules as get_customer
+async def lookup_customers(ids: List[int], current_user: dict):
+    found = await customers.get_many(ids)
+    items = []
+    missing = []
+    forbidden = []
+    for customer_id in ids:
+        customer = found.get(customer_id)
+        if customer is None:
+            missing.append(customer_id)
+        elif current_user['role'] != 'admin' and current_user['username'] != customer['email']:
+            forbidden.append(customer_id)
+        else:
+            items.append({"customer_id": customer_id, **customer})
+    return {"items": items, "missing": missing, "forbidden": forbidden}
+
+# List customers. With ?ids=1,2,3 this is a multi-get; otherwise it returns one
+# keyset page in ID order, optionally filtered by email. Non-admins only ever
+# see the records registered under their own email.
+@router.get("/customers")
+async def get_customers(ids: Optional[str] = None,
+                        email: Optional[str] = None,
+                        cursor: Optional[str] = None,
+                        limit: int = Depends(page_limit),
+                        current_user: dict = Depends(get_current_user)):
+    if ids is not None:
+        return await lookup_customers(parse_ids(ids), current_user)
+    if current_user['role'] != 'admin':
+        if email is not None and email != current_user['username']:
+            raise HTTPException(status_code=403, detail="Not enough privileges")
+        email = current_user['username']
+    after_id = decode_id_cursor(cursor)
+    if email is None:
+        page = await customers.list_page(limit, after_id=after_id)
+    else:
+        page = await customers.list_page(limit, after_id=after_id, field="email", value=email)
+    return page_response(page, "customer_id", limit)
+
+# Same as GET /customers?ids=... for ID sets too large for a query string
+@router.post("/customers/lookup")
+async def lookup_customers_post(request: MultiGetRequest, current_user: dict = Depends(get_current_user)):
+    return await lookup_customers(check_ids(request.ids), current_user)
+
+# Every customer ID with the event sequence it is current to, for the order
+# service's read model (IDs only, like the existence checks it replaces).
+# Admin only: the order service calls it with its service token.
+@router.get("/customers/snapshot", include_in_schema=False)
+async def get_customers_snapshot(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    return await take_snapshot("customers", customers)
+
+# Bulk-create customers from an NDJSON body, one customer object per line.
+# Stored in chunks as the body streams in; rejected lines are reported.
+@router.post("/customers/import")
+async def import_customers(request: Request, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+
+    async def insert(chunk: Chunk, report: ImportReport):
+        for customer_id in await customers.create_many([record for _, record in chunk]):
+            publish("customers", "created", customer_id)
+        report.created += len(chunk)
+
+    return await import_ndjson(request, Customer, insert)
+
+# Stream every customer as NDJSON, in ID order
+@router.get("/customers/export")
+async def export_customers(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    return export_ndjson(customers, "customer_id", "customers.ndjson")
+
+# Admins may access every customer; other users only the records under their email,
+# which are resolved through the email index instead of loading the record
+async def can_access_customer(customer_id: int, current_user: dict) -> bool:
+    if current_user['role'] == 'admin':
+        return True
+    return customer_id in await customers.find_ids("email", current_user['username'])
+
+# Access is checked before the cache is consulted, so a 304 is only ever
+# sent to a user who may read the record
 @router.get("/customers/{customer_id}") 
-async def get_customer(customer_id: int, current_user: dict = Depends(get_current_user_and_role)):
-    if current_user['role'] != 'admin' and current_user['username'] != customers[customer_id]['email']:
+async def get_customer(customer_id: int, request: Request, current_user: dict = Depends(get_current_user)):
+    if not await can_access_customer(customer_id, current_user):
         raise HTTPException(status_code=403, detail="Not enough privileges")
-    if customer_id in customers:
-        return customers[customer_id]
+    found = await customers.get_versioned(customer_id)
+    if found is not None:
+        version, customer = found
+        return record_response(request, "customers", customer_id, version, customer,
+                               cache_control="private, no-cache")
     else:
         raise HTTPException(status_code=404, detail="Customer not found")
 
 @router.put("/customers/{customer_id}")  
-async def update_customer(customer_id: int, customer: Customer, current_user: dict = Depends(get_current_user_and_role)):
-    if current_user['role'] != 'admin' and current_user['username'] != customers[customer_id]['email']:
+async def update_customer(customer_id: int, customer: Customer, current_user: dict = Depends(get_current_user)):
+    if not await can_access_customer(customer_id, current_user):
         raise HTTPException(status_code=403, detail="Not enough privileges")
 
-    if customer_id in customers:
-        customers[customer_id] = customer.dict()
+    if await customers.update(customer_id, customer.dict()):
         return {"msg": "Customer updated"}
     else:
         raise HTTPException(status_code=404, detail="Customer not found")
 
 @router.delete("/customers/{customer_id}", status_code=204) 
-async def delete_customer(customer_id: int, current_user: dict = Depends(get_current_user_and_role)):
+async def delete_customer(customer_id: int, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Not enough privileges")
 
-    if customer_id in customers:
-        del customers[customer_id]
+    if await customers.delete(customer_id):
+        publish("customers", "deleted", customer_id)
+        response_cache.discard("customers", customer_id)
         return
     else:
         raise HTTPException(status_code=404, detail="Customer not found")
-
-app.include_router(router)
@@ -1,103 +1,327 @@
-import httpx
-from fastapi import FastAPI, HTTPException, Depends, APIRouter
-from pydantic import BaseModel, PositiveInt
-from typing import Dict
-from fastapi.security import OAuth2PasswordBearer
+import asyncio
+from fastapi import HTTPException, Depends, APIRouter, Query, Request
+from pydantic import BaseModel, PositiveInt, ValidationError
+from typing import Any, Dict, List, Literal, Optional
+from Middleware.admission import AdmissionRoute
 from Middleware.authentication import get_current_user
+from Middleware import upstream
+from Middleware.resilience import UpstreamUnavailable
+from Middleware.validation_cache import validation_cache
+from Middleware.log import log_event
+from Services.ndjson import Chunk, ImportReport, export_ndjson, import_ndjson
+from Services.read_model import read_model
+from Services.analytics import order_aggregates, revenue, scan, top_n
+from Services.multiget import parse_ids
+from Storage.registry import get_repository
+from Services.pagination import decode_id_cursor, page_limit, page_response
 import logging
+import os
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("orders")
 
-app = FastAPI()
-router = APIRouter()
+router = APIRouter(route_class=AdmissionRoute)
 
-# In-memory store for orders
-orders: Dict[int, Dict] = {}
-next_order_id = 1
+# Order store (in-memory or SQLite, see Storage/registry.py)
+orders = get_repository("orders")
+# Prices for revenue analytics come from the product store
+products = get_repository("products")
+
+# Largest number of orders accepted by a single batch request
+ORDER_BATCH_MAX = int(os.getenv("ORDER_BATCH_MAX", "1000"))
 
 class Order(BaseModel):
     customer_id: int
     product_id: int
     quantity: PositiveInt 
 
-# OAuth2 scheme for getting the token
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-# Get current user and check role
-async def get_current_user_and_role(token: str = Depends(oauth2_scheme)):
-    user = await get_current_user(token)
-    return user
+# A customer or product service that cannot answer makes the order
+# unverifiable: 503 so the client retries, rather than a 400 or a 500
+def upstream_unavailable(exc: UpstreamUnavailable) -> HTTPException:
+    log_event(logger, logging.ERROR, "upstream_unavailable", service=exc.service, reason=exc.reason)
+    return HTTPException(status_code=503, detail=f"{exc.service.capitalize()} service unavailable",
+                         headers={"Retry-After": "1"})
 
 # Create a new order (Customer only)
 @router.post("/orders", status_code=201)
-async def create_order(order: Order, current_user: dict = Depends(get_current_user_and_role)):
+async def create_order(order: Order, current_user: dict = Depends(get_current_user)):
     # Ensure the user is a customer
     if current_user['role'] != 'customer':
-        logging.warning(f"Unauthorized access attempt by {current_user['username']}")
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="create_order")
         raise HTTPException(status_code=403, detail="Not enough privileges")
     
-    async with httpx.AsyncClient() as client:
-        # Verify customer
-        customer_response = await client.get(f'http://127.0.0.1:3005/customers/{order.customer_id}')
-        if customer_response.status_code != 200:
-            logging.error(f"Customer with ID {order.customer_id} not found.")
-            raise HTTPException(status_code=400, detail="Customer not found")
-        
-        # Verify product
-        product_response = await client.get(f'http://127.0.0.1:3004/products/{order.product_id}')
-        if product_response.status_code != 200:
-            logging.error(f"Product with ID {order.product_id} not found.")
-            raise HTTPException(status_code=400, detail="Product not found")
+    # Verify customer and product concurrently over the shared upstream clients
+    try:
+        customer_ok, product_ok = await upstream.validate_order_refs(order.customer_id, order.product_id)
+    except UpstreamUnavailable as exc:
+        raise upstream_unavailable(exc)
+    if not customer_ok:
+        log_event(logger, logging.ERROR, "customer_not_found", customer_id=order.customer_id)
+        raise HTTPException(status_code=400, detail="Customer not found")
+    if not product_ok:
+        log_event(logger, logging.ERROR, "product_not_found", product_id=order.product_id)
+        raise HTTPException(status_code=400, detail="Product not found")
     
-    global next_order_id
-    order_id = next_order_id
-    orders[order_id] = order.dict()
-    next_order_id += 1
-    logging.info(f"Order created with ID: {order_id} by customer ID: {order.customer_id}")
+    async with order_aggregates.lock:
+        order_id = await orders.create(order.dict())
+        order_aggregates.order_added(order.dict())
+    log_event(logger, logging.INFO, "order_created", order_id=order_id, customer_id=order.customer_id)
     return {"order_id": order_id}
 
+# Create many orders in one request (Customer only).
+# Each row gets its own result, so one bad row does not fail the batch.
+@router.post("/orders/batch")
+async def create_orders_batch(batch: List[Any], current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'customer':
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="create_orders_batch")
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    if len(batch) > ORDER_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {ORDER_BATCH_MAX} orders")
+
+    # Validate every row in one pass, collecting per-row errors
+    results: List[Dict[str, Any]] = [{"index": index} for index in range(len(batch))]
+    parsed: Dict[int, Order] = {}
+    for index, item in enumerate(batch):
+        if not isinstance(item, dict):
+            results[index]["error"] = "Invalid order"
+            results[index]["detail"] = "Order must be a JSON object"
+            continue
+        try:
+            parsed[index] = Order(**item)
+        except ValidationError as exc:
+            results[index]["error"] = "Invalid order"
+            results[index]["detail"] = str(exc)
+
+    # Check each distinct customer and product only once
+    try:
+        customer_ok, product_ok = await asyncio.gather(
+            upstream.validate_many("customers", {order.customer_id for order in parsed.values()}),
+            upstream.validate_many("products", {order.product_id for order in parsed.values()}),
+        )
+    except UpstreamUnavailable as exc:
+        raise upstream_unavailable(exc)
+    valid = []
+    for index, order in parsed.items():
+        if not customer_ok[order.customer_id]:
+            results[index]["error"] = "Customer not found"
+        elif not product_ok[order.product_id]:
+            results[index]["error"] = "Product not found"
+        else:
+            valid.append((index, order))
+
+    # Allocate the IDs of the accepted orders as one contiguous block
+    records = [order.dict() for _, order in valid]
+    async with order_aggregates.lock:
+        order_ids = await orders.create_many(records)
+        order_aggregates.orders_added(records)
+    for (index, _), order_id in zip(valid, order_ids):
+        results[index]["order_id"] = order_id
+    log_event(logger, logging.INFO, "order_batch_processed", rows=len(batch), created=len(valid), user=current_user['username'])
+    return {"created": len(valid), "failed": len(batch) - len(valid), "results": results}
+
+def require_admin(current_user: dict, action: str):
+    if current_user['role'] != 'admin':
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action=action)
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+
+# Bulk-load orders from an NDJSON body, one order object per line (Admin only).
+# Each chunk's customers and products are checked like a batch; when a service
+# cannot answer, that chunk's lines fail and the import carries on.
+@router.post("/orders/import")
+async def import_orders(request: Request, current_user: dict = Depends(get_current_user)):
+    require_admin(current_user, "import_orders")
+
+    async def insert(chunk: Chunk, report: ImportReport):
+        try:
+            customer_ok, product_ok = await asyncio.gather(
+                upstream.validate_many("customers", {record["customer_id"] for _, record in chunk}),
+                upstream.validate_many("products", {record["product_id"] for _, record in chunk}),
+            )
+        except UpstreamUnavailable as exc:
+            for line, _ in chunk:
+                report.fail(line, f"{exc.service.capitalize()} service unavailable")
+            return
+        records = []
+        for line, record in chunk:
+            if not customer_ok[record["customer_id"]]:
+                report.fail(line, "Customer not found")
+            elif not product_ok[record["product_id"]]:
+                report.fail(line, "Product not found")
+            else:
+                records.append(record)
+        async with order_aggregates.lock:
+            await orders.create_many(records)
+            order_aggregates.orders_added(records)
+        report.created += len(records)
+
+    report = await import_ndjson(request, Order, insert)
+    log_event(logger, logging.INFO, "orders_imported", created=report["created"], failed=report["failed"],
+              admin=current_user['username'])
+    return report
+
+# Stream every order as NDJSON, in ID order (Admin only)
+@router.get("/orders/export")
+async def export_orders(current_user: dict = Depends(get_current_user)):
+    require_admin(current_user, "export_orders")
+    return export_ndjson(orders, "order_id", "orders.ndjson")
+
+class CacheInvalidation(BaseModel):
+    service: Literal["customers", "products"]
+    resource_id: int
+
+# Validation cache counters, used to size the cache (Admin only)
+@router.get("/orders/validation-cache/stats")
+async def validation_cache_stats(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    return validation_cache.stats()
+
+# Invalidation events from the customer and product services (Admin only)
+@router.post("/orders/validation-cache/invalidate", status_code=204)
+async def invalidate_validation_cache(event: CacheInvalidation, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    validation_cache.invalidate(event.service, event.resource_id)
+    return
+
+# Replica state per topic: size, sequence, staleness, gaps and resyncs (Admin only)
+@router.get("/orders/read-model/stats")
+async def read_model_stats(current_user: dict = Depends(get_current_user)):
+    require_admin(current_user, "read_model_stats")
+    return read_model.stats()
+
+# Reload the replica from the services' snapshots, e.g. after restoring a backup (Admin only)
+@router.post("/orders/read-model/resync")
+async def resync_read_model(topic: Optional[Literal["customers", "products"]] = None,
+                            current_user: dict = Depends(get_current_user)):
+    require_admin(current_user, "resync_read_model")
+    resynced = await read_model.resync(topic)
+    return {"resynced": resynced, "stats": read_model.stats()}
+
+# Per-product and per-customer totals come from the incrementally maintained
+# aggregates, rebuilt first when the store has writes they did not see (e.g.
+# from another worker); fresh=true recomputes them with a full vectorized scan.
+async def order_totals(fresh: bool):
+    if fresh:
+        return await scan(orders)
+    await order_aggregates.ensure_ready(orders)
+    return order_aggregates.by_product, order_aggregates.by_customer
+
+async def product_prices(product_ids) -> Dict[int, Optional[float]]:
+    found = await products.get_many(product_ids)
+    return {product_id: record["price"] for product_id, record in found.items()}
+
+# Units, order count and revenue per product, for ?ids=1,2,3 or every ordered product (Admin only)
+@router.get("/orders/analytics/products")
+async def product_analytics(ids: Optional[str] = None, fresh: bool = False,
+                            current_user: dict = Depends(get_current_user)):
+    require_admin(current_user, "product_analytics")
+    by_product, _ = await order_totals(fresh)
+    product_ids = parse_ids(ids) if ids is not None else sorted(by_product)
+    totals = {product_id: by_product.get(product_id, [0, 0]) for product_id in product_ids}
+    prices = await product_prices(product_ids)
+    amounts = revenue(totals, prices)
+    return {"items": [
+        {"product_id": product_id, "units": totals[product_id][0], "orders": totals[product_id][1],
+         "price": prices.get(product_id), "revenue": amounts[product_id]}
+        for product_id in product_ids
+    ]}
+
+# Units and order count per customer, for ?ids=1,2,3 or every ordering customer (Admin only)
+@router.get("/orders/analytics/customers")
+async def customer_analytics(ids: Optional[str] = None, fresh: bool = False,
+                             current_user: dict = Depends(get_current_user)):
+    require_admin(current_user, "customer_analytics")
+    _, by_customer = await order_totals(fresh)
+    customer_ids = parse_ids(ids) if ids is not None else sorted(by_customer)
+    return {"items": [
+        {"customer_id": customer_id, "units": by_customer.get(customer_id, [0, 0])[0],
+         "orders": by_customer.get(customer_id, [0, 0])[1]}
+        for customer_id in customer_ids
+    ]}
+
+# The n best-selling products by revenue, units or order count (Admin only)
+@router.get("/orders/analytics/top-products")
+async def top_products(n: int = Query(10, ge=1, le=1000),
+                       by: Literal["revenue", "units", "orders"] = "revenue",
+                       fresh: bool = False,
+                       current_user: dict = Depends(get_current_user)):
+    require_admin(current_user, "top_products")
+    by_product, _ = await order_totals(fresh)
+    if by == "revenue":
+        values = revenue(by_product, await product_prices(list(by_product)))
+    else:
+        column = 0 if by == "units" else 1
+        values = {product_id: totals[column] for product_id, totals in by_product.items()}
+    return {"by": by, "items": [{"product_id": product_id, by: value} for product_id, value in top_n(values, n)]}
+
+# List orders in ID order, one keyset page at a time, optionally only those of
+# one customer or one product (Available to all users)
+@router.get("/orders")
+async def list_orders(customer_id: Optional[int] = None,
+                      product_id: Optional[int] = None,
+                      cursor: Optional[str] = None,
+                      limit: int = Depends(page_limit),
+                      current_user: dict = Depends(get_current_user)):
+    if customer_id is not None and product_id is not None:
+        raise HTTPException(status_code=400, detail="Filter by customer_id or product_id, not both")
+    after_id = decode_id_cursor(cursor)
+    if customer_id is not None:
+        page = await orders.list_page(limit, after_id=after_id, field="customer_id", value=customer_id)
+    elif product_id is not None:
+        page = await orders.list_page(limit, after_id=after_id, field="product_id", value=product_id)
+    else:
+        page = await orders.list_page(limit, after_id=after_id)
+    return page_response(page, "order_id", limit)
+
 # Get an order by ID (Available to all users)
 @router.get("/orders/{order_id}")
-async def get_order(order_id: int, current_user: dict = Depends(get_current_user_and_role)):
-    if order_id in orders:
-        logging.info(f"Order {order_id} retrieved successfully.")
-        return orders[order_id]
+async def get_order(order_id: int, current_user: dict = Depends(get_current_user)):
+    order = await orders.get(order_id)
+    if order is not None:
+        log_event(logger, logging.INFO, "order_retrieved", order_id=order_id)
+        return order
     else:
-        logging.error(f"Order with ID {order_id} not found.")
+        log_event(logger, logging.ERROR, "order_not_found", order_id=order_id)
         raise HTTPException(status_code=404, detail="Order not found")
 
 # Update an order (Admin only)
 @router.put("/orders/{order_id}")
-async def update_order(order_id: int, order: Order, current_user: dict = Depends(get_current_user_and_role)):
+async def update_order(order_id: int, order: Order, current_user: dict = Depends(get_current_user)):
     # Ensure the user is an admin
     if current_user['role'] != 'admin':
-        logging.warning(f"Unauthorized access attempt by {current_user['username']} to update order {order_id}")
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="update_order", order_id=order_id)
         raise HTTPException(status_code=403, detail="Not enough privileges")
     
-    if order_id in orders:
-        orders[order_id] = order.dict()
-        logging.info(f"Order {order_id} updated by admin {current_user['username']}")
+    # The previous version is only needed to keep live aggregates current; the
+    # lock keeps another change from landing between reading and replacing it
+    async with order_aggregates.lock:
+        before = await orders.get(order_id) if order_aggregates.ready else None
+        updated = await orders.update(order_id, order.dict())
+        if updated and before is not None:
+            order_aggregates.order_changed(before, order.dict())
+    if updated:
+        log_event(logger, logging.INFO, "order_updated", order_id=order_id, admin=current_user['username'])
         return {"msg": "Order updated"}
     else:
-        logging.error(f"Order with ID {order_id} not found for update.")
+        log_event(logger, logging.ERROR, "order_not_found", order_id=order_id, action="update_order")
         raise HTTPException(status_code=404, detail="Order not found")
 
 # Delete an order (Admin only)
 @router.delete("/orders/{order_id}", status_code=204)
-async def delete_order(order_id: int, current_user: dict = Depends(get_current_user_and_role)):
+async def delete_order(order_id: int, current_user: dict = Depends(get_current_user)):
     # Ensure the user is an admin
     if current_user['role'] != 'admin':
-        logging.warning(f"Unauthorized access attempt by {current_user['username']} to delete order {order_id}")
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="delete_order", order_id=order_id)
         raise HTTPException(status_code=403, detail="Not enough privileges")
     
-    if order_id in orders:
-        del orders[order_id]
-        logging.info(f"Order {order_id} deleted by admin {current_user['username']}")
+    async with order_aggregates.lock:
+        before = await orders.get(order_id) if order_aggregates.ready else None
+        deleted = await orders.delete(order_id)
+        if deleted and before is not None:
+            order_aggregates.order_removed(before)
+    if deleted:
+        log_event(logger, logging.INFO, "order_deleted", order_id=order_id, admin=current_user['username'])
         return
     else:
-        logging.error(f"Order with ID {order_id} not found for deletion.")
+        log_event(logger, logging.ERROR, "order_not_found", order_id=order_id, action="delete_order")
         raise HTTPException(status_code=404, detail="Order not found")
-
-# Add the router to the app
-app.include_router(router)
@@ -1,91 +1,201 @@
 import logging
-from fastapi import FastAPI, HTTPException, Depends, APIRouter
+from fastapi import HTTPException, Depends, APIRouter, Query, Request
 from pydantic import BaseModel, PositiveFloat
-from typing import Dict
-from fastapi.security import OAuth2PasswordBearer
+from typing import List, Literal, Optional
+from Middleware.admission import AdmissionRoute
 from Middleware.authentication import get_current_user 
+from Middleware.log import log_event
+from Middleware.response_cache import record_response, response_cache
+from Services.search import search_index
+from Services.ndjson import Chunk, ImportReport, export_ndjson, import_ndjson
+from Services.events import publish, take_snapshot
+from Services.pagination import decode_id_cursor, decode_keyset_cursor, encode_cursor, page_limit, page_response
+from Services.multiget import MultiGetRequest, check_ids, parse_ids
+from Storage.registry import get_repository
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("products")
 
-app = FastAPI()
-router = APIRouter()
+router = APIRouter(route_class=AdmissionRoute)
 
-# In-memory store for products
-products: Dict[int, Dict] = {}
-next_product_id = 1
+# Product store (in-memory or SQLite, see Storage/registry.py)
+products = get_repository("products")
 
 class Product(BaseModel):
     name: str
     price: PositiveFloat
     description: str
 
-# OAuth2 scheme for getting the token
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-# Get current user and check role
-async def get_current_user_and_role(token: str = Depends(oauth2_scheme)):
-    user = await get_current_user(token)
-    return user 
-
 # Create a new product (Admin only)
 @router.post("/products", status_code=201)
-async def create_product(product: Product, current_user: dict = Depends(get_current_user_and_role)):
-    logging.info(f"Current user: {current_user}")
-    
+async def create_product(product: Product, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
-        logging.warning(f"Unauthorized access attempt by {current_user['username']} to create a product.")
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="create_product")
         raise HTTPException(status_code=403, detail="Not enough privileges")
     
-    logging.info(f"User {current_user['username']} has admin privileges. Proceeding with product creation.")
-    
-    global next_product_id
-    product_id = next_product_id
-    products[product_id] = product.dict()
-    next_product_id += 1
-    logging.info(f"Product created with ID: {product_id} by admin: {current_user['username']}")
+    # Writes run under the search index's lock (see ProductSearchIndex)
+    async with search_index.lock:
+        product_id = await products.create(product.dict())
+        search_index.product_added(product_id, product.dict())
+    publish("products", "created", product_id)
+    log_event(logger, logging.INFO, "product_created", product_id=product_id, admin=current_user['username'])
     
     return {"product_id": product_id}
 
-# Get a product by ID (Available to all)
-@app.get("/products/{product_id}")
-async def get_product(product_id: int):
-    if product_id in products:
-        logging.info(f"Product {product_id} retrieved successfully.")
-        return products[product_id]
+# Collect the requested products and report the IDs that do not exist
+async def lookup_products(ids: List[int]):
+    found = await products.get_many(ids)
+    items = []
+    missing = []
+    for product_id in ids:
+        if product_id in found:
+            items.append({"product_id": product_id, **found[product_id]})
+        else:
+            missing.append(product_id)
+    return {"items": items, "missing": missing}
+
+# List products (Available to all).
+# With ?ids=1,2,3 this is a multi-get; otherwise it returns one keyset page,
+# in ID order or, with a price filter or sort=price, in price order.
+@router.get("/products")
+async def get_products(ids: Optional[str] = None,
+                       min_price: Optional[float] = None,
+                       max_price: Optional[float] = None,
+                       sort: Literal["id", "price"] = "id",
+                       cursor: Optional[str] = None,
+                       limit: int = Depends(page_limit)):
+    if ids is not None:
+        return await lookup_products(parse_ids(ids))
+    if sort == "price" or min_price is not None or max_price is not None:
+        page = await products.range_page("price", limit, low=min_price, high=max_price,
+                                         after=decode_keyset_cursor(cursor))
+        return page_response(page, "product_id", limit, sort_field="price")
+    page = await products.list_page(limit, after_id=decode_id_cursor(cursor))
+    return page_response(page, "product_id", limit)
+
+# Same as GET /products?ids=... for ID sets too large for a query string
+@router.post("/products/lookup")
+async def lookup_products_post(request: MultiGetRequest):
+    return await lookup_products(check_ids(request.ids))
+
+# Every product ID with the event sequence it is current to, for the order
+# service's read model to load on a cold start or after a gap (Admin only:
+# the order service calls it with its service token)
+@router.get("/products/snapshot", include_in_schema=False)
+async def get_products_snapshot(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="products_snapshot")
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    return await take_snapshot("products", products)
+
+# Bulk-create products from an NDJSON body, one product object per line (Admin only).
+# The body is read as it streams in and stored in chunks; the report lists the
+# lines that were rejected. A product_id on a line is ignored: new IDs are assigned.
+@router.post("/products/import")
+async def import_products(request: Request, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="import_products")
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+
+    async def insert(chunk: Chunk, report: ImportReport):
+        records = [record for _, record in chunk]
+        async with search_index.lock:
+            product_ids = await products.create_many(records)
+            search_index.products_added(product_ids, records)
+        for product_id in product_ids:
+            publish("products", "created", product_id)
+        report.created += len(chunk)
+
+    report = await import_ndjson(request, Product, insert)
+    log_event(logger, logging.INFO, "products_imported", created=report["created"], failed=report["failed"],
+              admin=current_user['username'])
+    return report
+
+# Stream every product as NDJSON, in ID order (Admin only)
+@router.get("/products/export")
+async def export_products(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="export_products")
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+    return export_ndjson(products, "product_id", "products.ndjson")
+
+# Full-text search over names and descriptions, best BM25 match first
+# (Available to all). prefix=true also matches the words that start with the
+# last query word, for search-as-you-type. Pages continue from next_cursor.
+@router.get("/products/search")
+async def search_products(q: str = Query(..., min_length=1, max_length=200),
+                          prefix: bool = False,
+                          min_price: Optional[float] = None,
+                          max_price: Optional[float] = None,
+                          cursor: Optional[str] = None,
+                          limit: int = Depends(page_limit)):
+    await search_index.ensure_ready(products)
+    hits = search_index.search(q, limit, min_price=min_price, max_price=max_price,
+                               after=decode_keyset_cursor(cursor), prefix=prefix)
+    found = await products.get_many([product_id for product_id, _ in hits])
+    items = [{"product_id": product_id, "score": round(score, 4), **found[product_id]}
+             for product_id, score in hits if product_id in found]
+    next_cursor = encode_cursor([hits[-1][1], hits[-1][0]]) if len(hits) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+# Typeahead: indexed words starting with `prefix`, most common first (Available to all)
+@router.get("/products/suggest")
+async def suggest_products(prefix: str = Query(..., min_length=1, max_length=100),
+                           limit: int = Query(10, ge=1, le=100)):
+    await search_index.ensure_ready(products)
+    return {"suggestions": [{"term": term, "products": count}
+                            for term, count in search_index.suggest(prefix, limit)]}
+
+# Get a product by ID (Available to all).
+# Served from the pre-encoded response cache with an ETag; If-None-Match gets a 304.
+@router.get("/products/{product_id}")
+async def get_product(product_id: int, request: Request):
+    found = await products.get_versioned(product_id)
+    if found is not None:
+        log_event(logger, logging.INFO, "product_retrieved", product_id=product_id)
+        version, product = found
+        return record_response(request, "products", product_id, version, product)
     else:
-        logging.error(f"Product with ID {product_id} not found.")
+        log_event(logger, logging.ERROR, "product_not_found", product_id=product_id)
         raise HTTPException(status_code=404, detail="Product not found")
 
 # Update a product (Admin only)
-@app.put("/products/{product_id}")
-async def update_product(product_id: int, product: Product, current_user: dict = Depends(get_current_user_and_role)):
+@router.put("/products/{product_id}")
+async def update_product(product_id: int, product: Product, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
-        logging.warning(f"Unauthorized access attempt by {current_user['username']} to update product {product_id}.")
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="update_product", product_id=product_id)
         raise HTTPException(status_code=403, detail="Not enough privileges")
     
-    if product_id in products:
-        products[product_id] = product.dict()
-        logging.info(f"Product {product_id} updated by admin: {current_user['username']}")
+    # The indexed version is needed to take its words out of the search index
+    async with search_index.lock:
+        before = await products.get(product_id) if search_index.ready else None
+        updated = await products.update(product_id, product.dict())
+        if updated and before is not None:
+            search_index.product_changed(product_id, before, product.dict())
+    if updated:
+        publish("products", "updated", product_id)
+        log_event(logger, logging.INFO, "product_updated", product_id=product_id, admin=current_user['username'])
         return {"msg": "Product updated"}
     else:
-        logging.error(f"Product with ID {product_id} not found for update.")
+        log_event(logger, logging.ERROR, "product_not_found", product_id=product_id, action="update_product")
         raise HTTPException(status_code=404, detail="Product not found")
 
 # Delete a product (Admin only)
-@app.delete("/products/{product_id}", status_code=204)
-async def delete_product(product_id: int, current_user: dict = Depends(get_current_user_and_role)):
+@router.delete("/products/{product_id}", status_code=204)
+async def delete_product(product_id: int, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
-        logging.warning(f"Unauthorized access attempt by {current_user['username']} to delete product {product_id}.")
+        log_event(logger, logging.WARNING, "unauthorized", user=current_user['username'], action="delete_product", product_id=product_id)
         raise HTTPException(status_code=403, detail="Not enough privileges")
     
-    if product_id in products:
-        del products[product_id]
-        logging.info(f"Product {product_id} deleted by admin: {current_user['username']}")
+    async with search_index.lock:
+        before = await products.get(product_id) if search_index.ready else None
+        deleted = await products.delete(product_id)
+        if deleted and before is not None:
+            search_index.product_removed(product_id, before)
+    if deleted:
+        publish("products", "deleted", product_id)
+        response_cache.discard("products", product_id)
+        log_event(logger, logging.INFO, "product_deleted", product_id=product_id, admin=current_user['username'])
         return
     else:
-        logging.error(f"Product with ID {product_id} not found for deletion.")
+        log_event(logger, logging.ERROR, "product_not_found", product_id=product_id, action="delete_product")
         raise HTTPException(status_code=404, detail="Product not found")
-
-# Add the router to the app
-app.include_router(router)
@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+from Storage.base import Repository
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# product_id / customer_id -> [units, orders]
+Totals = Dict[int, List[int]]
+
+
+# Group-by over columns of customer_id, product_id and quantity.
+# Vectorized with NumPy when it is installed, plain dict counting otherwise.
+def group_totals(keys, quantities) -> Totals:
+    if np is not None and len(keys):
+        key_array = np.asarray(keys, dtype=np.int64)
+        quantity_array = np.asarray(quantities, dtype=np.int64)
+        if key_array.min() >= 0 and key_array.max() <= 4 * len(key_array) + 1024:
+            # IDs are dense: count straight into a slot per ID
+            counts = np.bincount(key_array)
+            unique = np.flatnonzero(counts)
+            units = np.bincount(key_array, weights=quantity_array)[unique]
+            counts = counts[unique]
+        else:
+            unique, inverse = np.unique(key_array, return_inverse=True)
+            units = np.bincount(inverse, weights=quantity_array, minlength=len(unique))
+            counts = np.bincount(inverse, minlength=len(unique))
+        units = units.astype(np.int64)
+        return {key: [unit, count] for key, unit, count in zip(unique.tolist(), units.tolist(), counts.tolist())}
+    totals: Totals = {}
+    for key, quantity in zip(keys, quantities):
+        entry = totals.get(key)
+        if entry is None:
+            totals[key] = [quantity, 1]
+        else:
+            entry[0] += quantity
+            entry[1] += 1
+    return totals
+
+
+def _add(totals: Totals, key: int, units: int, orders: int):
+    entry = totals.get(key)
+    if entry is None:
+        entry = totals[key] = [0, 0]
+    entry[0] += units
+    entry[1] += orders
+    if entry[1] == 0:
+        del totals[key]
+
+
+# Units and order counts per product and per customer, built from a full
+# scan of the order store and then kept current by the order endpoints, so
+# per-product and per-customer reads are dictionary lookups.
+# `revision` is the store revision (see Repository.revision) the totals
+# account for: a rebuild sets it and each write hook adds its one write.
+# When the store has moved on by writes no hook saw (another worker sharing
+# a SQLite file, a clear), ensure_ready rebuilds. The order endpoints run each
+# write and its hook under `lock`, which the rebuild also holds, so the
+# revision read before a rebuild counts exactly the writes the scan sees, and
+# the version an update or delete reads first is the one it replaces.
+class OrderAggregates:
+    def __init__(self):
+        self.by_product: Totals = {}
+        self.by_customer: Totals = {}
+        self.ready = False
+        self.revision = 0
+        self.lock = asyncio.Lock()
+
+    # Recompute from every stored order. Called with `lock` held; writes from
+    # other workers during the scan at worst cause one more rebuild.
+    async def rebuild(self, orders: Repository):
+        revision = await orders.revision()
+        by_product, by_customer = await scan(orders)
+        self.by_product, self.by_customer = by_product, by_customer
+        self.revision = revision
+        self.ready = True
+
+    async def current(self, orders: Repository) -> bool:
+        return self.ready and await orders.revision() == self.revision
+
+    async def ensure_ready(self, orders: Repository):
+        if not await self.current(orders):
+            async with self.lock:
+                if not await self.current(orders):
+                    await self.rebuild(orders)
+
+    def _apply(self, order: Dict, sign: int):
+        _add(self.by_product, order["product_id"], sign * order["quantity"], sign)
+        _add(self.by_customer, order["customer_id"], sign * order["quantity"], sign)
+
+    # Incremental hooks, one per write to the store. Before the first rebuild
+    # there is nothing to keep current: the rebuild's scan will include these
+    # orders anyway.
+    def order_added(self, order: Dict):
+        if self.ready:
+            self._apply(order, 1)
+            self.revision += 1
+
+    def orders_added(self, orders: List[Dict]):
+        if self.ready and orders:
+            for order in orders:
+                self._apply(order, 1)
+            self.revision += 1
+
+    def order_removed(self, order: Dict):
+        if self.ready:
+            self._apply(order, -1)
+            self.revision += 1
+
+    def order_changed(self, before: Dict, after: Dict):
+        if self.ready:
+            self._apply(before, -1)
+            self._apply(after, 1)
+            self.revision += 1
+
+    def reset(self):
+        self.by_product = {}
+        self.by_customer = {}
+        self.ready = False
+        self.revision = 0
+
+
+# Full-scan group-by of the order store: (totals by product, totals by customer)
+async def scan(orders: Repository) -> Tuple[Totals, Totals]:
+    columns = await orders.columns(("customer_id", "product_id", "quantity"))
+    return (group_totals(columns["product_id"], columns["quantity"]),
+            group_totals(columns["customer_id"], columns["quantity"]))
+
+
+# Revenue per product: units sold times the product's current price.
+# Products that no longer exist have no price and no revenue.
+def revenue(totals: Totals, prices: Dict[int, Optional[float]]) -> Dict[int, Optional[float]]:
+    product_ids = list(totals)
+    if np is not None and product_ids:
+        units = np.fromiter((totals[product_id][0] for product_id in product_ids), dtype=np.float64,
+                            count=len(product_ids))
+        price_array = np.fromiter((prices.get(product_id) or np.nan for product_id in product_ids),
+                                  dtype=np.float64, count=len(product_ids))
+        amounts = units * price_array
+        return {product_id: (None if np.isnan(amount) else round(float(amount), 2))
+                for product_id, amount in zip(product_ids, amounts)}
+    return {product_id: (round(totals[product_id][0] * prices[product_id], 2)
+                         if prices.get(product_id) is not None else None)
+            for product_id in product_ids}
+
+
+# The n largest entries of `values`, largest first (ties broken by lower ID)
+def top_n(values: Dict[int, Optional[float]], n: int) -> List[Tuple[int, float]]:
+    candidates = ((value, product_id) for product_id, value in values.items() if value is not None)
+    return [(product_id, value) for value, product_id in
+            heapq.nsmallest(n, candidates, key=lambda item: (-item[0], item[1]))]
+
+
+order_aggregates = OrderAggregates()
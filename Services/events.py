@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List
+
+from Middleware.log import log_event
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger("events")
+
+# Which bus carries change events: "inprocess" (services in one process) or
+# "file" (an append-only JSONL file per topic, shared by separate processes).
+# Distributed deployments default to the file bus.
+EVENT_BUS = os.getenv("EVENT_BUS", "file" if os.getenv("DEPLOYMENT_MODE") == "distributed" else "inprocess")
+EVENT_BUS_DIR = os.getenv("EVENT_BUS_DIR", "events")
+EVENT_BUS_POLL_MS = float(os.getenv("EVENT_BUS_POLL_MS", "50"))
+
+# An event is a dict: {"topic": "products", "type": "created" | "deleted",
+# "id": 7, "seq": 42, "ts": <publish time, epoch seconds>}. Sequence numbers
+# are per topic, start at 1 and have no holes, so a consumer can spot a
+# missed event. A topic may have several publishers (e.g. the workers of one
+# service); the bus hands out each number once.
+Event = Dict
+Handler = Callable[[Event], None]
+
+
+class EventBus(ABC):
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = {}
+
+    # Stamp the next sequence number on an event and deliver it
+    @abstractmethod
+    def publish(self, topic: str, event_type: str, resource_id: int) -> Event:
+        ...
+
+    # Last sequence number published on a topic (0 before the first event)
+    @abstractmethod
+    def sequence(self, topic: str) -> int:
+        ...
+
+    # Handlers run on the event loop, in sequence order, for events
+    # published after they subscribed
+    def subscribe(self, topic: str, handler: Handler):
+        self.handlers.setdefault(topic, []).append(handler)
+
+    def unsubscribe(self, topic: str, handler: Handler):
+        handlers = self.handlers.get(topic, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def _dispatch(self, event: Event):
+        for handler in list(self.handlers.get(event["topic"], ())):
+            try:
+                handler(event)
+            except Exception:
+                log_event(logger, logging.ERROR, "event_handler_failed", topic=event["topic"], seq=event["seq"])
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+# Delivers each event to the subscribers before publish() returns
+class InProcessBus(EventBus):
+    def __init__(self):
+        super().__init__()
+        self._sequences: Dict[str, int] = {}
+
+    def publish(self, topic: str, event_type: str, resource_id: int) -> Event:
+        seq = self._sequences.get(topic, 0) + 1
+        self._sequences[topic] = seq
+        event = {"topic": topic, "type": event_type, "id": resource_id, "seq": seq, "ts": time.time()}
+        self._dispatch(event)
+        return event
+
+    def sequence(self, topic: str) -> int:
+        return self._sequences.get(topic, 0)
+
+
+# Stand-in for a broker: publishers append one JSON line per event to
+# <directory>/<topic>.jsonl and subscribers tail the file every `poll`
+# seconds. Subscribers start at the end of the file; anything older comes
+# from a snapshot. The files are never compacted.
+# Any number of processes may publish to a topic: each publish takes an
+# exclusive lock on the file, reads the last sequence number from it and
+# appends the next one, so no number is handed out twice. Without fcntl
+# (Windows) there is no lock and a topic must keep to one publisher.
+class FileBus(EventBus):
+    def __init__(self, directory: str, poll: float):
+        super().__init__()
+        self.directory = directory
+        self.poll = poll
+        self._writers = {}
+        self._offsets: Dict[str, int] = {}
+        self._task = None
+
+    def _path(self, topic: str) -> str:
+        return os.path.join(self.directory, f"{topic}.jsonl")
+
+    def _last_sequence(self, topic: str) -> int:
+        try:
+            with open(self._path(topic), "rb") as handle:
+                handle.seek(0, os.SEEK_END)
+                handle.seek(max(0, handle.tell() - 4096))
+                lines = handle.read().splitlines()
+        except FileNotFoundError:
+            return 0
+        for line in reversed(lines):
+            try:
+                return json.loads(line)["seq"]
+            except (ValueError, KeyError):
+                continue
+        return 0
+
+    # Read from the file every time, since other processes publish too. A line
+    # being appended right now is skipped, which only makes the answer one
+    # event older.
+    def sequence(self, topic: str) -> int:
+        return self._last_sequence(topic)
+
+    def publish(self, topic: str, event_type: str, resource_id: int) -> Event:
+        writer = self._writers.get(topic)
+        if writer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            writer = self._writers[topic] = open(self._path(topic), "ab")
+        if fcntl is not None:
+            fcntl.flock(writer.fileno(), fcntl.LOCK_EX)
+        try:
+            seq = self._last_sequence(topic) + 1
+            event = {"topic": topic, "type": event_type, "id": resource_id, "seq": seq, "ts": time.time()}
+            writer.write(json.dumps(event).encode() + b"\n")
+            writer.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(writer.fileno(), fcntl.LOCK_UN)
+        return event
+
+    def subscribe(self, topic: str, handler: Handler):
+        if topic not in self._offsets:
+            try:
+                self._offsets[topic] = os.path.getsize(self._path(topic))
+            except FileNotFoundError:
+                self._offsets[topic] = 0
+        super().subscribe(topic, handler)
+
+    # Read whatever complete lines were appended since the last poll
+    def poll_once(self):
+        for topic, offset in list(self._offsets.items()):
+            try:
+                with open(self._path(topic), "rb") as handle:
+                    handle.seek(offset)
+                    data = handle.read()
+            except FileNotFoundError:
+                continue
+            end = data.rfind(b"\n") + 1
+            if not end:
+                continue
+            self._offsets[topic] = offset + end
+            for line in data[:end].splitlines():
+                self._dispatch(json.loads(line))
+
+    async def _run(self):
+        while True:
+            self.poll_once()
+            await asyncio.sleep(self.poll)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def create_bus(kind: str = EVENT_BUS) -> EventBus:
+    if kind == "inprocess":
+        return InProcessBus()
+    if kind == "file":
+        return FileBus(EVENT_BUS_DIR, EVENT_BUS_POLL_MS / 1000)
+    raise ValueError(f"Unknown event bus {kind!r}")
+
+
+bus = create_bus()
+
+
+# Called by the customer and product routers after a create or delete
+def publish(topic: str, event_type: str, resource_id: int) -> Event:
+    return bus.publish(topic, event_type, resource_id)
+
+
+# Every ID of a repository, paged so SQLite reads stay bounded
+async def snapshot_ids(repository, chunk: int = 10_000) -> List[int]:
+    ids: List[int] = []
+    after_id = None
+    while True:
+        page = await repository.list_page(chunk, after_id=after_id)
+        ids.extend(record_id for record_id, _ in page)
+        if len(page) < chunk:
+            return ids
+        after_id = page[-1][0]
+
+
+# A snapshot is {"topic": ..., "seq": n, "ids": [...]}: every ID that exists
+# once events up to n are applied. The sequence is read before the scan, so
+# it may already include later events, which is harmless because applying a
+# create or delete twice changes nothing.
+async def take_snapshot(topic: str, repository) -> Dict:
+    seq = bus.sequence(topic)
+    return {"topic": topic, "seq": seq, "ids": await snapshot_ids(repository)}
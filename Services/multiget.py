@@ -0,0 +1,28 @@
+import os
+from typing import List
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+# Largest number of IDs accepted by one multi-get request
+MULTI_GET_MAX = int(os.getenv("MULTI_GET_MAX", "1000"))
+
+
+class MultiGetRequest(BaseModel):
+    ids: List[int]
+
+
+# Turn "1,2,3" into a de-duplicated list of IDs, keeping the request order
+def parse_ids(ids: str) -> List[int]:
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be a comma-separated list of integers")
+    return check_ids(parsed)
+
+
+def check_ids(ids: List[int]) -> List[int]:
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MULTI_GET_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {MULTI_GET_MAX} ids per request")
+    return ids
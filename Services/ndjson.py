@@ -0,0 +1,149 @@
+import json
+import os
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from Middleware.response_cache import encode_json
+from Storage.base import Repository
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Valid lines are inserted this many at a time with one create_many call
+NDJSON_IMPORT_CHUNK = int(os.getenv("NDJSON_IMPORT_CHUNK", "10000"))
+# Records read from the store per export page
+NDJSON_EXPORT_CHUNK = int(os.getenv("NDJSON_EXPORT_CHUNK", "1000"))
+# Longer lines are rejected without being buffered
+NDJSON_MAX_LINE_BYTES = int(os.getenv("NDJSON_MAX_LINE_BYTES", str(1 << 20)))
+# Per-line errors listed in an import report; the rest are only counted
+NDJSON_MAX_ERRORS = int(os.getenv("NDJSON_MAX_ERRORS", "1000"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# (line number, parsed record) pairs waiting to be inserted
+Chunk = List[Tuple[int, Dict]]
+
+
+def decode_json(line: bytes):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+# Outcome of an import. Memory stays bounded however long the body is: only
+# the first NDJSON_MAX_ERRORS errors are kept.
+class ImportReport:
+    def __init__(self):
+        self.lines = 0
+        self.created = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+
+    def fail(self, line: int, error: str, detail: Optional[str] = None):
+        self.failed += 1
+        if len(self.errors) < NDJSON_MAX_ERRORS:
+            entry = {"line": line, "error": error}
+            if detail is not None:
+                entry["detail"] = detail
+            self.errors.append(entry)
+
+    def summary(self) -> Dict:
+        return {
+            "lines": self.lines,
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+# Split a streamed request body into (line number, line) pairs, numbered from
+# 1. A line longer than NDJSON_MAX_LINE_BYTES is skipped as it streams in and
+# comes out as None.
+async def iter_lines(request: Request) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    pending = bytearray()
+    skipping = False
+    line_number = 0
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            if newline < 0:
+                if not skipping:
+                    pending += chunk[start:]
+                    if len(pending) > NDJSON_MAX_LINE_BYTES:
+                        skipping = True
+                        pending.clear()
+                break
+            line_number += 1
+            if skipping:
+                yield line_number, None
+                skipping = False
+            else:
+                pending += chunk[start:newline]
+                yield line_number, bytes(pending)
+                pending.clear()
+            start = newline + 1
+    if skipping:
+        yield line_number + 1, None
+    elif pending.strip():
+        yield line_number + 1, bytes(pending)
+
+
+# Parse and validate an NDJSON body against `model` and hand the valid records
+# to `insert` in chunks of NDJSON_IMPORT_CHUNK. `insert` stores a chunk and
+# records its outcome on the report. Blank lines are ignored.
+async def import_ndjson(request: Request, model: Type[BaseModel],
+                        insert: Callable[[Chunk, ImportReport], Awaitable[None]]) -> Dict:
+    report = ImportReport()
+    chunk: Chunk = []
+    async for line_number, line in iter_lines(request):
+        if line is None:
+            report.lines += 1
+            report.fail(line_number, "Line too long", f"Lines are limited to {NDJSON_MAX_LINE_BYTES} bytes")
+            continue
+        if not line.strip():
+            continue
+        report.lines += 1
+        try:
+            item = decode_json(line)
+            if not isinstance(item, dict):
+                raise ValueError("Each line must be a JSON object")
+            record = model(**item).dict()
+        except ValidationError as exc:
+            report.fail(line_number, "Invalid record", str(exc))
+            continue
+        except ValueError as exc:
+            report.fail(line_number, "Invalid JSON", str(exc))
+            continue
+        chunk.append((line_number, record))
+        if len(chunk) >= NDJSON_IMPORT_CHUNK:
+            await insert(chunk, report)
+            chunk = []
+    if chunk:
+        await insert(chunk, report)
+    return report.summary()
+
+
+# Every record of a store as one JSON object per line, in ID order. Pages are
+# read with the keyset cursor and encoded as they are sent, so memory use does
+# not grow with the store.
+async def iter_records(repository: Repository, id_field: str) -> AsyncIterator[bytes]:
+    after_id = None
+    while True:
+        page = await repository.list_page(NDJSON_EXPORT_CHUNK, after_id=after_id)
+        if page:
+            yield b"".join(encode_json({id_field: record_id, **record}) + b"\n" for record_id, record in page)
+        if len(page) < NDJSON_EXPORT_CHUNK:
+            return
+        after_id = page[-1][0]
+
+
+def export_ndjson(repository: Repository, id_field: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(iter_records(repository, id_field), media_type=NDJSON_MEDIA_TYPE,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -0,0 +1,59 @@
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Query
+
+# Page sizes for list endpoints
+PAGE_LIMIT_DEFAULT = int(os.getenv("PAGE_LIMIT_DEFAULT", "50"))
+PAGE_LIMIT_MAX = int(os.getenv("PAGE_LIMIT_MAX", "500"))
+
+
+# Query parameter for the page size, shared by every list endpoint.
+# Async so FastAPI calls it inline instead of hopping to the thread pool.
+async def page_limit(limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX)) -> int:
+    return limit
+
+
+# Cursors are opaque to clients: the keyset position of the last row, base64-encoded
+def encode_cursor(position: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Any:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Cursor of a list ordered by ID: the last ID seen
+def decode_id_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    position = decode_cursor(cursor)
+    if not isinstance(position, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+# Cursor of a list ordered by (value, id): the last pair seen
+def decode_keyset_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, int]]:
+    if cursor is None:
+        return None
+    position = decode_cursor(cursor)
+    if (not isinstance(position, list) or len(position) != 2
+            or not isinstance(position[0], (int, float)) or not isinstance(position[1], int)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position[0], position[1]
+
+
+# Build a page response; a full page means there may be more rows after it
+def page_response(page: List[Tuple[int, Dict]], id_field: str, limit: int, sort_field: Optional[str] = None):
+    items = [{id_field: record_id, **record} for record_id, record in page]
+    next_cursor = None
+    if len(page) == limit:
+        last_id, last = page[-1]
+        next_cursor = encode_cursor([last[sort_field], last_id] if sort_field else last_id)
+    return {"items": items, "next_cursor": next_cursor}
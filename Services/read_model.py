@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from Middleware import metrics
+from Middleware.log import log_event
+from Services.events import Event, EventBus
+
+logger = logging.getLogger("read_model")
+
+# READ_MODEL_ENABLED=0 sends every order validation upstream again
+READ_MODEL_ENABLED = os.getenv("READ_MODEL_ENABLED", "1") == "1"
+
+# IDs missing from the replica are double-checked upstream (they may have been
+# created a moment ago); when the upstream is down the replica's answer stands
+READ_MODEL_CONFIRM_MISSES = os.getenv("READ_MODEL_CONFIRM_MISSES", "1") == "1"
+
+# How often a replica that is behind (cold start, gap, failed snapshot) retries its resync
+READ_MODEL_RESYNC_INTERVAL = float(os.getenv("READ_MODEL_RESYNC_INTERVAL", "5"))
+
+# Applied events remembered per replica, to tell a redelivery from a second
+# event that was given a sequence number already used
+READ_MODEL_RECENT_EVENTS = 1024
+
+READ_MODEL_TOPICS = ("customers", "products")
+
+metrics.help_texts["read_model_size"] = "IDs held by the order service's replica, by topic."
+metrics.help_texts["read_model_sequence"] = "Last event sequence number applied to the replica."
+metrics.help_texts["read_model_staleness_seconds"] = "How long the replica has been known to be behind (0 when in sync)."
+metrics.help_texts["read_model_delivery_lag_seconds"] = "Publish-to-apply delay of the last event applied."
+metrics.help_texts["read_model_gaps"] = "Sequence gaps detected, each followed by a resync."
+metrics.help_texts["read_model_resyncs"] = "Snapshots loaded into the replica."
+metrics.counter_names.update(("read_model_gaps", "read_model_resyncs"))
+
+Snapshot = Dict
+SnapshotLoader = Callable[[str], Awaitable[Snapshot]]
+
+
+# The set of IDs that exist in one topic, kept current by its create and
+# delete events. An event whose sequence number is not the next one expected
+# means events were lost: the replica is marked behind and reloaded from a
+# snapshot. So does an already applied sequence number arriving with a
+# different event, since one of the two publishers' events was not applied.
+# Events arriving while a snapshot loads are held and replayed on top.
+class IdReplica:
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.ids: Set[int] = set()
+        self.seq = 0
+        self.ready = False
+        self.behind_since: Optional[float] = time.monotonic()
+        self.delivery_lag = 0.0
+        self.gaps = 0
+        self.resyncs = 0
+        self.resyncing = False
+        self._held: List[Event] = []
+        self._recent: Dict[int, tuple] = {}
+        self.on_gap: Callable[["IdReplica"], None] = lambda replica: None
+
+    def handle(self, event: Event):
+        if self.resyncing:
+            self._held.append(event)
+        elif self.ready and self.behind_since is None:
+            self._apply(event)
+
+    def _apply(self, event: Event):
+        seq = event["seq"]
+        if seq <= self.seq:
+            applied = self._recent.get(seq)
+            if applied is not None and applied != (event["type"], event["id"]):
+                self._gap(f"seq {seq} reused")
+            return
+        if seq != self.seq + 1:
+            self._gap(f"expected {self.seq + 1}, got {seq}")
+            return
+        if event["type"] == "deleted":
+            self.ids.discard(event["id"])
+        else:
+            self.ids.add(event["id"])
+        self.seq = seq
+        self._recent[seq] = (event["type"], event["id"])
+        self._recent.pop(seq - READ_MODEL_RECENT_EVENTS, None)
+        self.delivery_lag = max(0.0, time.time() - event["ts"])
+
+    def _gap(self, detail: str):
+        self.gaps += 1
+        log_event(logger, logging.WARNING, "read_model_gap", topic=self.topic, detail=detail)
+        self.behind_since = time.monotonic()
+        self.on_gap(self)
+
+    async def resync(self, load: SnapshotLoader) -> bool:
+        if self.resyncing:
+            return False
+        self.resyncing = True
+        self._held = []
+        try:
+            snapshot = await load(self.topic)
+        except Exception as exc:
+            log_event(logger, logging.WARNING, "read_model_resync_failed", topic=self.topic, error=str(exc))
+            return False
+        finally:
+            self.resyncing = False
+            held, self._held = self._held, []
+        self.ids = set(snapshot["ids"])
+        self.seq = snapshot["seq"]
+        self._recent = {}
+        self.ready = True
+        self.behind_since = None
+        self.resyncs += 1
+        for event in sorted(held, key=lambda event: event["seq"]):
+            self._apply(event)
+        return True
+
+    def staleness(self) -> float:
+        return time.monotonic() - self.behind_since if self.behind_since is not None else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "size": len(self.ids),
+            "seq": self.seq,
+            "staleness_seconds": round(self.staleness(), 3),
+            "delivery_lag_seconds": round(self.delivery_lag, 6),
+            "gaps": self.gaps,
+            "resyncs": self.resyncs,
+        }
+
+
+# Replicas of the customer and product ID sets for order validation. start()
+# subscribes to the bus and loads a snapshot of each topic; a background task
+# retries the replicas that are behind.
+class ReadModel:
+    def __init__(self, topics=READ_MODEL_TOPICS):
+        self.replicas: Dict[str, IdReplica] = {topic: IdReplica(topic) for topic in topics}
+        self.bus: Optional[EventBus] = None
+        self._fetch: Optional[SnapshotLoader] = None
+        self._task: Optional[asyncio.Task] = None
+        self._resyncs: Set[asyncio.Task] = set()
+
+    async def load_snapshot(self, topic: str) -> Snapshot:
+        if self._fetch is None:
+            raise RuntimeError(f"No snapshot source for {topic}")
+        return await self._fetch(topic)
+
+    # `fetch` loads a topic's snapshot (upstream.fetch_snapshot in the app)
+    async def start(self, bus: EventBus, fetch: SnapshotLoader):
+        self.bus = bus
+        self._fetch = fetch
+        for topic, replica in self.replicas.items():
+            replica.on_gap = self._schedule_resync
+            bus.subscribe(topic, replica.handle)
+        await bus.start()
+        await self.resync()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.bus is not None:
+            for topic, replica in self.replicas.items():
+                self.bus.unsubscribe(topic, replica.handle)
+            await self.bus.close()
+            self.bus = None
+
+    async def resync(self, topic: Optional[str] = None) -> Dict[str, bool]:
+        topics = [topic] if topic is not None else list(self.replicas)
+        results = await asyncio.gather(*(self.replicas[name].resync(self.load_snapshot) for name in topics))
+        return dict(zip(topics, results))
+
+    def _schedule_resync(self, replica: IdReplica):
+        task = asyncio.get_running_loop().create_task(replica.resync(self.load_snapshot))
+        self._resyncs.add(task)
+        task.add_done_callback(self._resyncs.discard)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(READ_MODEL_RESYNC_INTERVAL)
+            for replica in self.replicas.values():
+                if replica.behind_since is not None:
+                    await replica.resync(self.load_snapshot)
+
+    # True/False from the replica, None when it cannot answer (disabled or never loaded)
+    def lookup(self, topic: str, resource_id: int) -> Optional[bool]:
+        replica = self.replicas.get(topic)
+        if not READ_MODEL_ENABLED or replica is None or not replica.ready:
+            return None
+        return resource_id in replica.ids
+
+    def stats(self) -> Dict[str, Dict]:
+        return {topic: replica.stats() for topic, replica in self.replicas.items()}
+
+
+read_model = ReadModel()
+
+
+# Expose the replicas on /metrics
+def _collect_stats():
+    families = {name: {} for name in ("read_model_size", "read_model_sequence", "read_model_staleness_seconds",
+                                      "read_model_delivery_lag_seconds", "read_model_gaps", "read_model_resyncs")}
+    for topic, replica in read_model.replicas.items():
+        labels = (("topic", topic),)
+        families["read_model_size"][labels] = len(replica.ids)
+        families["read_model_sequence"][labels] = replica.seq
+        families["read_model_staleness_seconds"][labels] = round(replica.staleness(), 3)
+        families["read_model_delivery_lag_seconds"][labels] = round(replica.delivery_lag, 6)
+        families["read_model_gaps"][labels] = replica.gaps
+        families["read_model_resyncs"][labels] = replica.resyncs
+    return families
+
+metrics.collectors.append(_collect_stats)
@@ -0,0 +1,382 @@
+import asyncio
+import heapq
+import math
+import os
+import re
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from Middleware import metrics
+from Storage.base import Repository
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# BM25 parameters: term frequency saturation and document length normalization
+SEARCH_BM25_K1 = float(os.getenv("SEARCH_BM25_K1", "1.2"))
+SEARCH_BM25_B = float(os.getenv("SEARCH_BM25_B", "0.75"))
+# A term in the name counts this many times a term in the description
+SEARCH_NAME_WEIGHT = int(os.getenv("SEARCH_NAME_WEIGHT", "3"))
+# Terms the last word of a prefix query expands to, most frequent first
+SEARCH_PREFIX_EXPANSIONS = int(os.getenv("SEARCH_PREFIX_EXPANSIONS", "20"))
+# Products read from the store per page while the index is built
+SEARCH_BUILD_CHUNK = 10_000
+# Prefixes up to this long cover a large share of the vocabulary, so their
+# completions are ranked once and cached instead of walking the trie each time
+SUGGEST_CACHE_PREFIX = 2
+
+metrics.help_texts["search_index_documents"] = "Products in the search index."
+metrics.help_texts["search_index_terms"] = "Distinct terms in the search index."
+
+TOKEN = re.compile(r"\w+")
+
+# A posting packs a product ID and its term frequency into one int64:
+# id << 8 | tf, with tf capped at 255. Posting arrays stay sorted by ID.
+TF_BITS = 8
+TF_MAX = (1 << TF_BITS) - 1
+
+# (product_id, score) pairs, best first
+Hits = List[Tuple[int, float]]
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+# Term frequencies of a product, name terms weighted by SEARCH_NAME_WEIGHT
+def term_counts(product: Dict) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for term in tokenize(product.get("name", "")):
+        counts[term] = counts.get(term, 0) + SEARCH_NAME_WEIGHT
+    for term in tokenize(product.get("description", "")):
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+# Character trie over the indexed terms, for prefix completion. Nodes are
+# dicts keyed by character; the "" key of a node holds the term ending there.
+class PrefixTrie:
+    def __init__(self):
+        self.root: Dict = {}
+        self.size = 0
+
+    def add(self, term: str):
+        node = self.root
+        for char in term:
+            node = node.setdefault(char, {})
+        if "" not in node:
+            node[""] = term
+            self.size += 1
+
+    def remove(self, term: str):
+        path = []
+        node = self.root
+        for char in term:
+            child = node.get(char)
+            if child is None:
+                return
+            path.append((node, char))
+            node = child
+        if node.pop("", None) is None:
+            return
+        self.size -= 1
+        # Prune the nodes left without terms
+        for parent, char in reversed(path):
+            if parent[char]:
+                break
+            del parent[char]
+
+    # Every term starting with `prefix`, in no particular order
+    def complete(self, prefix: str) -> Iterator[str]:
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == "":
+                    yield child
+                else:
+                    stack.append(child)
+
+
+# Inverted index over product names and descriptions, ranked with BM25.
+# Built from a scan of the product store on first use, then kept current by
+# the product endpoints. Document lengths and prices live in arrays indexed
+# by product ID, so scoring and price filters need no record lookups.
+# Like the order aggregates, the index remembers the store revision it
+# accounts for and is rebuilt when the store has writes it did not see (from
+# another worker sharing a SQLite file, or a clear). The product endpoints
+# write and call the hooks under `lock`, which the build also holds, so the
+# revision read before a build counts exactly the writes the scan sees, and
+# the version an update or delete reads first is the one it replaces.
+class ProductSearchIndex:
+    def __init__(self):
+        self._reset()
+        self.ready = False
+        self.revision = 0
+        self.lock = asyncio.Lock()
+
+    def _reset(self):
+        self.postings: Dict[str, array] = {}
+        self.trie = PrefixTrie()
+        self.lengths = array("I")
+        self.prices = array("d")
+        self.documents = 0
+        self.total_length = 0
+        # Products added or removed since the index was created
+        self.changes = 0
+        # prefix -> (changes when ranked, terms by document frequency)
+        self._ranked: Dict[str, Tuple[int, List[str]]] = {}
+
+    # Called with `lock` held
+    async def rebuild(self, products: Repository):
+        self._reset()
+        self.ready = False
+        revision = await products.revision()
+        after_id = None
+        while True:
+            page = await products.list_page(SEARCH_BUILD_CHUNK, after_id=after_id)
+            for product_id, product in page:
+                self._add(product_id, product)
+            if page:
+                after_id = page[-1][0]
+            if len(page) < SEARCH_BUILD_CHUNK:
+                break
+        self.revision = revision
+        self.ready = True
+
+    async def current(self, products: Repository) -> bool:
+        return self.ready and await products.revision() == self.revision
+
+    async def ensure_ready(self, products: Repository):
+        if not await self.current(products):
+            async with self.lock:
+                if not await self.current(products):
+                    await self.rebuild(products)
+
+    def _add(self, product_id: int, product: Dict):
+        counts = term_counts(product)
+        length = sum(counts.values())
+        if not length:
+            return
+        postings = self.postings
+        key = product_id << TF_BITS
+        for term, tf in counts.items():
+            entry = key | min(tf, TF_MAX)
+            posting = postings.get(term)
+            if posting is None:
+                postings[term] = array("q", (entry,))
+                self.trie.add(term)
+                self._drop_rankings(term)
+            elif posting[-1] < key:
+                posting.append(entry)
+            else:
+                posting.insert(bisect_left(posting, key), entry)
+        if product_id >= len(self.lengths):
+            grow = max(product_id + 1 - len(self.lengths), len(self.lengths) // 8, 1024)
+            self.lengths.extend(array("I", bytes(4 * grow)))
+            self.prices.extend(array("d", bytes(8 * grow)))
+        self.lengths[product_id] = length
+        self.prices[product_id] = product.get("price", 0.0)
+        self.documents += 1
+        self.total_length += length
+        self.changes += 1
+
+    # `product` must be the version that was indexed
+    def _remove(self, product_id: int, product: Dict):
+        if product_id >= len(self.lengths) or not self.lengths[product_id]:
+            return
+        key = product_id << TF_BITS
+        for term in term_counts(product):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            position = bisect_left(posting, key)
+            if position < len(posting) and posting[position] >> TF_BITS == product_id:
+                del posting[position]
+                if not posting:
+                    del self.postings[term]
+                    self.trie.remove(term)
+                    self._drop_rankings(term)
+        self.documents -= 1
+        self.total_length -= self.lengths[product_id]
+        self.lengths[product_id] = 0
+        self.changes += 1
+
+    def _drop_rankings(self, term: str):
+        for size in range(1, SUGGEST_CACHE_PREFIX + 1):
+            self._ranked.pop(term[:size], None)
+
+    # Hooks for the product endpoints, one per write to the store. Before
+    # the first build there is nothing to keep current.
+    def product_added(self, product_id: int, product: Dict):
+        if self.ready:
+            self._add(product_id, product)
+            self.revision += 1
+
+    def products_added(self, product_ids: List[int], products: List[Dict]):
+        if self.ready and product_ids:
+            for product_id, product in zip(product_ids, products):
+                self._add(product_id, product)
+            self.revision += 1
+
+    def product_changed(self, product_id: int, before: Dict, after: Dict):
+        if self.ready:
+            self._remove(product_id, before)
+            self._add(product_id, after)
+            self.revision += 1
+
+    def product_removed(self, product_id: int, before: Dict):
+        if self.ready:
+            self._remove(product_id, before)
+            self.revision += 1
+
+    def document_frequency(self, term: str) -> int:
+        posting = self.postings.get(term)
+        return len(posting) if posting is not None else 0
+
+    def _rank_key(self, term: str) -> Tuple[int, str]:
+        return -len(self.postings[term]), term
+
+    # Every term under a short prefix, most frequent first. The cached order is
+    # dropped when a term under the prefix appears or disappears, and redone
+    # once 1% of the products have changed since it was computed.
+    def _ranking(self, prefix: str) -> List[str]:
+        cached = self._ranked.get(prefix)
+        if cached is None or self.changes - cached[0] > self.documents // 100:
+            cached = self._ranked[prefix] = (self.changes, sorted(self.trie.complete(prefix), key=self._rank_key))
+        return cached[1]
+
+    # Indexed terms starting with `prefix`, most frequent first
+    def suggest(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        prefix = prefix.lower()
+        if len(prefix) <= SUGGEST_CACHE_PREFIX:
+            # Frequencies may have drifted since the ranking, so re-rank its head
+            best = heapq.nsmallest(limit, self._ranking(prefix)[:limit * 4], key=self._rank_key)
+        else:
+            best = heapq.nsmallest(limit, self.trie.complete(prefix), key=self._rank_key)
+        return [(term, len(self.postings[term])) for term in best]
+
+    def _query_terms(self, query: str, prefix: bool) -> List[str]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if prefix and terms:
+            last = terms.pop()
+            expansions = [term for term, _ in self.suggest(last, SEARCH_PREFIX_EXPANSIONS)]
+            terms.extend(term for term in expansions if term not in terms)
+        return [term for term in terms if term in self.postings]
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings[term])
+        return math.log(1 + (self.documents - df + 0.5) / (df + 0.5))
+
+    # Top `limit` products for `query` by BM25 score, ties broken by ID.
+    # With prefix=True the last word also matches the terms it starts.
+    # `after` is the (score, id) of the last hit of the previous page.
+    def search(self, query: str, limit: int, min_price: Optional[float] = None,
+               max_price: Optional[float] = None, after: Optional[Tuple[float, int]] = None,
+               prefix: bool = False) -> Hits:
+        terms = self._query_terms(query, prefix)
+        if not terms or not self.documents:
+            return []
+        if np is not None:
+            return self._search_numpy(terms, limit, min_price, max_price, after)
+        return self._search_python(terms, limit, min_price, max_price, after)
+
+    # Vectorized over the posting arrays, which NumPy reads in place
+    def _search_numpy(self, terms: List[str], limit: int, min_price: Optional[float],
+                      max_price: Optional[float], after: Optional[Tuple[float, int]]) -> Hits:
+        k1, b = SEARCH_BM25_K1, SEARCH_BM25_B
+        average = self.total_length / self.documents
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+        id_parts = []
+        score_parts = []
+        for term in terms:
+            entries = np.frombuffer(self.postings[term], dtype=np.int64)
+            ids = entries >> TF_BITS
+            tf = (entries & TF_MAX).astype(np.float64)
+            # idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average)), in place
+            scores = lengths[ids] * (k1 * b / average)
+            scores += tf
+            scores += k1 * (1 - b)
+            tf *= self._idf(term) * (k1 + 1)
+            tf /= scores
+            id_parts.append(ids)
+            score_parts.append(tf)
+        if len(id_parts) == 1:
+            ids, scores = id_parts[0], score_parts[0]
+        else:
+            totals = np.bincount(np.concatenate(id_parts), weights=np.concatenate(score_parts))
+            # Every matching product scores above zero
+            ids = np.flatnonzero(totals > 0)
+            scores = totals[ids]
+        keep = None
+        if min_price is not None or max_price is not None:
+            prices = np.frombuffer(self.prices, dtype=np.float64)[ids]
+            keep = np.ones(len(ids), dtype=bool)
+            if min_price is not None:
+                keep &= prices >= min_price
+            if max_price is not None:
+                keep &= prices <= max_price
+        if after is not None:
+            past = (scores < after[0]) | ((scores == after[0]) & (ids > after[1]))
+            keep = past if keep is None else keep & past
+        if keep is not None:
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) > limit:
+            # Everything scoring at least the limit-th best score, so ties sort by ID
+            threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            top = scores >= threshold
+            ids, scores = ids[top], scores[top]
+        order = np.lexsort((ids, -scores))[:limit]
+        return list(zip(ids[order].tolist(), scores[order].tolist()))
+
+    def _search_python(self, terms: List[str], limit: int, min_price: Optional[float],
+                       max_price: Optional[float], after: Optional[Tuple[float, int]]) -> Hits:
+        k1, b = SEARCH_BM25_K1, SEARCH_BM25_B
+        average = self.total_length / self.documents
+        lengths = self.lengths
+        scores: Dict[int, float] = {}
+        for term in terms:
+            idf = self._idf(term)
+            for entry in self.postings[term]:
+                product_id = entry >> TF_BITS
+                tf = entry & TF_MAX
+                norm = k1 * (1 - b + b * lengths[product_id] / average)
+                scores[product_id] = scores.get(product_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        prices = self.prices
+        hits = (
+            (product_id, score) for product_id, score in scores.items()
+            if (min_price is None or prices[product_id] >= min_price)
+            and (max_price is None or prices[product_id] <= max_price)
+            and (after is None or score < after[0] or (score == after[0] and product_id > after[1]))
+        )
+        return heapq.nsmallest(limit, hits, key=lambda hit: (-hit[1], hit[0]))
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "documents": self.documents,
+            "terms": len(self.postings),
+            "postings": sum(len(posting) for posting in self.postings.values()),
+            "average_length": round(self.total_length / self.documents, 2) if self.documents else 0.0,
+        }
+
+
+search_index = ProductSearchIndex()
+
+
+# Expose the index size on /metrics
+def _collect_stats():
+    return {
+        "search_index_documents": {(): search_index.documents},
+        "search_index_terms": {(): len(search_index.postings)},
+    }
+
+metrics.collectors.append(_collect_stats)
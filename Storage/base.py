@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Page = List[Tuple[int, Dict]]
+
+
+# Storage interface used by the routers for products, customers and orders.
+# Records are plain dicts (what model.dict() returns); IDs are positive ints
+# allocated by the store and never reused. Every record also has a version,
+# 1 on create and bumped by each update, so (id, version) names one exact
+# state of a record (used for response caching and ETags).
+#
+# `indexes` names fields with an equality index (e.g. customer email) and
+# `sorted_fields` names fields kept in (value, id) order for range scans
+# (e.g. product price). Both are maintained on every create/update/delete,
+# so page reads cost time proportional to the page, not to the store.
+class Repository(ABC):
+    def __init__(self, name: str, indexes: Sequence[str] = (), sorted_fields: Sequence[str] = ()):
+        self.name = name
+        self.indexes = tuple(indexes)
+        self.sorted_fields = tuple(sorted_fields)
+
+    def _check_index(self, field: str, kinds: Sequence[str]):
+        if field not in kinds:
+            raise ValueError(f"{self.name} has no index on {field}")
+
+    @abstractmethod
+    async def create(self, record: Dict) -> int:
+        ...
+
+    # Store several records under one contiguous block of IDs
+    @abstractmethod
+    async def create_many(self, records: List[Dict]) -> List[int]:
+        ...
+
+    @abstractmethod
+    async def get(self, record_id: int) -> Optional[Dict]:
+        ...
+
+    # The record together with its current version
+    @abstractmethod
+    async def get_versioned(self, record_id: int) -> Optional[Tuple[int, Dict]]:
+        ...
+
+    # Fetch several records; IDs that do not exist are left out
+    @abstractmethod
+    async def get_many(self, record_ids: Iterable[int]) -> Dict[int, Dict]:
+        ...
+
+    # Replace a record; returns False when it does not exist
+    @abstractmethod
+    async def update(self, record_id: int, record: Dict) -> bool:
+        ...
+
+    # Remove a record; returns False when it does not exist
+    @abstractmethod
+    async def delete(self, record_id: int) -> bool:
+        ...
+
+    # Records in ID order after `after_id`, optionally only those whose indexed
+    # `field` equals `value`
+    @abstractmethod
+    async def list_page(self, limit: int, after_id: Optional[int] = None,
+                        field: Optional[str] = None, value: Any = None) -> Page:
+        ...
+
+    # Records ordered by (field, id) with low <= field <= high, resuming after
+    # the (value, id) keyset position of the previous page
+    @abstractmethod
+    async def range_page(self, field: str, limit: int, low: Any = None, high: Any = None,
+                         after: Optional[Tuple[Any, int]] = None) -> Page:
+        ...
+
+    # IDs of every record whose indexed `field` equals `value`
+    @abstractmethod
+    async def find_ids(self, field: str, value: Any) -> List[int]:
+        ...
+
+    @abstractmethod
+    async def count(self) -> int:
+        ...
+
+    # Number of writes (create, create_many, update and delete calls that
+    # changed something, and clears) made to the store so far, by every
+    # process sharing it. Views computed from the whole store, such as the
+    # order analytics, compare it with the writes they have accounted for.
+    @abstractmethod
+    async def revision(self) -> int:
+        ...
+
+    # Every record's values of `fields` as parallel lists, in ID order, for
+    # full scans such as analytics. Backends with columnar storage override it.
+    async def columns(self, fields: Sequence[str], chunk: int = 10_000) -> Dict[str, List[Any]]:
+        result: Dict[str, List[Any]] = {field: [] for field in fields}
+        after_id = None
+        while True:
+            page = await self.list_page(chunk, after_id=after_id)
+            for _, record in page:
+                for field in fields:
+                    result[field].append(record.get(field))
+            if len(page) < chunk:
+                return result
+            after_id = page[-1][0]
+
+    # Drop every record (used by tests and benchmarks)
+    @abstractmethod
+    async def clear(self):
+        ...
+
+    async def close(self):
+        pass
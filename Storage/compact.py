@@ -0,0 +1,309 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from Storage.base import Page, Repository
+
+# Column kinds: ints and floats live in typed arrays (8 bytes per value),
+# strings in a list of interned str objects so repeated values share one copy
+ARRAY_TYPECODES = {"int": "q", "float": "d"}
+
+# Blocks at least this large are merged into a sorted index rather than inserted row by row
+SORTED_MERGE_MIN = 64
+
+Schema = Dict[str, str]
+
+
+def _new_column(kind: str):
+    typecode = ARRAY_TYPECODES.get(kind)
+    return array(typecode) if typecode else []
+
+
+def _coerce(kind: str, value: Any) -> Any:
+    if kind == "int":
+        return int(value)
+    if kind == "float":
+        return float(value)
+    return sys.intern(str(value))
+
+
+def _take(column, slots: List[int]):
+    values = [column[slot] for slot in slots]
+    return array(column.typecode, values) if isinstance(column, array) else values
+
+
+# Remove `record_id` from a sorted array of IDs
+def _discard(ids: array, record_id: int):
+    position = bisect_left(ids, record_id)
+    if position < len(ids) and ids[position] == record_id:
+        del ids[position]
+
+
+# Column store for large catalogs. A record occupies one slot across the
+# column arrays; deleted slots go on a free-list and are reused by the next
+# insert. IDs keep growing as in the other backends, and _slot_of (indexed by
+# ID) maps each one to its slot, -1 once deleted. Records only become dicts
+# when they are read, e.g. for a response.
+#
+# Equality indexes map each value to a sorted array('q') of IDs. A sorted
+# field keeps two parallel arrays of values and IDs ordered by (value, id).
+# Every field has to be declared in the schema ("int", "float" or "str").
+class CompactRepository(Repository):
+    def __init__(self, name: str, schema: Schema, indexes: Sequence[str] = (), sorted_fields: Sequence[str] = ()):
+        super().__init__(name, indexes, sorted_fields)
+        for field in (*self.indexes, *self.sorted_fields):
+            if field not in schema:
+                raise ValueError(f"{name} indexes {field}, which is not in its schema")
+        self.schema = dict(schema)
+        self._revision = 0
+        self._reset()
+
+    def _reset(self):
+        self._columns = {field: _new_column(kind) for field, kind in self.schema.items()}
+        self._column_items = tuple(self._columns.items())
+        self._versions = array("I")
+        self._slot_of = array("q")
+        self._free = array("q")
+        self._reused = False
+        self._count = 0
+        self._eq: Dict[str, Dict[Any, array]] = {field: {} for field in self.indexes}
+        self._sorted: Dict[str, Tuple[Any, array]] = {
+            field: (_new_column(self.schema[field]), array("q")) for field in self.sorted_fields
+        }
+
+    def _values(self, record: Dict) -> List[Any]:
+        if record.keys() != self.schema.keys():
+            raise ValueError(f"{self.name} records need exactly the fields {list(self.schema)}")
+        return [_coerce(kind, record[field]) for field, kind in self.schema.items()]
+
+    def _slot(self, record_id: int) -> int:
+        if 0 < record_id <= len(self._slot_of):
+            return self._slot_of[record_id - 1]
+        return -1
+
+    def _record(self, slot: int) -> Dict:
+        return {field: column[slot] for field, column in self._column_items}
+
+    def _index(self, record_id: int, values: Dict[str, Any]):
+        for field, buckets in self._eq.items():
+            bucket = buckets.get(values[field])
+            if bucket is None:
+                bucket = buckets[values[field]] = array("q")
+            if bucket and bucket[-1] > record_id:
+                bucket.insert(bisect_left(bucket, record_id), record_id)
+            else:
+                bucket.append(record_id)
+        for field, (sorted_values, sorted_ids) in self._sorted.items():
+            value = values[field]
+            low, high = bisect_left(sorted_values, value), bisect_right(sorted_values, value)
+            position = bisect_left(sorted_ids, record_id, low, high)
+            sorted_values.insert(position, value)
+            sorted_ids.insert(position, record_id)
+
+    def _unindex(self, record_id: int, values: Dict[str, Any]):
+        for field, buckets in self._eq.items():
+            value = values[field]
+            bucket = buckets.get(value)
+            if bucket is not None:
+                _discard(bucket, record_id)
+                if not bucket:
+                    del buckets[value]
+        for field, (sorted_values, sorted_ids) in self._sorted.items():
+            value = values[field]
+            low, high = bisect_left(sorted_values, value), bisect_right(sorted_values, value)
+            position = bisect_left(sorted_ids, record_id, low, high)
+            if position < high and sorted_ids[position] == record_id:
+                del sorted_values[position]
+                del sorted_ids[position]
+
+    def _indexed_values(self, slot: int) -> Dict[str, Any]:
+        return {field: self._columns[field][slot] for field in (*self._eq, *self._sorted)}
+
+    def _insert(self, values: List[Any]) -> int:
+        record_id = len(self._slot_of) + 1
+        if self._free:
+            slot = self._free.pop()
+            self._reused = True
+            for column, value in zip(self._columns.values(), values):
+                column[slot] = value
+            self._versions[slot] = 1
+        else:
+            slot = len(self._versions)
+            for column, value in zip(self._columns.values(), values):
+                column.append(value)
+            self._versions.append(1)
+        self._slot_of.append(slot)
+        self._count += 1
+        self._index(record_id, self._indexed_values(slot))
+        return record_id
+
+    async def create(self, record: Dict) -> int:
+        record_id = self._insert(self._values(record))
+        self._revision += 1
+        return record_id
+
+    async def create_many(self, records: List[Dict]) -> List[int]:
+        # Convert every row first so a bad row leaves the store untouched
+        rows = [self._values(record) for record in records]
+        if rows:
+            self._revision += 1
+        reused = [self._insert(values) for values in rows[:len(self._free)]]
+        rows = rows[len(reused):]
+        if not rows:
+            return reused
+        # The rest are appended column by column
+        first_id = len(self._slot_of) + 1
+        first_slot = len(self._versions)
+        record_ids = range(first_id, first_id + len(rows))
+        for position, (field, column) in enumerate(self._column_items):
+            column.extend([values[position] for values in rows])
+        self._versions.extend([1] * len(rows))
+        self._slot_of.extend(range(first_slot, first_slot + len(rows)))
+        self._count += len(rows)
+        self._index_appended(record_ids, first_slot)
+        return reused + list(record_ids)
+
+    # Index a block of new records. Their IDs are above every indexed ID, so
+    # equality buckets only need appends; large blocks are merged into the
+    # sorted arrays in one pass instead of one insert (and memmove) per row.
+    def _index_appended(self, record_ids: range, first_slot: int):
+        for field, buckets in self._eq.items():
+            column = self._columns[field]
+            for record_id, slot in zip(record_ids, range(first_slot, first_slot + len(record_ids))):
+                value = column[slot]
+                bucket = buckets.get(value)
+                if bucket is None:
+                    bucket = buckets[value] = array("q")
+                bucket.append(record_id)
+        for field, (sorted_values, sorted_ids) in self._sorted.items():
+            column = self._columns[field]
+            added = sorted(zip(column[first_slot:first_slot + len(record_ids)], record_ids))
+            if len(added) < SORTED_MERGE_MIN:
+                for value, record_id in added:
+                    position = bisect_right(sorted_values, value)
+                    sorted_values.insert(position, value)
+                    sorted_ids.insert(position, record_id)
+                continue
+            # New IDs sort after existing ones of equal value, so each new row
+            # goes at bisect_right of its value; the runs of existing rows
+            # between those points are copied as slices
+            values = _new_column(self.schema[field])
+            ids = array("q")
+            start = 0
+            for value, record_id in added:
+                position = bisect_right(sorted_values, value, start)
+                values.extend(sorted_values[start:position])
+                ids.extend(sorted_ids[start:position])
+                values.append(value)
+                ids.append(record_id)
+                start = position
+            values.extend(sorted_values[start:])
+            ids.extend(sorted_ids[start:])
+            self._sorted[field] = (values, ids)
+
+    async def get(self, record_id: int) -> Optional[Dict]:
+        slot = self._slot(record_id)
+        return self._record(slot) if slot >= 0 else None
+
+    async def get_versioned(self, record_id: int) -> Optional[Tuple[int, Dict]]:
+        slot = self._slot(record_id)
+        return (self._versions[slot], self._record(slot)) if slot >= 0 else None
+
+    async def get_many(self, record_ids: Iterable[int]) -> Dict[int, Dict]:
+        found = {}
+        for record_id in record_ids:
+            slot = self._slot(record_id)
+            if slot >= 0:
+                found[record_id] = self._record(slot)
+        return found
+
+    async def update(self, record_id: int, record: Dict) -> bool:
+        slot = self._slot(record_id)
+        if slot < 0:
+            return False
+        values = self._values(record)
+        self._unindex(record_id, self._indexed_values(slot))
+        for column, value in zip(self._columns.values(), values):
+            column[slot] = value
+        self._versions[slot] += 1
+        self._index(record_id, self._indexed_values(slot))
+        self._revision += 1
+        return True
+
+    async def delete(self, record_id: int) -> bool:
+        slot = self._slot(record_id)
+        if slot < 0:
+            return False
+        self._unindex(record_id, self._indexed_values(slot))
+        self._slot_of[record_id - 1] = -1
+        for field, kind in self.schema.items():
+            if kind == "str":
+                # Let go of the string; the slot is overwritten on reuse anyway
+                self._columns[field][slot] = ""
+        self._free.append(slot)
+        self._count -= 1
+        self._revision += 1
+        return True
+
+    async def list_page(self, limit: int, after_id: Optional[int] = None,
+                        field: Optional[str] = None, value: Any = None) -> Page:
+        page = []
+        if field is not None:
+            self._check_index(field, self.indexes)
+            ids = self._eq[field].get(value, array("q"))
+            start = bisect_right(ids, after_id) if after_id is not None else 0
+            for record_id in ids[start:start + limit]:
+                page.append((record_id, self._record(self._slot_of[record_id - 1])))
+            return page
+        # IDs are dense, so walk _slot_of from after_id and skip deleted ones
+        slot_of = self._slot_of
+        position = after_id if after_id is not None and after_id > 0 else 0
+        while position < len(slot_of) and len(page) < limit:
+            slot = slot_of[position]
+            position += 1
+            if slot >= 0:
+                page.append((position, self._record(slot)))
+        return page
+
+    async def range_page(self, field: str, limit: int, low: Any = None, high: Any = None,
+                         after: Optional[Tuple[Any, int]] = None) -> Page:
+        self._check_index(field, self.sorted_fields)
+        sorted_values, sorted_ids = self._sorted[field]
+        start = 0
+        if after is not None:
+            after_value, after_id = after
+            equal_low = bisect_left(sorted_values, after_value)
+            equal_high = bisect_right(sorted_values, after_value)
+            start = bisect_right(sorted_ids, after_id, equal_low, equal_high)
+        if low is not None:
+            start = max(start, bisect_left(sorted_values, low))
+        page = []
+        for position in range(start, min(start + limit, len(sorted_ids))):
+            if high is not None and sorted_values[position] > high:
+                break
+            record_id = sorted_ids[position]
+            page.append((record_id, self._record(self._slot_of[record_id - 1])))
+        return page
+
+    async def find_ids(self, field: str, value: Any) -> List[int]:
+        self._check_index(field, self.indexes)
+        return list(self._eq[field].get(value, ()))
+
+    # Copies of the columns restricted to live slots, in ID order
+    async def columns(self, fields: Sequence[str], chunk: int = 10_000) -> Dict[str, Any]:
+        if self._count == len(self._versions) and not self._reused:
+            # No holes and no reused slots: slot order is ID order
+            return {field: self._columns[field][:] for field in fields}
+        slots = [slot for slot in self._slot_of if slot >= 0]
+        return {field: _take(self._columns[field], slots) for field in fields}
+
+    async def count(self) -> int:
+        return self._count
+
+    async def revision(self) -> int:
+        return self._revision
+
+    async def clear(self):
+        self._revision += 1
+        self._reset()
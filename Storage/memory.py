@@ -0,0 +1,175 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from Storage.base import Page, Repository
+
+
+def _discard(ids: List, item):
+    position = bisect_left(ids, item)
+    if position < len(ids) and ids[position] == item:
+        del ids[position]
+
+
+# The original module-level dict store, kept for tests and single-process runs.
+# Alongside the records it keeps sorted ID lists: all IDs, IDs per value of each
+# equality index, and (value, id) pairs per sorted field. IDs only ever grow,
+# so inserts are appends and keyset pages are a bisect plus a slice.
+class MemoryRepository(Repository):
+    def __init__(self, name: str, indexes: Sequence[str] = (), sorted_fields: Sequence[str] = ()):
+        super().__init__(name, indexes, sorted_fields)
+        self._records: Dict[int, Dict] = {}
+        self._versions: Dict[int, int] = {}
+        self._next_id = 1
+        self._revision = 0
+        self._ids: List[int] = []
+        self._eq: Dict[str, Dict[Any, List[int]]] = {field: {} for field in self.indexes}
+        self._sorted: Dict[str, List[Tuple[Any, int]]] = {field: [] for field in self.sorted_fields}
+
+    def _index(self, record_id: int, record: Dict, sorted_fields: bool = True):
+        for field, buckets in self._eq.items():
+            bucket = buckets.setdefault(record.get(field), [])
+            if bucket and bucket[-1] > record_id:
+                insort(bucket, record_id)
+            else:
+                bucket.append(record_id)
+        if sorted_fields:
+            for field, pairs in self._sorted.items():
+                insort(pairs, (record.get(field), record_id))
+
+    # Add a block of records to the sorted fields: the block is sorted, each
+    # pair's position found by bisect and the existing runs between them copied
+    # as slices, instead of one insort (and memmove of the list tail) per record
+    def _index_sorted_block(self, record_ids: List[int], records: List[Dict]):
+        for field, pairs in self._sorted.items():
+            merged = []
+            start = 0
+            for pair in sorted(zip([record.get(field) for record in records], record_ids)):
+                position = bisect_right(pairs, pair, start)
+                merged.extend(pairs[start:position])
+                merged.append(pair)
+                start = position
+            merged.extend(pairs[start:])
+            self._sorted[field] = merged
+
+    def _unindex(self, record_id: int, record: Dict):
+        for field, buckets in self._eq.items():
+            value = record.get(field)
+            bucket = buckets.get(value)
+            if bucket is not None:
+                _discard(bucket, record_id)
+                if not bucket:
+                    del buckets[value]
+        for field, pairs in self._sorted.items():
+            _discard(pairs, (record.get(field), record_id))
+
+    async def create(self, record: Dict) -> int:
+        record_id = self._next_id
+        self._next_id += 1
+        self._records[record_id] = record
+        self._versions[record_id] = 1
+        self._ids.append(record_id)
+        self._index(record_id, record)
+        self._revision += 1
+        return record_id
+
+    async def create_many(self, records: List[Dict]) -> List[int]:
+        if not records:
+            return []
+        first_id = self._next_id
+        self._next_id += len(records)
+        record_ids = list(range(first_id, first_id + len(records)))
+        self._records.update(zip(record_ids, records))
+        self._versions.update(dict.fromkeys(record_ids, 1))
+        self._ids.extend(record_ids)
+        for record_id, record in zip(record_ids, records):
+            self._index(record_id, record, sorted_fields=False)
+        self._index_sorted_block(record_ids, records)
+        self._revision += 1
+        return record_ids
+
+    async def get(self, record_id: int) -> Optional[Dict]:
+        return self._records.get(record_id)
+
+    async def get_versioned(self, record_id: int) -> Optional[Tuple[int, Dict]]:
+        record = self._records.get(record_id)
+        if record is None:
+            return None
+        return self._versions[record_id], record
+
+    async def get_many(self, record_ids: Iterable[int]) -> Dict[int, Dict]:
+        records = self._records
+        return {record_id: records[record_id] for record_id in record_ids if record_id in records}
+
+    async def update(self, record_id: int, record: Dict) -> bool:
+        previous = self._records.get(record_id)
+        if previous is None:
+            return False
+        self._unindex(record_id, previous)
+        self._records[record_id] = record
+        self._versions[record_id] += 1
+        self._index(record_id, record)
+        self._revision += 1
+        return True
+
+    async def delete(self, record_id: int) -> bool:
+        previous = self._records.pop(record_id, None)
+        if previous is None:
+            return False
+        del self._versions[record_id]
+        _discard(self._ids, record_id)
+        self._unindex(record_id, previous)
+        self._revision += 1
+        return True
+
+    async def list_page(self, limit: int, after_id: Optional[int] = None,
+                        field: Optional[str] = None, value: Any = None) -> Page:
+        if field is None:
+            ids = self._ids
+        else:
+            self._check_index(field, self.indexes)
+            ids = self._eq[field].get(value, [])
+        start = bisect_right(ids, after_id) if after_id is not None else 0
+        records = self._records
+        return [(record_id, records[record_id]) for record_id in ids[start:start + limit]]
+
+    async def range_page(self, field: str, limit: int, low: Any = None, high: Any = None,
+                         after: Optional[Tuple[Any, int]] = None) -> Page:
+        self._check_index(field, self.sorted_fields)
+        pairs = self._sorted[field]
+        start = 0
+        if after is not None:
+            start = bisect_right(pairs, tuple(after))
+        if low is not None:
+            start = max(start, bisect_left(pairs, (low,)))
+        page = []
+        records = self._records
+        for value, record_id in pairs[start:start + limit]:
+            if high is not None and value > high:
+                break
+            page.append((record_id, records[record_id]))
+        return page
+
+    async def find_ids(self, field: str, value: Any) -> List[int]:
+        self._check_index(field, self.indexes)
+        return list(self._eq[field].get(value, []))
+
+    async def columns(self, fields: Sequence[str], chunk: int = 10_000) -> Dict[str, List[Any]]:
+        records = self._records
+        return {field: [records[record_id].get(field) for record_id in self._ids] for field in fields}
+
+    async def count(self) -> int:
+        return len(self._records)
+
+    async def revision(self) -> int:
+        return self._revision
+
+    async def clear(self):
+        self._revision += 1
+        self._records.clear()
+        self._versions.clear()
+        self._next_id = 1
+        self._ids.clear()
+        for buckets in self._eq.values():
+            buckets.clear()
+        for pairs in self._sorted.values():
+            pairs.clear()
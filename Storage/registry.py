@@ -0,0 +1,71 @@
+import os
+from typing import Dict, Optional
+
+from Storage.base import Repository
+from Storage.memory import MemoryRepository
+
+# "memory" keeps the per-process dict stores; "compact" keeps them in typed
+# column arrays (far less memory for large catalogs); "sqlite" shares one WAL
+# database file between all worker processes
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data.db")
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "4"))
+
+# Secondary indexes per store: equality indexes and (value, id) sorted indexes
+STORE_INDEXES = {
+    "products": {"indexes": (), "sorted_fields": ("price",)},
+    "customers": {"indexes": ("email",), "sorted_fields": ()},
+    "orders": {"indexes": ("customer_id", "product_id"), "sorted_fields": ()},
+}
+
+# Column types for the compact backend, matching the routers' pydantic models
+STORE_SCHEMAS = {
+    "products": {"name": "str", "price": "float", "description": "str"},
+    "customers": {"name": "str", "email": "str"},
+    "orders": {"customer_id": "int", "product_id": "int", "quantity": "int"},
+}
+
+repositories: Dict[str, Repository] = {}
+_database = None
+
+
+def _sqlite_database():
+    global _database
+    if _database is None:
+        from Storage.sqlite import SQLiteDatabase
+        _database = SQLiteDatabase(SQLITE_PATH, pool_size=SQLITE_POOL_SIZE)
+    return _database
+
+
+# Build a repository for the configured backend
+def create_repository(name: str, backend: Optional[str] = None) -> Repository:
+    backend = backend or STORAGE_BACKEND
+    options = STORE_INDEXES.get(name, {})
+    if backend == "memory":
+        return MemoryRepository(name, **options)
+    if backend == "compact":
+        from Storage.compact import CompactRepository
+        return CompactRepository(name, STORE_SCHEMAS[name], **options)
+    if backend == "sqlite":
+        from Storage.sqlite import SQLiteRepository
+        return SQLiteRepository(name, _sqlite_database(), **options)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+# Get the process-wide repository for a store, creating it on first use
+def get_repository(name: str) -> Repository:
+    repository = repositories.get(name)
+    if repository is None:
+        repository = create_repository(name)
+        repositories[name] = repository
+    return repository
+
+
+# Release backend resources (called from the app lifespan)
+async def close_repositories():
+    global _database
+    for repository in repositories.values():
+        await repository.close()
+    if _database is not None:
+        _database.close()
+        _database = None
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from Storage.base import Page, Repository
+
+T = TypeVar("T")
+
+
+def _dumps(record: Dict) -> str:
+    return json.dumps(record, separators=(",", ":"))
+
+
+# One SQLite database file in WAL mode, shared by every repository of a process.
+# Reads run on a bounded pool of reader connections; writes go through a single
+# writer connection on its own thread, so the event loop never blocks on disk
+# and writers inside one process never contend for the SQLite write lock.
+# Each connection keeps its compiled statements in the sqlite3 statement cache,
+# and the repositories only ever issue a fixed set of SQL strings.
+class SQLiteDatabase:
+    def __init__(self, path: str, pool_size: int = 4, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(pool_size):
+            self._readers.put(self._connect())
+        self._read_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="sqlite-reader")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        connection.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _with_reader(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        connection = self._readers.get()
+        try:
+            return fn(connection)
+        finally:
+            self._readers.put(connection)
+
+    def _in_transaction(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        connection = self._writer
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    async def read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._with_reader, fn)
+
+    async def write(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._in_transaction, fn)
+
+    # Schema changes run synchronously at startup, before any request is served
+    def execute_script(self, script: str):
+        self._write_executor.submit(self._writer.executescript, script).result()
+
+    def query_sync(self, sql: str) -> List[Tuple]:
+        return self._write_executor.submit(lambda: self._writer.execute(sql).fetchall()).result()
+
+    def close(self):
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        self._writer.close()
+
+
+# A table of JSON documents keyed by an AUTOINCREMENT id, so IDs are never
+# reused and stay unique across every worker process sharing the file.
+# The version column is bumped in the same UPDATE that replaces the data.
+# Equality and sorted indexes are SQLite expression indexes on
+# (json_extract(data, '$.field'), id), which serve both the filter and the
+# keyset ORDER BY. The store's write count lives in the revisions table and
+# is bumped in the same transaction as each write.
+class SQLiteRepository(Repository):
+    def __init__(self, name: str, db: SQLiteDatabase,
+                 indexes: Sequence[str] = (), sorted_fields: Sequence[str] = ()):
+        for identifier in (name, *indexes, *sorted_fields):
+            if not identifier.isidentifier():
+                raise ValueError(f"Invalid identifier: {identifier}")
+        super().__init__(name, indexes, sorted_fields)
+        self.db = db
+        schema = [
+            f"CREATE TABLE IF NOT EXISTS {name} ("
+            f"id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, "
+            f"version INTEGER NOT NULL DEFAULT 1);",
+            "CREATE TABLE IF NOT EXISTS revisions (name TEXT PRIMARY KEY, revision INTEGER NOT NULL);",
+            f"INSERT OR IGNORE INTO revisions (name, revision) VALUES ('{name}', 0);",
+        ]
+        for field in dict.fromkeys((*self.indexes, *self.sorted_fields)):
+            schema.append(
+                f"CREATE INDEX IF NOT EXISTS {name}_{field}_idx "
+                f"ON {name} (json_extract(data, '$.{field}'), id);"
+            )
+        db.execute_script("\n".join(schema))
+        # Files created before records were versioned lack the column
+        columns = db.query_sync(f"PRAGMA table_info({name})")
+        if "version" not in {column[1] for column in columns}:
+            db.execute_script(f"ALTER TABLE {name} ADD COLUMN version INTEGER NOT NULL DEFAULT 1;")
+        self._insert = f"INSERT INTO {name} (data) VALUES (?)"
+        self._insert_with_id = f"INSERT INTO {name} (id, data) VALUES (?, ?)"
+        self._select = f"SELECT data FROM {name} WHERE id = ?"
+        self._select_versioned = f"SELECT version, data FROM {name} WHERE id = ?"
+        self._select_many = f"SELECT id, data FROM {name} WHERE id IN (SELECT value FROM json_each(?))"
+        self._update = f"UPDATE {name} SET data = ?, version = version + 1 WHERE id = ?"
+        self._delete = f"DELETE FROM {name} WHERE id = ?"
+        self._count = f"SELECT COUNT(*) FROM {name}"
+        self._last_id = "SELECT seq FROM sqlite_sequence WHERE name = ?"
+        self._bump = "UPDATE revisions SET revision = revision + 1 WHERE name = ?"
+        self._select_revision = "SELECT revision FROM revisions WHERE name = ?"
+        self._page = f"SELECT id, data FROM {name} WHERE id > ? ORDER BY id LIMIT ?"
+        self._page_by = {
+            field: f"SELECT id, data FROM {name} WHERE json_extract(data, '$.{field}') = ? "
+                   f"AND id > ? ORDER BY id LIMIT ?"
+            for field in self.indexes
+        }
+        self._ids_by = {
+            field: f"SELECT id FROM {name} WHERE json_extract(data, '$.{field}') = ? ORDER BY id"
+            for field in self.indexes
+        }
+        self._range_by = {
+            field: f"SELECT id, data FROM {name} "
+                   f"WHERE (json_extract(data, '$.{field}'), id) > (?, ?) "
+                   f"AND json_extract(data, '$.{field}') >= ? "
+                   f"AND json_extract(data, '$.{field}') <= ? "
+                   f"ORDER BY json_extract(data, '$.{field}'), id LIMIT ?"
+            for field in self.sorted_fields
+        }
+
+    # Count a write that changed something in the store's revision
+    def _changed(self, c: sqlite3.Connection, changed: T) -> T:
+        if changed:
+            c.execute(self._bump, (self.name,))
+        return changed
+
+    async def create(self, record: Dict) -> int:
+        data = _dumps(record)
+        return await self.db.write(lambda c: self._changed(c, c.execute(self._insert, (data,)).lastrowid))
+
+    async def create_many(self, records: List[Dict]) -> List[int]:
+        rows = [_dumps(record) for record in records]
+
+        def insert(c: sqlite3.Connection) -> List[int]:
+            last = c.execute(self._last_id, (self.name,)).fetchone()
+            first_id = (last[0] if last else 0) + 1
+            record_ids = list(range(first_id, first_id + len(rows)))
+            c.executemany(self._insert_with_id, zip(record_ids, rows))
+            return self._changed(c, record_ids)
+
+        if not rows:
+            return []
+        return await self.db.write(insert)
+
+    async def get(self, record_id: int) -> Optional[Dict]:
+        row = await self.db.read(lambda c: c.execute(self._select, (record_id,)).fetchone())
+        return json.loads(row[0]) if row else None
+
+    async def get_versioned(self, record_id: int) -> Optional[Tuple[int, Dict]]:
+        row = await self.db.read(lambda c: c.execute(self._select_versioned, (record_id,)).fetchone())
+        return (row[0], json.loads(row[1])) if row else None
+
+    async def get_many(self, record_ids: Iterable[int]) -> Dict[int, Dict]:
+        ids = json.dumps(list(record_ids))
+        rows = await self.db.read(lambda c: c.execute(self._select_many, (ids,)).fetchall())
+        return {record_id: json.loads(data) for record_id, data in rows}
+
+    async def update(self, record_id: int, record: Dict) -> bool:
+        data = _dumps(record)
+        return await self.db.write(lambda c: self._changed(c, c.execute(self._update, (data, record_id)).rowcount > 0))
+
+    async def delete(self, record_id: int) -> bool:
+        return await self.db.write(lambda c: self._changed(c, c.execute(self._delete, (record_id,)).rowcount > 0))
+
+    async def list_page(self, limit: int, after_id: Optional[int] = None,
+                        field: Optional[str] = None, value: Any = None) -> Page:
+        after_id = after_id if after_id is not None else 0
+        if field is None:
+            sql, params = self._page, (after_id, limit)
+        else:
+            self._check_index(field, self.indexes)
+            sql, params = self._page_by[field], (value, after_id, limit)
+        rows = await self.db.read(lambda c: c.execute(sql, params).fetchall())
+        return [(record_id, json.loads(data)) for record_id, data in rows]
+
+    async def range_page(self, field: str, limit: int, low: Any = None, high: Any = None,
+                         after: Optional[Tuple[Any, int]] = None) -> Page:
+        self._check_index(field, self.sorted_fields)
+        # Open bounds become values that sort before/after every number
+        after_value, after_id = after if after is not None else (None, 0)
+        low = low if low is not None else float("-inf")
+        high = high if high is not None else float("inf")
+        if after_value is None:
+            after_value = float("-inf")
+        params = (after_value, after_id, low, high, limit)
+        rows = await self.db.read(lambda c: c.execute(self._range_by[field], params).fetchall())
+        return [(record_id, json.loads(data)) for record_id, data in rows]
+
+    async def find_ids(self, field: str, value: Any) -> List[int]:
+        self._check_index(field, self.indexes)
+        rows = await self.db.read(lambda c: c.execute(self._ids_by[field], (value,)).fetchall())
+        return [row[0] for row in rows]
+
+    async def count(self) -> int:
+        return await self.db.read(lambda c: c.execute(self._count).fetchone()[0])
+
+    async def revision(self) -> int:
+        return await self.db.read(lambda c: c.execute(self._select_revision, (self.name,)).fetchone()[0])
+
+    async def clear(self):
+        def wipe(c: sqlite3.Connection):
+            c.execute(f"DELETE FROM {self.name}")
+            c.execute("DELETE FROM sqlite_sequence WHERE name = ?", (self.name,))
+            c.execute(self._bump, (self.name,))
+
+        await self.db.write(wipe)
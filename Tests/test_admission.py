@@ -0,0 +1,55 @@
+import asyncio
+
+from Middleware import admission
+
+
+def test_rate_limiter_caps_the_map_and_drops_the_least_recently_seen_user():
+    limiter = admission.UserRateLimiter(rate=0.001, burst=2, max_users=3)
+    for user in ("a", "b", "c"):
+        assert limiter.acquire(user) == 0
+    # "a" is seen again, so "b" is now the least recently seen
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") > 0
+    for user in ("d", "e"):
+        assert limiter.acquire(user) == 0
+    assert len(limiter) == 3
+    # "a" kept its empty bucket; "b" was evicted and starts over
+    assert limiter.acquire("a") > 0
+    assert limiter.acquire("b") == 0
+    assert len(limiter) == 3
+
+
+def test_many_distinct_users_stay_within_the_cap():
+    limiter = admission.UserRateLimiter(rate=0.001, burst=5, max_users=100)
+    for index in range(10_000):
+        limiter.acquire(f"user-{index}")
+    assert len(limiter) == 100
+
+
+def test_lag_shedding_is_off_unless_configured(monkeypatch):
+    sent = []
+
+    async def app(scope, receive, send):
+        sent.append(scope["path"])
+
+    async def send(message):
+        sent.append(message.get("status"))
+
+    async def request(middleware):
+        await middleware({"type": "http", "path": "/orders/1"}, None, send)
+        admission.loop_monitor.stop()
+
+    middleware = admission.AdmissionMiddleware(app)
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(admission.loop_monitor, "lag", 1.0)
+    monkeypatch.setattr(admission.loop_monitor, "ensure_started", lambda: None)
+
+    monkeypatch.setattr(admission, "LOOP_LAG_SHED_MS", 0.0)
+    asyncio.run(request(middleware))
+    assert sent == ["/orders/1"]
+
+    sent.clear()
+    monkeypatch.setattr(admission.loop_monitor, "lag", 1.0)
+    monkeypatch.setattr(admission, "LOOP_LAG_SHED_MS", 50.0)
+    asyncio.run(request(middleware))
+    assert sent[0] == 503
@@ -0,0 +1,110 @@
+import asyncio
+
+from Services.analytics import OrderAggregates, scan
+from Routers import orders as order_routes
+from Storage.registry import STORE_INDEXES
+from Storage.sqlite import SQLiteDatabase, SQLiteRepository
+
+
+# Two workers sharing one SQLite file: the aggregates of one must notice the
+# orders the other writes, without any hook having seen them
+def test_aggregates_rebuild_after_another_workers_writes(tmp_path):
+    path = str(tmp_path / "orders.db")
+    databases = [SQLiteDatabase(path, pool_size=1) for _ in range(2)]
+    mine, theirs = (SQLiteRepository("orders", db, **STORE_INDEXES["orders"]) for db in databases)
+    aggregates = OrderAggregates()
+
+    async def run():
+        order = {"customer_id": 1, "product_id": 7, "quantity": 2}
+        await aggregates.ensure_ready(mine)
+        aggregates.order_added(order)
+        await mine.create(order)
+        await aggregates.ensure_ready(mine)
+        assert aggregates.by_product == {7: [2, 1]}
+        revision = aggregates.revision
+
+        order_id = await theirs.create({"customer_id": 2, "product_id": 7, "quantity": 3})
+        await theirs.update(order_id, {"customer_id": 2, "product_id": 8, "quantity": 5})
+        await aggregates.ensure_ready(mine)
+        assert aggregates.revision == revision + 2
+        assert (aggregates.by_product, aggregates.by_customer) == await scan(mine)
+        assert aggregates.by_product == {7: [2, 1], 8: [5, 1]}
+
+    try:
+        asyncio.run(run())
+    finally:
+        for db in databases:
+            db.close()
+
+
+# Concurrent PUT /orders/{id} against SQLite, whose reads and writes yield to
+# the loop: each delta comes from the version the update replaced, so the
+# totals end where a full scan says
+def test_concurrent_order_updates_keep_aggregates_exact(tmp_path, monkeypatch):
+    db = SQLiteDatabase(str(tmp_path / "orders.db"), pool_size=4)
+    orders = SQLiteRepository("orders", db, **STORE_INDEXES["orders"])
+    aggregates = OrderAggregates()
+    monkeypatch.setattr(order_routes, "orders", orders)
+    monkeypatch.setattr(order_routes, "order_aggregates", aggregates)
+    admin = {"username": "admin_user", "role": "admin"}
+
+    async def run():
+        order_id = await orders.create({"customer_id": 1, "product_id": 1, "quantity": 1})
+        await aggregates.ensure_ready(orders)
+        await asyncio.gather(*(
+            order_routes.update_order(order_id, order_routes.Order(customer_id=n % 3, product_id=n % 5, quantity=n),
+                                      current_user=admin)
+            for n in range(1, 41)
+        ))
+        assert aggregates.revision == await orders.revision()
+        assert (aggregates.by_product, aggregates.by_customer) == await scan(orders)
+
+    try:
+        asyncio.run(run())
+    finally:
+        db.close()
+
+
+
+# A store whose scans start late and whose creates are acknowledged late, so
+# a rebuild reads the revision before a create commits and scans after it
+class SlowOrders(SQLiteRepository):
+    async def create(self, record):
+        await asyncio.sleep(0.005)
+        order_id = await super().create(record)
+        await asyncio.sleep(0.05)
+        return order_id
+
+    async def columns(self, fields):
+        await asyncio.sleep(0.02)
+        return await super().columns(fields)
+
+
+# POST /orders racing with a rebuild: the rebuild's scan already holds the new
+# order, so the create's hook must not add it a second time
+def test_create_during_rebuild_is_counted_once(tmp_path, monkeypatch):
+    db = SQLiteDatabase(str(tmp_path / "orders.db"), pool_size=4)
+    orders = SlowOrders("orders", db, **STORE_INDEXES["orders"])
+    aggregates = OrderAggregates()
+    monkeypatch.setattr(order_routes, "orders", orders)
+    monkeypatch.setattr(order_routes, "order_aggregates", aggregates)
+
+    async def refs_exist(customer_id: int, product_id: int):
+        return True, True
+
+    monkeypatch.setattr(order_routes.upstream, "validate_order_refs", refs_exist)
+    customer = {"username": "regular_user", "role": "customer"}
+
+    async def run():
+        await asyncio.gather(
+            aggregates.ensure_ready(orders),
+            order_routes.create_order(order_routes.Order(customer_id=1, product_id=7, quantity=2),
+                                      current_user=customer),
+        )
+        await aggregates.ensure_ready(orders)
+        assert aggregates.by_product == {7: [2, 1]}
+
+    try:
+        asyncio.run(run())
+    finally:
+        db.close()
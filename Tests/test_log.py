@@ -0,0 +1,28 @@
+import io
+import logging
+import queue
+
+from Middleware import log, metrics
+
+
+def record(level: int, event: str) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 1, event, None, None)
+
+
+# With the queue full (no writer thread draining it), INFO records are
+# dropped and counted while warnings are written through the fallback
+def test_full_queue_drops_info_but_writes_warnings_inline(monkeypatch):
+    stream = io.StringIO()
+    writer = logging.StreamHandler(stream)
+    writer.setFormatter(log.KeyValueFormatter())
+    handler = log.DeferredQueueHandler(queue.Queue(1), fallback=writer)
+    monkeypatch.setattr(log, "_queue_handler", handler)
+
+    handler.handle(record(logging.INFO, "queued"))
+    handler.handle(record(logging.INFO, "dropped"))
+    handler.handle(record(logging.ERROR, "upstream_unavailable"))
+
+    assert handler.queue.get_nowait().getMessage() == "queued"
+    assert handler.dropped == 1
+    assert "level=ERROR logger=test event=upstream_unavailable" in stream.getvalue()
+    assert "log_records_dropped_total 1" in metrics.render().splitlines()
@@ -0,0 +1,85 @@
+import asyncio
+import gc
+import threading
+
+import httpx
+import pytest
+
+from Benchmarks.common import auth_headers
+from Benchmarks.login_isolation import measure_reads, scenario
+from Middleware import passwords
+from Routers import orders
+from main import app
+
+LOGIN = {"username": "admin_user", "password": "admin_password"}
+
+
+# Each test starts its own password pool and stops it at the end
+@pytest.fixture(autouse=True)
+def pool():
+    passwords.shutdown_pool()
+    yield
+    passwords.shutdown_pool()
+
+
+def api_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", timeout=60)
+
+
+# bcrypt runs on the pool, so a burst of logins may only add a little to
+# the read tail; verified inline it blocks the loop for ~0.25 s per login
+def test_get_order_p99_with_parallel_logins():
+    async def run():
+        await orders.orders.create({"customer_id": 1, "product_id": 1, "quantity": 1})
+        headers = auth_headers()
+        async with api_client() as http:
+            await measure_reads(http, headers, 50)
+            idle = await scenario(http, headers, 200, 0)
+            loaded = await scenario(http, headers, 200, 8)
+        return idle, loaded
+
+    # A full collection over everything the earlier tests imported takes
+    # ~100 ms on a slow machine; do it now rather than mid-measurement
+    gc.collect()
+    idle, loaded = asyncio.run(run())
+    assert loaded["login_statuses"].get(200, 0) > 0
+    assert loaded["get_order"]["p99_ms"] <= idle["get_order"]["p99_ms"] + 100, (idle, loaded)
+
+
+# Every worker busy and no queue: the next login is refused at once. A login
+# whose client gave up keeps its slot until the pool finishes the job.
+def test_token_returns_503_when_pool_and_queue_are_full(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_POOL_SIZE", 1)
+    monkeypatch.setattr(passwords, "PASSWORD_QUEUE_LIMIT", 0)
+    release = threading.Event()
+    real_verify = passwords._verify
+
+    def blocked_verify(plain_password: str, hashed_password: str) -> bool:
+        release.wait(10)
+        return real_verify(plain_password, hashed_password)
+
+    monkeypatch.setattr(passwords, "_verify", blocked_verify)
+
+    async def run():
+        async with api_client() as http:
+            first = asyncio.ensure_future(http.post("/token", data=LOGIN))
+            while passwords._pending < 1:
+                await asyncio.sleep(0.01)
+
+            refused = await http.post("/token", data=LOGIN)
+            assert refused.status_code == 503
+            assert refused.headers["Retry-After"] == "1"
+
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            assert passwords._pending == 1
+            assert (await http.post("/token", data=LOGIN)).status_code == 503
+
+            release.set()
+            while passwords._pending:
+                await asyncio.sleep(0.01)
+            accepted = await http.post("/token", data=LOGIN)
+            assert accepted.status_code == 200
+
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+from Middleware import metrics
+
+IN_FLIGHT = (("method", "GET"), ("route", "/test/metrics"))
+
+
+def test_counters_are_exported_with_total_suffix():
+    metrics.counter_add("test_rejected", (("reason", "queue_full"),))
+    metrics.counter_names.add("test_collected_hits")
+    metrics.collectors.append(lambda: {"test_collected_hits": {(): 4}, "test_collected_size": {(): 2}})
+    metrics.help_texts["test_rejected"] = "Rejected test requests."
+    try:
+        lines = metrics.render().splitlines()
+    finally:
+        metrics.collectors.pop()
+        metrics.counter_names.discard("test_collected_hits")
+        metrics.counters.pop("test_rejected", None)
+        metrics.help_texts.pop("test_rejected")
+    assert "# HELP test_rejected_total Rejected test requests." in lines
+    assert "# TYPE test_rejected_total counter" in lines
+    assert 'test_rejected_total{reason="queue_full"} 1' in lines
+    assert "# TYPE test_collected_hits_total counter" in lines
+    assert "test_collected_hits_total 4" in lines
+    assert "# TYPE test_collected_size gauge" in lines
+    assert "test_collected_size 2" in lines
+
+
+def test_reset_keeps_in_flight_requests():
+    in_flight = metrics.gauges.setdefault("http_requests_in_flight", {})
+    in_flight[IN_FLIGHT] = 2
+    metrics.counter_add("test_rejected", ())
+    metrics.observe("test_duration_seconds", (), 0.01)
+    try:
+        metrics.reset()
+        assert in_flight[IN_FLIGHT] == 2
+        assert "test_rejected" not in metrics.counters
+        assert "test_duration_seconds" not in metrics.histograms
+    finally:
+        del in_flight[IN_FLIGHT]
@@ -0,0 +1,201 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from Benchmarks.common import StubFaults, build_stub_app
+from Middleware import resilience, upstream
+from Middleware.validation_cache import validation_cache
+
+
+# Fresh policies built from small, fast settings for every test
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(resilience, "RESILIENCE_ENABLED", True)
+    monkeypatch.setattr(resilience, "UPSTREAM_DEADLINE", 2.0)
+    monkeypatch.setattr(resilience, "UPSTREAM_RETRIES", 0)
+    monkeypatch.setattr(resilience, "UPSTREAM_RETRY_BACKOFF_MS", 1)
+    monkeypatch.setattr(resilience, "UPSTREAM_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(resilience, "UPSTREAM_BREAKER_RESET", 0.05)
+    monkeypatch.setattr(resilience, "UPSTREAM_HEDGE", False)
+    resilience.policies.clear()
+    yield
+    resilience.policies.clear()
+
+
+# An in-process client for an ASGI stub, and the `send` resilience.call takes
+def stub_sender(app: FastAPI, path: str = "/products/1"):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stub")
+
+    async def send():
+        return await client.get(path)
+
+    return send
+
+
+def test_breaker_opens_half_opens_and_closes():
+    faults = StubFaults(error_ratio=1.0)
+    send = stub_sender(build_stub_app("products", [1], faults=faults))
+    breaker = resilience.get_policy("products").breaker
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(resilience.UpstreamUnavailable):
+                await resilience.call("products", send)
+        assert breaker.state == resilience.OPEN
+
+        # Open: failed fast without reaching the service
+        with pytest.raises(resilience.UpstreamUnavailable, match="circuit open"):
+            await resilience.call("products", send)
+        assert faults.requests == 2
+
+        # After the reset period one probe goes through and closes the breaker
+        await asyncio.sleep(0.06)
+        faults.error_ratio = 0.0
+        response = await resilience.call("products", send)
+        assert response.status_code == 200
+        assert breaker.state == resilience.CLOSED
+        assert faults.requests == 3
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_reopens_breaker():
+    faults = StubFaults(error_ratio=1.0)
+    send = stub_sender(build_stub_app("products", [1], faults=faults))
+    breaker = resilience.get_policy("products").breaker
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(resilience.UpstreamUnavailable):
+                await resilience.call("products", send)
+        await asyncio.sleep(0.06)
+        with pytest.raises(resilience.UpstreamUnavailable, match="status 503"):
+            await resilience.call("products", send)
+        assert breaker.state == resilience.OPEN
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_releases_half_open_slot():
+    faults = StubFaults(error_ratio=1.0)
+    send = stub_sender(build_stub_app("products", [1], faults=faults))
+    breaker = resilience.get_policy("products").breaker
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(resilience.UpstreamUnavailable):
+                await resilience.call("products", send)
+        await asyncio.sleep(0.06)
+
+        # The probe hangs and its caller gives up on it
+        faults.error_ratio = 0.0
+        faults.delay = 5.0
+        probe = asyncio.ensure_future(resilience.call("products", send))
+        await asyncio.sleep(0.05)
+        assert breaker.state == resilience.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # The next call is let through as the probe instead of being refused
+        faults.delay = 0.0
+        response = await resilience.call("products", send)
+        assert response.status_code == 200
+        assert breaker.state == resilience.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_unexpected_error_in_probe_releases_half_open_slot():
+    breaker = resilience.get_policy("products").breaker
+    breaker.state = resilience.OPEN
+    breaker.opened_at = 0.0
+
+    async def broken():
+        raise ValueError("bad response")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await resilience.call("products", broken)
+        assert breaker.allow()
+
+    asyncio.run(scenario())
+
+
+def test_retries_stop_when_budget_is_spent(monkeypatch):
+    monkeypatch.setattr(resilience, "UPSTREAM_RETRIES", 2)
+    monkeypatch.setattr(resilience, "UPSTREAM_BREAKER_FAILURES", 100)
+    faults = StubFaults(error_ratio=1.0)
+    send = stub_sender(build_stub_app("products", [1], faults=faults))
+    policy = resilience.get_policy("products")
+    policy.retry_budget = resilience.RetryBudget(0.0, 0.0, cap=1.0)
+
+    async def scenario():
+        # The one token in the bucket pays for a single retry
+        with pytest.raises(resilience.UpstreamUnavailable):
+            await resilience.call("products", send)
+        assert faults.requests == 2
+        assert (policy.retries, policy.retries_denied) == (1, 1)
+
+        # With the bucket empty the call makes only its first attempt
+        with pytest.raises(resilience.UpstreamUnavailable):
+            await resilience.call("products", send)
+        assert faults.requests == 3
+        assert (policy.retries, policy.retries_denied) == (1, 2)
+
+    asyncio.run(scenario())
+
+
+def test_hedge_answers_first_and_slow_attempt_is_cancelled(monkeypatch):
+    monkeypatch.setattr(resilience, "UPSTREAM_HEDGE", True)
+    monkeypatch.setattr(resilience, "UPSTREAM_HEDGE_MIN_SAMPLES", 1)
+    app = FastAPI()
+    attempts = {"started": 0, "cancelled": 0}
+
+    # The first attempt stalls, the hedge answers at once
+    @app.get("/products/{product_id}")
+    async def get_product(product_id: int):
+        attempts["started"] += 1
+        if attempts["started"] == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                attempts["cancelled"] += 1
+                raise
+        return {"id": product_id}
+
+    send = stub_sender(app)
+    policy = resilience.get_policy("products")
+    policy.latency.add(0.01, resilience.UPSTREAM_HEDGE_QUANTILE)
+    policy.latency.quantile_value = 0.01
+
+    async def scenario():
+        response = await resilience.call("products", send)
+        await asyncio.sleep(0)
+        assert response.status_code == 200
+        assert (policy.hedges, policy.hedge_wins) == (1, 1)
+        assert attempts == {"started": 2, "cancelled": 1}
+        assert policy.breaker.state == resilience.CLOSED
+
+    asyncio.run(scenario())
+
+
+# A status that is neither 200 nor 404 says nothing about the customer, so
+# the order check reports the service unavailable instead of "not found"
+def test_single_lookup_with_unexpected_status_is_unavailable(monkeypatch):
+    refusing = FastAPI()
+
+    @refusing.get("/customers/{customer_id}")
+    async def get_customer(customer_id: int):
+        raise HTTPException(status_code=403, detail="Not enough privileges")
+
+    for service, app in (("customers", refusing), ("products", build_stub_app("products", [1]))):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stub")
+        monkeypatch.setitem(upstream.clients, service, client)
+    monkeypatch.setattr(upstream, "DEPLOYMENT_MODE", "distributed")
+    validation_cache.clear()
+
+    with pytest.raises(resilience.UpstreamUnavailable, match="customers unavailable: status 403"):
+        asyncio.run(upstream.validate_order_refs(1, 1))
@@ -0,0 +1,74 @@
+import asyncio
+
+from Services.search import ProductSearchIndex
+from Routers import products as product_routes
+from Storage.registry import STORE_INDEXES
+from Storage.sqlite import SQLiteDatabase, SQLiteRepository
+
+ADMIN = {"username": "admin_user", "role": "admin"}
+
+
+def product(name: str, description: str = "plain"):
+    return {"name": name, "price": 10.0, "description": description}
+
+
+def found(index: ProductSearchIndex, query: str):
+    return sorted(product_id for product_id, _ in index.search(query, 100))
+
+
+# A second worker sharing the SQLite file changes the catalog: the next
+# search in this worker sees its creates, updates and deletes
+def test_index_rebuilds_after_another_workers_writes(tmp_path):
+    path = str(tmp_path / "products.db")
+    databases = [SQLiteDatabase(path, pool_size=1) for _ in range(2)]
+    mine, theirs = (SQLiteRepository("products", db, **STORE_INDEXES["products"]) for db in databases)
+    index = ProductSearchIndex()
+
+    async def run():
+        first = await mine.create(product("walnut desk"))
+        await index.ensure_ready(mine)
+        assert found(index, "walnut") == [first]
+
+        second = await theirs.create(product("walnut shelf"))
+        await theirs.update(first, product("oak desk"))
+        await index.ensure_ready(mine)
+        assert found(index, "walnut") == [second]
+        assert found(index, "oak") == [first]
+
+        await theirs.delete(second)
+        await index.ensure_ready(mine)
+        assert found(index, "walnut") == []
+
+    try:
+        asyncio.run(run())
+    finally:
+        for db in databases:
+            db.close()
+
+
+# Concurrent PUT /products/{id} against SQLite: the words taken out of the
+# index are always those of the version the update replaced
+def test_concurrent_product_updates_keep_index_exact(tmp_path, monkeypatch):
+    db = SQLiteDatabase(str(tmp_path / "products.db"), pool_size=4)
+    products = SQLiteRepository("products", db, **STORE_INDEXES["products"])
+    index = ProductSearchIndex()
+    monkeypatch.setattr(product_routes, "products", products)
+    monkeypatch.setattr(product_routes, "search_index", index)
+
+    async def run():
+        product_id = await products.create(product("lamp", "word0"))
+        await index.ensure_ready(products)
+        await asyncio.gather(*(
+            product_routes.update_product(product_id, product_routes.Product(**product("lamp", f"word{n}")),
+                                          current_user=ADMIN)
+            for n in range(1, 21)
+        ))
+        assert await index.current(products)
+        last = (await products.get(product_id))["description"]
+        assert [term for term in index.postings if term.startswith("word")] == [last]
+        assert index.documents == 1
+
+    try:
+        asyncio.run(run())
+    finally:
+        db.close()
@@ -0,0 +1,3 @@
+# pytest loads this file from the repository root, which puts the root on
+# sys.path so the tests under Tests/ import Middleware, Routers and Storage
+# the same way the services and benchmarks do
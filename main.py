@@ -1,13 +1,74 @@
-
-
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from Routers import products
 from Routers import orders
 from Routers import customers
 from Middleware import authentication
-app = FastAPI()
+from Middleware import admission
+from Middleware import metrics
+from Middleware import upstream
+from Middleware import profiling
+from Middleware.validation_cache import validation_cache
+from Middleware.log import setup_logging
+from Middleware.passwords import shutdown_pool
+from Services import events
+from Services.read_model import read_model
+from Storage.registry import close_repositories
+
+# DEPLOYMENT_MODE=combined (the default) serves every service from this app and
+# orders are validated against the customer and product stores directly.
+# With DEPLOYMENT_MODE=distributed, SERVICES picks the services this process
+# serves (e.g. SERVICES=orders) and the others are reached over HTTP.
+SERVICES = os.getenv("SERVICES", "products,customers,orders")
+
+service_routers = {
+    "products": products.router,
+    "customers": customers.router,
+    "orders": orders.router,
+}
+if upstream.DEPLOYMENT_MODE == "combined":
+    served = list(service_routers)
+else:
+    served = [service.strip() for service in SERVICES.split(",") if service.strip()]
+    unknown = [service for service in served if service not in service_routers]
+    if unknown:
+        raise ValueError(f"Unknown services in SERVICES: {unknown}")
+
+# Open the pooled upstream clients, point the validation cache at the change
+# events and load the customer/product read model on startup, and start the
+# loop stall watchdog when LOOP_STALL_MS is set; close them on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream.start_clients()
+    if "orders" in served:
+        validation_cache.subscribe(events.bus)
+        await read_model.start(events.bus, upstream.fetch_snapshot)
+    if profiling.LOOP_STALL_MS > 0:
+        profiling.watchdog.start()
+    yield
+    profiling.watchdog.stop()
+    validation_cache.unsubscribe(events.bus)
+    await read_model.stop()
+    admission.loop_monitor.stop()
+    await upstream.close_clients()
+    await close_repositories()
+    shutdown_pool()
+
+# Structured, queued and sampled logging (see Middleware/log.py)
+setup_logging()
+
+app = FastAPI(lifespan=lifespan)
+# Added first so it runs inside the metrics middleware and shed requests are still timed
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+# Outermost, so a profile covers the whole request; only installed with PROFILING_ENABLED=1
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
 
+app.include_router(metrics.router)
 app.include_router(authentication.router)
-app.include_router(products.router)
-app.include_router(orders.router)
-app.include_router(customers.router)
+if profiling.PROFILING_ENABLED:
+    app.include_router(profiling.router)
+for service in served:
+    app.include_router(service_routers[service])
@@ -0,0 +1,236 @@
+import argparse
+import importlib.util
+import logging
+import os
+import signal
+import socket
+import ssl
+import sys
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from Middleware.log import log_event, setup_logging
+from Storage.registry import STORAGE_BACKEND
+
+logger = logging.getLogger("serve")
+
+# Production launcher: python serve.py [main:app | Models.product_service:app ...]
+# Flags override these settings.
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+# Worker processes; 0 means one per CPU
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "1"))
+# Pending connections the kernel queues before refusing new ones (capped by net.core.somaxconn)
+SERVE_BACKLOG = int(os.getenv("SERVE_BACKLOG", "4096"))
+# Seconds an idle keep-alive connection stays open; longer than the usual
+# 60 s load balancer idle timeout, so the balancer closes first and never
+# reuses a connection the server is closing
+SERVE_KEEP_ALIVE = int(os.getenv("SERVE_KEEP_ALIVE", "75"))
+# Seconds a stopping worker waits for in-flight requests before cancelling them
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+# Restart a worker after this many requests (0 never), spread by 10% so workers do not restart together
+SERVE_MAX_REQUESTS = int(os.getenv("SERVE_MAX_REQUESTS", "0"))
+# uvicorn's per-request access log; requests are already logged (sampled) by Middleware/log.py
+SERVE_ACCESS_LOG = os.getenv("SERVE_ACCESS_LOG", "0") == "1"
+# HTTPS with the certificate and key in certs/
+SERVE_TLS = os.getenv("SERVE_TLS", "0") == "1"
+SERVE_TLS_CERT = os.getenv("SERVE_TLS_CERT", "certs/certificate.crt")
+SERVE_TLS_KEY = os.getenv("SERVE_TLS_KEY", "certs/private.key")
+# TLS 1.3 session tickets sent after each full handshake
+SERVE_TLS_TICKETS = int(os.getenv("SERVE_TLS_TICKETS", "2"))
+
+# A worker that dies sooner than this after starting is restarted after a pause
+RESPAWN_MIN_UPTIME = 1.0
+
+
+# Lifecycle events are rare, so unlike log_event's INFO events they are never sampled out
+def announce(event: str, **fields):
+    logger.info(event, extra={"fields": fields})
+
+
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+# uvloop and httptools when installed, the pure-Python defaults otherwise
+def event_loop() -> str:
+    return "uvloop" if installed("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if installed("httptools") else "h11"
+
+
+# Server TLS context. Session resumption uses stateless tickets (TLS 1.2 and
+# 1.3). The context is created before the workers fork, so they share its
+# ticket keys and a ticket from one worker resumes on any other.
+def tls_context(certfile: str, keyfile: str) -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(["http/1.1"])
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = SERVE_TLS_TICKETS
+    return context
+
+
+# Apps whose data lives in Storage, which workers share with STORAGE_BACKEND=sqlite.
+# The standalone Models.*_service apps keep theirs in module-level dicts.
+SHARED_STORE_APPS = ("main:app",)
+
+
+# More than one worker process. Settings that would make workers give
+# different answers stop the launch: each worker needs to see the same data,
+# and change events must reach every worker. The rest is state each worker
+# keeps for itself, which works but differs from a single process, so it is
+# logged once at startup.
+def check_workers(app: str):
+    if app not in SHARED_STORE_APPS:
+        sys.exit(f"{app} keeps its data in each worker process; run it with --workers 1")
+    if os.environ.setdefault("EVENT_BUS", "file") != "file":
+        sys.exit(f"EVENT_BUS={os.environ['EVENT_BUS']} does not reach other workers; use EVENT_BUS=file")
+    if STORAGE_BACKEND in ("memory", "compact"):
+        sys.exit(f"STORAGE_BACKEND={STORAGE_BACKEND} keeps a separate store in each worker; "
+                 f"use STORAGE_BACKEND=sqlite or --workers 1")
+
+
+def warn_per_worker_state(workers: int):
+    log_event(logger, logging.WARNING, "per_worker_indexes", workers=workers,
+              hint="order analytics and product search are rebuilt from the store in a worker after another worker writes")
+    log_event(logger, logging.WARNING, "per_worker_limits", workers=workers,
+              hint="USER_RATE_LIMIT, route concurrency caps, PASSWORD_POOL_SIZE, retry budgets and circuit breakers "
+                   "apply to each worker separately")
+    log_event(logger, logging.WARNING, "per_worker_metrics", workers=workers,
+              hint="/metrics and /debug report only the worker that answers the request")
+
+
+def build_config(args: argparse.Namespace, context: Optional[ssl.SSLContext]) -> uvicorn.Config:
+    return uvicorn.Config(
+        args.app,
+        host=args.host,
+        port=args.port,
+        loop=event_loop(),
+        http=http_protocol(),
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        limit_max_requests_jitter=args.max_requests // 10,
+        access_log=args.access_log,
+        ssl_context_factory=(lambda config, default: context) if context is not None else None,
+    )
+
+
+# Pre-forking supervisor. The parent binds the socket (and builds the TLS
+# context), then forks the workers, which accept on the shared socket. Each
+# worker imports the app itself, after the fork. SIGTERM or SIGINT is passed
+# to the workers, which stop accepting, finish their in-flight requests
+# (for up to the graceful timeout) and run the lifespan shutdown. Workers
+# still running a few seconds later are killed. A worker that exits on its
+# own, e.g. after SERVE_MAX_REQUESTS, is replaced.
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self, sock: socket.socket):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+            signal.signal(signum, signal.SIG_DFL)
+        code = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=[sock])
+        except BaseException:
+            log_event(logger, logging.ERROR, "worker_failed", pid=os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            self.stopping = True
+            announce("stopping", workers=len(self.children), signal=signal.Signals(signum).name)
+            signal.alarm(self.config.timeout_graceful_shutdown + 5)
+        for pid in self.children:
+            self._signal(pid, signal.SIGTERM)
+
+    def kill(self, signum, frame):
+        for pid in self.children:
+            log_event(logger, logging.WARNING, "worker_killed", pid=pid)
+            self._signal(pid, signal.SIGKILL)
+
+    @staticmethod
+    def _signal(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def run(self):
+        sock = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGALRM, self.kill)
+        for _ in range(self.workers):
+            self.spawn(sock)
+        while self.children:
+            pid, status = os.waitpid(-1, 0)
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            uptime = time.monotonic() - started
+            log_event(logger, logging.WARNING, "worker_exited", pid=pid, status=os.waitstatus_to_exitcode(status),
+                      uptime=round(uptime, 1))
+            if uptime < RESPAWN_MIN_UPTIME:
+                time.sleep(RESPAWN_MIN_UPTIME)
+            self.spawn(sock)
+        signal.alarm(0)
+        sock.close()
+        announce("stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an app with uvloop/httptools, worker processes and optional TLS")
+    parser.add_argument("app", nargs="?", default="main:app", help="import string, e.g. Models.product_service:app")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="0: one per CPU (main:app on sqlite only)")
+    parser.add_argument("--backlog", type=int, default=SERVE_BACKLOG)
+    parser.add_argument("--keep-alive", type=int, default=SERVE_KEEP_ALIVE, help="idle keep-alive timeout, seconds")
+    parser.add_argument("--graceful-timeout", type=int, default=SERVE_GRACEFUL_TIMEOUT)
+    parser.add_argument("--max-requests", type=int, default=SERVE_MAX_REQUESTS)
+    parser.add_argument("--access-log", action="store_true", default=SERVE_ACCESS_LOG)
+    parser.add_argument("--tls", action="store_true", default=SERVE_TLS)
+    parser.add_argument("--certfile", default=SERVE_TLS_CERT)
+    parser.add_argument("--keyfile", default=SERVE_TLS_KEY)
+    args = parser.parse_args()
+
+    # No writer thread in the parent: threads do not survive fork
+    setup_logging(use_queue=False)
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1:
+        check_workers(args.app)
+    context = tls_context(args.certfile, args.keyfile) if args.tls else None
+    config = build_config(args, context)
+    announce("starting", app=args.app, workers=workers, loop=config.loop, http=config.http,
+             tls=context is not None, address=f"{args.host}:{args.port}")
+    if workers > 1:
+        warn_per_worker_state(workers)
+
+    if workers == 1:
+        uvicorn.Server(config).run()
+    elif hasattr(os, "fork"):
+        Supervisor(config, workers).run()
+    else:
+        sys.exit("More than one worker needs os.fork")
+
+
+if __name__ == "__main__":
+    main()